@@ -0,0 +1,211 @@
+"""Circulation analytics over incrementally maintained rollup tables.
+
+refresh() reads loans added since the last run (by borrowing id) and returns
+recorded since the last run (by returned_ts, id) in columnar chunks,
+aggregates each chunk with pandas and adds the result to ``loan_daily`` and
+``resource_loans``. report() then only reads those small tables, so its cost
+does not depend on the size of the loan table. The app only calls report();
+refresh() runs here, as a worker process or a scheduled job:
+
+    python analytics.py run [--interval 900] [--once] [--db elibrary.db]
+    python analytics.py refresh
+    python analytics.py report [--days 90]
+"""
+import argparse
+import time
+
+import pandas as pd
+
+import db
+import migrations
+
+CHUNK_SIZE = 100_000
+# Returns are read only once they are this old, so a return committed just
+# after a refresh can never fall behind the (returned_ts, id) watermark
+SETTLE_SECONDS = 60
+TOP_RESOURCES = 10
+INTERVAL = 900
+
+_UPSERT_DAILY = """INSERT INTO loan_daily (day, resource_type, loans, returns, late_returns, loan_seconds)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (day, resource_type) DO UPDATE SET
+                       loans = loan_daily.loans + excluded.loans,
+                       returns = loan_daily.returns + excluded.returns,
+                       late_returns = loan_daily.late_returns + excluded.late_returns,
+                       loan_seconds = loan_daily.loan_seconds + excluded.loan_seconds"""
+
+
+def _frame(c, sql, params=()):
+    """Query result as a DataFrame; pandas only reads SQLite connections directly, so go through the cursor"""
+    c.execute(sql, params)
+    return pd.DataFrame(c.fetchall(), columns=[column[0] for column in c.description])
+
+
+def _day(ts):
+    """Local calendar day, as days since 1970-01-01, of Unix times (a number or a Series)"""
+    return (ts + time.localtime().tm_gmtoff) // 86400
+
+
+def _refresh_loans(chunk_size):
+    total = 0
+    while True:
+        # Each chunk and its watermark commit together, so an interrupted refresh resumes cleanly
+        with db.transaction(immediate=True) as c:
+            c.execute("SELECT last_borrowing_id FROM analytics_state WHERE id=1")
+            last_id = c.fetchone()[0]
+            df = _frame(c, """SELECT b.id, b.resource_id, b.borrowed_ts, r.resource_type
+                              FROM borrowings b JOIN resources r ON r.id = b.resource_id
+                              WHERE b.id > ? ORDER BY b.id LIMIT ?""",
+                        (last_id, chunk_size))
+            if df.empty:
+                return total
+            df["day"] = _day(df["borrowed_ts"])
+            daily = df.groupby(["day", "resource_type"]).size()
+            c.executemany(_UPSERT_DAILY, [(int(day), resource_type, int(n), 0, 0, 0)
+                                          for (day, resource_type), n in daily.items()])
+            per_resource = df.groupby("resource_id").size()
+            c.executemany("""INSERT INTO resource_loans (resource_id, loans) VALUES (?, ?)
+                             ON CONFLICT (resource_id) DO UPDATE SET loans = resource_loans.loans + excluded.loans""",
+                          [(int(resource_id), int(n)) for resource_id, n in per_resource.items()])
+            c.execute("UPDATE analytics_state SET last_borrowing_id=? WHERE id=1", (int(df["id"].iloc[-1]),))
+        total += len(df)
+        if len(df) < chunk_size:
+            return total
+
+
+def _refresh_returns(chunk_size, now):
+    total = 0
+    while True:
+        with db.transaction(immediate=True) as c:
+            c.execute("SELECT last_returned_ts, last_returned_id FROM analytics_state WHERE id=1")
+            last_ts, last_id = c.fetchone()
+            df = _frame(c, """SELECT b.id, b.borrowed_ts, b.due_ts, b.returned_ts, r.resource_type
+                              FROM borrowings b JOIN resources r ON r.id = b.resource_id
+                              WHERE b.returned_ts IS NOT NULL
+                                AND b.returned_ts >= ? AND b.returned_ts < ?
+                                AND (b.returned_ts > ? OR b.id > ?)
+                              ORDER BY b.returned_ts, b.id LIMIT ?""",
+                        (last_ts, now - SETTLE_SECONDS, last_ts, last_id, chunk_size))
+            if df.empty:
+                return total
+            df["day"] = _day(df["returned_ts"])
+            df["late"] = df["returned_ts"] > df["due_ts"]
+            df["seconds"] = (df["returned_ts"] - df["borrowed_ts"]).clip(lower=0)
+            daily = df.groupby(["day", "resource_type"]).agg(
+                returns=("id", "size"), late=("late", "sum"), seconds=("seconds", "sum"))
+            c.executemany(_UPSERT_DAILY, [(int(day), resource_type, 0, int(row.returns), int(row.late), int(row.seconds))
+                                          for (day, resource_type), row in daily.iterrows()])
+            last = df.iloc[-1]
+            c.execute("UPDATE analytics_state SET last_returned_ts=?, last_returned_id=? WHERE id=1",
+                      (int(last["returned_ts"]), int(last["id"])))
+        total += len(df)
+        if len(df) < chunk_size:
+            return total
+
+
+def refresh(chunk_size=CHUNK_SIZE, now=None):
+    """Fold loans and returns recorded since the last refresh into the rollups"""
+    now = int(now if now is not None else time.time())
+    started = time.perf_counter()
+    loans = _refresh_loans(chunk_size)
+    returns = _refresh_returns(chunk_size, now)
+    with db.transaction() as c:
+        c.execute("UPDATE analytics_state SET refreshed_at=? WHERE id=1", (now,))
+    return {"loans": loans, "returns": returns, "elapsed": time.perf_counter() - started}
+
+
+def report(days=90, now=None):
+    """Circulation figures for the last `days` days, from the rollups and the live catalogue.
+
+    Returns a dict of DataFrames ("daily", "weekly", "by_type", "top_resources",
+    "utilization") and scalar metrics. The top resources are over all time.
+    Read-only: figures cover what the last refresh() folded in, and
+    "refreshed_at" is that refresh's Unix time, or None if none has run.
+    """
+    now = int(now if now is not None else time.time())
+    today = _day(now)
+    first = today - days + 1
+    with db.transaction() as c:
+        rollup = _frame(c, """SELECT day, resource_type, loans, returns, late_returns, loan_seconds
+                              FROM loan_daily WHERE day >= ?""", (first,))
+        top_resources = _frame(c, """SELECT r.title AS "Title", r.author AS "Author",
+                                            r.resource_type AS "Type", l.loans AS "Loans"
+                                     FROM resource_loans l JOIN resources r ON r.id = l.resource_id
+                                     ORDER BY l.loans DESC LIMIT ?""", (TOP_RESOURCES,))
+        # Cast, as PostgreSQL sums integers to NUMERIC
+        utilization = _frame(c, """SELECT resource_type, CAST(SUM(quantity) AS BIGINT) AS copies,
+                                          CAST(SUM(quantity - available) AS BIGINT) AS on_loan
+                                   FROM resources GROUP BY resource_type""")
+        c.execute("SELECT refreshed_at FROM analytics_state WHERE id=1")
+        refreshed_at = c.fetchone()[0]
+        c.execute("SELECT active_borrowings FROM library_stats WHERE id=1")
+        active = c.fetchone()[0]
+        c.execute("SELECT COUNT(*) FROM borrowings WHERE status='active' AND due_ts < ?", (now,))
+        overdue_now = c.fetchone()[0]
+
+    totals = ["loans", "returns", "late_returns", "loan_seconds"]
+    daily = rollup.groupby("day")[totals].sum().reindex(range(first, today + 1), fill_value=0)
+    daily.index = pd.to_datetime(daily.index, unit="D")
+    daily.index.name = "date"
+    weekly = daily[["loans", "returns"]].resample("W-MON", label="left", closed="left").sum()
+    by_type = rollup.groupby("resource_type")[["loans", "returns"]].sum().sort_values("loans", ascending=False)
+    utilization = utilization.set_index("resource_type")
+    utilization["utilization"] = (utilization["on_loan"] / utilization["copies"]).where(utilization["copies"] > 0, 0.0)
+
+    returns = int(daily["returns"].sum())
+    return {
+        "daily": daily[["loans", "returns"]],
+        "weekly": weekly,
+        "by_type": by_type,
+        "top_resources": top_resources,
+        "utilization": utilization,
+        "loans": int(daily["loans"].sum()),
+        "returns": returns,
+        "avg_loan_days": daily["loan_seconds"].sum() / returns / 86400 if returns else None,
+        "late_return_rate": daily["late_returns"].sum() / returns if returns else None,
+        "active": active,
+        "overdue_now": overdue_now,
+        "overdue_rate": overdue_now / active if active else None,
+        "refreshed_at": refreshed_at,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Loan analytics rollups")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="refresh periodically")
+    run_parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds between refreshes")
+    run_parser.add_argument("--once", action="store_true", help="refresh once and exit")
+    sub.add_parser("refresh", help="fold new loans and returns into the rollups")
+    report_parser = sub.add_parser("report", help="refresh, then print a summary")
+    report_parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    if args.command == "run":
+        while True:
+            result = refresh()
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} rolled up {result['loans']} loans and "
+                  f"{result['returns']} returns ({result['elapsed'] * 1000:.0f} ms)", flush=True)
+            if args.once:
+                break
+            time.sleep(args.interval)
+        return
+
+    result = refresh()
+    print(f"Rolled up {result['loans']} loans and {result['returns']} returns in {result['elapsed']:.1f}s")
+    if args.command == "report":
+        summary = report(args.days)
+        print(f"Last {args.days} days: {summary['loans']} loans, {summary['returns']} returns")
+        if summary["avg_loan_days"] is not None:
+            print(f"Average loan {summary['avg_loan_days']:.1f} days, "
+                  f"{summary['late_return_rate']:.0%} returned late")
+        print(f"Active loans {summary['active']}, overdue now {summary['overdue_now']}")
+        print(summary["by_type"].to_string())
+        print(summary["top_resources"].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
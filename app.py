@@ -1,10 +1,27 @@
 import streamlit as st
-import sqlite3
 from datetime import datetime, timedelta
-import hashlib
-import requests
+import base64
+import mimetypes
+import os
+import re
+import time
+from collections import Counter
 from pathlib import Path
 
+import analytics
+import blob_store
+import borrowing_history
+import cache
+import db
+import file_server
+import migrations
+import isbn_import
+import metrics
+import openlibrary
+import overdue_scanner
+import passwords
+import thumbnails
+
 # Page configuration
 st.set_page_config(
     page_title="FSSIB E-Library",
@@ -191,292 +208,453 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Database initialization
+@st.cache_resource
 def init_db():
-    """Initialize the SQLite database with required tables"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE NOT NULL,
-                  password TEXT NOT NULL,
-                  role TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Resources table
-    c.execute('''CREATE TABLE IF NOT EXISTS resources
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  title TEXT NOT NULL,
-                  author TEXT,
-                  resource_type TEXT NOT NULL,
-                  isbn TEXT,
-                  description TEXT,
-                  quantity INTEGER DEFAULT 1,
-                  available INTEGER DEFAULT 1,
-                  cover_url TEXT,
-                  file_path TEXT,
-                  added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Borrowing records table
-    c.execute('''CREATE TABLE IF NOT EXISTS borrowings
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  resource_id INTEGER,
-                  borrowed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  due_date TIMESTAMP,
-                  returned_at TIMESTAMP,
-                  status TEXT DEFAULT 'active',
-                  FOREIGN KEY (user_id) REFERENCES users(id),
-                  FOREIGN KEY (resource_id) REFERENCES resources(id))''')
-    
-    # Create default admin if not exists
-    c.execute("SELECT * FROM users WHERE username='admin'")
-    if not c.fetchone():
-        admin_password = hashlib.sha256("admin123".encode()).hexdigest()
-        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                  ("admin", admin_password, "admin"))
-    
-    conn.commit()
-    conn.close()
+    """Apply pending schema migrations and start the thumbnail worker once per process"""
+    version = migrations.migrate()
+    thumbnails.start()
+    if file_server.METRICS_TOKEN:
+        # Serve /metrics from process start, not from the first signed URL
+        file_server.start()
+    return version
+
+# Read caching: scope for one student's borrowings (see cache.py)
+def _user_scope(user_id):
+    return f"user:{user_id}"
 
 # Authentication functions
 def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def authenticate(username, password):
-    """Authenticate user credentials"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    hashed = hash_password(password)
-    c.execute("SELECT id, username, role FROM users WHERE username=? AND password=?",
-              (username, hashed))
-    result = c.fetchone()
-    conn.close()
-    return result
+    """Hash a password with the configured salted KDF (see passwords.py)"""
+    return passwords.hash_password(password)
+
+def client_ip():
+    """Address of the browser behind this session, if Streamlit knows it"""
+    try:
+        return st.context.ip_address
+    except Exception:
+        return None
+
+def authenticate(username, password, ip=None):
+    """Authenticate user credentials.
+
+    Raises passwords.TooManyAttempts after repeated failures for the username
+    or IP. Legacy SHA-256 and outdated hashes are replaced on a successful login.
+    """
+    passwords.limiter.check(username, ip)
+    with db.transaction() as c:
+        c.execute("SELECT id, username, role, password FROM users WHERE username=?", (username,))
+        row = c.fetchone()
+    
+    # KDF work happens outside the transaction so no pooled connection waits on it
+    if row is None:
+        passwords.verify_dummy(password)
+    elif passwords.verify(password, row[3]):
+        passwords.limiter.succeeded(username, ip)
+        if passwords.needs_rehash(row[3]):
+            new_hash = hash_password(password)
+            with db.transaction() as c:
+                c.execute("UPDATE users SET password=? WHERE id=? AND password=?", (new_hash, row[0], row[3]))
+        return row[:3]
+    passwords.limiter.failed(username, ip)
+    return None
 
 def register_user(username, password, role="student"):
     """Register a new user"""
     try:
-        conn = sqlite3.connect('elibrary.db')
-        c = conn.cursor()
         hashed = hash_password(password)
-        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                  (username, hashed, role))
-        conn.commit()
-        conn.close()
+        with db.transaction() as c:
+            c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                      (username, hashed, role))
+            cache.publish(c, "users")
+        cache.bump("users")
         return True
-    except sqlite3.IntegrityError:
+    except db.IntegrityError:
         return False
 
 # External API integration - Open Library API
 def fetch_book_from_api(isbn_or_title):
-    """Fetch book information from Open Library API"""
-    try:
-        # Try ISBN search first
-        if isbn_or_title.replace('-', '').isdigit():
-            url = f"https://openlibrary.org/api/books?bibkeys=ISBN:{isbn_or_title}&format=json&jscmd=data"
-        else:
-            # Title search
-            url = f"https://openlibrary.org/search.json?title={isbn_or_title}&limit=1"
-        
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Parse ISBN response
-            if f"ISBN:{isbn_or_title}" in data:
-                book_data = data[f"ISBN:{isbn_or_title}"]
-                return {
-                    "title": book_data.get("title", ""),
-                    "author": ", ".join([a["name"] for a in book_data.get("authors", [])]),
-                    "isbn": isbn_or_title,
-                    "description": book_data.get("notes", ""),
-                    "cover_url": book_data.get("cover", {}).get("medium", "")
-                }
-            # Parse title search response
-            elif "docs" in data and len(data["docs"]) > 0:
-                book = data["docs"][0]
-                return {
-                    "title": book.get("title", ""),
-                    "author": ", ".join(book.get("author_name", [])),
-                    "isbn": book.get("isbn", [""])[0] if book.get("isbn") else "",
-                    "description": book.get("first_sentence", [""])[0] if book.get("first_sentence") else "",
-                    "cover_url": f"https://covers.openlibrary.org/b/id/{book.get('cover_i', '')}-M.jpg" if book.get('cover_i') else ""
-                }
-        return None
-    except Exception as e:
-        st.error(f"API Error: {str(e)}")
-        return None
+    """Fetch book information from Open Library API, served from the lookup cache when fresh"""
+    with metrics.timed("fetch_book_from_api") as timer:
+        try:
+            book = openlibrary.lookup(isbn_or_title)
+        except Exception as e:
+            timer.labels["status"] = "error"
+            st.error(f"API Error: {str(e)}")
+            return None
+        timer.labels["status"] = "found" if book else "not_found"
+        return book
 
 # Resource management functions
 def add_resource(title, author, resource_type, isbn="", description="", quantity=1, cover_url="", file_path=""):
     """Add a new resource to the library"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    c.execute("""INSERT INTO resources 
-                 (title, author, resource_type, isbn, description, quantity, available, cover_url, file_path) 
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-              (title, author, resource_type, isbn, description, quantity, quantity, cover_url, file_path))
-    conn.commit()
-    conn.close()
-
-def search_resources(query, resource_type="all"):
-    """Search for resources by title or author"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    if resource_type == "all":
-        c.execute("""SELECT id, title, author, resource_type, isbn, available, quantity, cover_url, file_path 
-                     FROM resources 
-                     WHERE title LIKE ? OR author LIKE ?""",
-                  (f"%{query}%", f"%{query}%"))
-    else:
+    with db.transaction() as c:
+        c.execute("""INSERT INTO resources 
+                     (title, author, resource_type, isbn, description, quantity, available, cover_url, file_path) 
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                  (title, author, resource_type, isbn, description, quantity, quantity, cover_url, file_path))
+        cache.publish(c, "catalogue")
+    cache.bump("catalogue")
+    thumbnails.wake()
+
+# Matching resource ids with a score, lowest first. Title matches count most,
+# then author, ISBN and description: weighted BM25 over FTS5 on SQLite, and
+# ts_rank over the weighted search column on PostgreSQL
+SEARCH_MATCHES = {
+    "sqlite": """SELECT rowid AS id, bm25(resources_fts, 10.0, 5.0, 1.0, 2.0) AS score
+                 FROM resources_fts WHERE resources_fts MATCH ?""",
+    # float8, so the score read back as a page anchor compares equal to itself
+    "postgresql": """SELECT r.id, -ts_rank('{0.1, 0.2, 0.5, 1.0}'::float4[], r.search, q.query)::float8 AS score
+                     FROM resources r, to_tsquery('simple', ?) AS q(query)
+                     WHERE r.search @@ q.query""",
+}
+
+def _fts_query(query):
+    """Turn free text into a prefix query, e.g. 'harry pot' -> '"harry"* "pot"*' for FTS5
+    or "'harry':* & 'pot':*" for PostgreSQL"""
+    terms = re.findall(r"\w+", query)
+    if db.dialect() == "postgresql":
+        return " & ".join("'" + term.replace("'", "''") + "':*" for term in terms)
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+@cache.cached_read("catalogue")
+def search_resources(query, resource_type="all", after=None, limit=None):
+    """Search for resources by title, author, description or ISBN, best matches first.
+
+    Pass the id of the last row of the previous page as `after` together with
+    `limit` to page through results by (rank, id) keyset.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    
+    matches = SEARCH_MATCHES[db.dialect()]
+    with db.transaction() as c:
+        anchor = None
+        if after is not None:
+            c.execute(f"SELECT score FROM ({matches}) m WHERE id=?", (match, after))
+            row = c.fetchone()
+            if row:
+                anchor = (row[0], after)
+        
+        sql = f"""SELECT r.id, r.title, r.author, r.resource_type, r.isbn, r.available, r.quantity, r.cover_url, r.file_path 
+                  FROM ({matches}) m
+                  JOIN resources r ON r.id = m.id
+                  WHERE 1=1"""
+        params = [match]
+        if anchor:
+            sql += " AND (m.score, m.id) > (?, ?)"
+            params.extend(anchor)
+        if resource_type != "all":
+            sql += " AND r.resource_type=?"
+            params.append(resource_type)
+        sql += " ORDER BY m.score, m.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        c.execute(sql, params)
+        return c.fetchall()
+
+@cache.cached_read("catalogue")
+def get_all_resources(resource_type="all", after=None, limit=None):
+    """Get all resources in id order, optionally filtered by type.
+
+    Pass the id of the last row of the previous page as `after` together with
+    `limit` to page through the catalogue by id keyset.
+    """
+    sql = """SELECT id, title, author, resource_type, isbn, available, quantity, cover_url, file_path FROM resources 
+             WHERE id > ?"""
+    params = [after or 0]
+    if resource_type != "all":
+        sql += " AND resource_type=?"
+        params.append(resource_type)
+    sql += " ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    
+    with db.transaction() as c:
+        c.execute(sql, params)
+        return c.fetchall()
+
+@cache.cached_read("catalogue")
+def get_resource(resource_id):
+    """Get one resource row, in the same column order as the listings, or None"""
+    with db.transaction() as c:
         c.execute("""SELECT id, title, author, resource_type, isbn, available, quantity, cover_url, file_path 
-                     FROM resources 
-                     WHERE (title LIKE ? OR author LIKE ?) AND resource_type=?""",
-                  (f"%{query}%", f"%{query}%", resource_type))
-    
-    results = c.fetchall()
-    conn.close()
-    return results
+                     FROM resources WHERE id=?""", (resource_id,))
+        return c.fetchone()
 
-def get_all_resources(resource_type="all"):
-    """Get all resources, optionally filtered by type"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    if resource_type == "all":
-        c.execute("SELECT id, title, author, resource_type, isbn, available, quantity, cover_url, file_path FROM resources")
-    else:
-        c.execute("SELECT id, title, author, resource_type, isbn, available, quantity, cover_url, file_path FROM resources WHERE resource_type=?", 
-                  (resource_type,))
-    
-    results = c.fetchall()
-    conn.close()
-    return results
+# Loan policy
+LOAN_DAYS = 14
+MAX_LOANS = 5
+MAX_HOLDS = 5
+MAX_RENEWALS = 2
+
+def _checkout(c, user_id, resource_id, now):
+    """Insert an active loan due LOAN_DAYS from now; returns its id"""
+    due_date = now + timedelta(days=LOAN_DAYS)
+    c.execute("""INSERT INTO borrowings (user_id, resource_id, due_date, borrowed_ts, due_ts) 
+                 VALUES (?, ?, ?, ?, ?) RETURNING id""",
+              (user_id, resource_id, due_date, int(now.timestamp()), int(due_date.timestamp())))
+    return c.fetchone()[0]
 
+def _assign_next(c, resource_id, now):
+    """Check a returned copy out to the first waiting student who can take it.
+
+    Runs inside the return's transaction, so the copy is never seen as
+    available in between. Students at the loan limit keep their place and are
+    skipped. The whole queue is walked, a page at a time, before the copy is
+    released. Returns the new borrower's id, or None if no one could take it.
+    """
+    after = 0
+    while True:
+        c.execute("""SELECT id, user_id FROM holds
+                     WHERE resource_id=? AND status='waiting' AND id > ?
+                     ORDER BY id LIMIT 50""", (resource_id, after))
+        waiting = c.fetchall()
+        if not waiting:
+            return None
+        for hold_id, user_id in waiting:
+            c.execute("SELECT COUNT(*) FROM borrowings WHERE user_id=? AND status='active'", (user_id,))
+            if c.fetchone()[0] >= MAX_LOANS:
+                continue
+            borrowing_id = _checkout(c, user_id, resource_id, now)
+            c.execute("UPDATE holds SET status='fulfilled', closed_ts=?, borrowing_id=? WHERE id=?",
+                      (int(now.timestamp()), borrowing_id, hold_id))
+            # Delivered with the overdue notices by whatever drains the outbox
+            c.execute("""INSERT INTO notifications (user_id, borrowing_id, kind, due_ts, created_at)
+                         VALUES (?, ?, 'hold_fulfilled', ?, ?) ON CONFLICT DO NOTHING""",
+                      (user_id, borrowing_id, int(now.timestamp()) + LOAN_DAYS * 86400, int(now.timestamp())))
+            return user_id
+        after = waiting[-1][0]
+
+@db.retry_on_busy()
 def borrow_resource(user_id, resource_id):
-    """Borrow a resource with validation"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    # Check if user already borrowed this resource
-    c.execute("""SELECT COUNT(*) FROM borrowings 
-                 WHERE user_id=? AND resource_id=? AND status='active'""",
-              (user_id, resource_id))
-    already_borrowed = c.fetchone()[0] > 0
-    
-    if already_borrowed:
-        conn.close()
-        return False, "You have already borrowed this resource!"
-    
-    # Check if user has reached max borrowing limit (5 books)
-    c.execute("SELECT COUNT(*) FROM borrowings WHERE user_id=? AND status='active'", (user_id,))
-    active_count = c.fetchone()[0]
-    
-    if active_count >= 5:
-        conn.close()
-        return False, "You have reached the maximum borrowing limit of 5 resources!"
-    
-    # Check availability
-    c.execute("SELECT available FROM resources WHERE id=?", (resource_id,))
-    result = c.fetchone()
-    
-    if result and result[0] > 0:
+    """Borrow a resource with validation, atomically claiming one available copy"""
+    # Take the write lock up front so concurrent borrows of the same copy serialize
+    with db.transaction(immediate=True) as c:
+        # Active loans for this user, and whether this resource is among them
+        c.execute("""SELECT COUNT(*), COALESCE(SUM(CASE WHEN resource_id=? THEN 1 ELSE 0 END), 0) FROM borrowings 
+                     WHERE user_id=? AND status='active'""",
+                  (resource_id, user_id))
+        active_count, already_borrowed = c.fetchone()
+        
+        if already_borrowed:
+            return False, "You have already borrowed this resource!"
+        
+        # Check if user has reached max borrowing limit
+        if active_count >= MAX_LOANS:
+            return False, f"You have reached the maximum borrowing limit of {MAX_LOANS} resources!"
+        
+        # Claim a copy only if one is still available
+        c.execute("""UPDATE resources SET available = available - 1 
+                     WHERE id=? AND available > 0 
+                     RETURNING available""",
+                  (resource_id,))
+        if c.fetchone() is None:
+            return False, "Resource is not available!"
+        
         # Create borrowing record
-        due_date = datetime.now() + timedelta(days=14)  # 2 weeks borrowing period
-        c.execute("""INSERT INTO borrowings (user_id, resource_id, due_date) 
-                     VALUES (?, ?, ?)""",
-                  (user_id, resource_id, due_date))
+        now = datetime.now()
+        borrowing_id = _checkout(c, user_id, resource_id, now)
         
-        # Update available count
-        c.execute("UPDATE resources SET available = available - 1 WHERE id=?", (resource_id,))
-        conn.commit()
-        conn.close()
-        return True, "Resource borrowed successfully!"
-    
-    conn.close()
-    return False, "Resource is not available!"
+        # A student who was waiting for it has their hold served by this loan
+        c.execute("""UPDATE holds SET status='fulfilled', closed_ts=?, borrowing_id=? 
+                     WHERE user_id=? AND resource_id=? AND status='waiting'""",
+                  (int(now.timestamp()), borrowing_id, user_id, resource_id))
+        scopes = ["catalogue", "borrowings", _user_scope(user_id)] + (["holds"] if c.rowcount else [])
+        cache.publish(c, *scopes)
+    
+    cache.bump(*scopes)
+    return True, "Resource borrowed successfully!"
 
+@db.retry_on_busy()
 def return_resource(borrowing_id):
-    """Return a borrowed resource"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    # Get resource_id from borrowing
-    c.execute("SELECT resource_id FROM borrowings WHERE id=?", (borrowing_id,))
-    result = c.fetchone()
+    """Return a borrowed resource, handing the copy to the next student on hold"""
+    with db.transaction(immediate=True) as c:
+        # Close the loan only if it is still active, so a double return is a no-op
+        now = datetime.now()
+        c.execute("""UPDATE borrowings 
+                     SET returned_at=?, returned_ts=?, status='returned' 
+                     WHERE id=? AND status='active' 
+                     RETURNING resource_id, user_id""",
+                  (now, int(now.timestamp()), borrowing_id))
+        result = c.fetchone()
+        
+        if not result:
+            return False
+        
+        # The copy goes to the waiting list first, and back on the shelf only if no one can take it
+        next_user = _assign_next(c, result[0], now)
+        if next_user is None:
+            c.execute("UPDATE resources SET available = available + 1 WHERE id=?", (result[0],))
+            scopes = ["catalogue", "borrowings", _user_scope(result[1])]
+        else:
+            scopes = ["catalogue", "borrowings", "holds", _user_scope(result[1]), _user_scope(next_user)]
+        cache.publish(c, *scopes)
     
-    if result:
-        resource_id = result[0]
+    cache.bump(*scopes)
+    return True
+
+@db.retry_on_busy()
+def renew_resource(user_id, borrowing_id):
+    """Extend an active loan by another loan period, unless someone is waiting for the resource"""
+    with db.transaction(immediate=True) as c:
+        c.execute("""SELECT resource_id, due_ts, renewals FROM borrowings 
+                     WHERE id=? AND user_id=? AND status='active'""",
+                  (borrowing_id, user_id))
+        loan = c.fetchone()
+        if loan is None:
+            return False, "This loan is no longer active!"
+        resource_id, due_ts, renewals = loan
         
-        # Update borrowing record
-        c.execute("""UPDATE borrowings 
-                     SET returned_at=?, status='returned' 
+        if renewals >= MAX_RENEWALS:
+            return False, f"A loan can be renewed at most {MAX_RENEWALS} times!"
+        
+        # A single probe of the queue index
+        c.execute("SELECT 1 FROM holds WHERE resource_id=? AND status='waiting' LIMIT 1", (resource_id,))
+        if c.fetchone():
+            return False, "Another student is waiting for this resource, so it cannot be renewed."
+        
+        # Overdue loans are renewed from today
+        due_date = datetime.fromtimestamp(max(due_ts, int(time.time()))) + timedelta(days=LOAN_DAYS)
+        c.execute("""UPDATE borrowings SET due_date=?, due_ts=?, renewals=renewals + 1 
                      WHERE id=?""",
-                  (datetime.now(), borrowing_id))
+                  (due_date, int(due_date.timestamp()), borrowing_id))
+        # Reminders queued for the old due date no longer apply
+        c.execute("""DELETE FROM notifications 
+                     WHERE borrowing_id=? AND kind IN ('due_soon', 'overdue') AND sent_at IS NULL""",
+                  (borrowing_id,))
+        cache.publish(c, "borrowings", _user_scope(user_id))
+    
+    cache.bump("borrowings", _user_scope(user_id))
+    return True, f"Renewed until {due_date.strftime('%B %d, %Y')}"
+
+@db.retry_on_busy()
+def place_hold(user_id, resource_id):
+    """Join the waiting list of a resource with no copies available"""
+    with db.transaction(immediate=True) as c:
+        c.execute("SELECT available FROM resources WHERE id=?", (resource_id,))
+        resource = c.fetchone()
+        if resource is None:
+            return False, "Resource not found!"
+        # Checked under the write lock, so a return cannot slip between this and the insert
+        if resource[0] > 0:
+            return False, "A copy is available now, so you can borrow it straight away!"
         
-        # Update available count
-        c.execute("UPDATE resources SET available = available + 1 WHERE id=?", (resource_id,))
-        conn.commit()
-        conn.close()
-        return True
-    
-    conn.close()
-    return False
+        c.execute("""SELECT 1 FROM borrowings 
+                     WHERE user_id=? AND resource_id=? AND status='active' LIMIT 1""",
+                  (user_id, resource_id))
+        if c.fetchone():
+            return False, "You have already borrowed this resource!"
+        
+        c.execute("""SELECT COUNT(*), COALESCE(SUM(CASE WHEN resource_id=? THEN 1 ELSE 0 END), 0) FROM holds 
+                     WHERE user_id=? AND status='waiting'""",
+                  (resource_id, user_id))
+        hold_count, already_waiting = c.fetchone()
+        if already_waiting:
+            return False, "You are already on the waiting list for this resource!"
+        if hold_count >= MAX_HOLDS:
+            return False, f"You can wait for at most {MAX_HOLDS} resources at a time!"
+        
+        c.execute("INSERT INTO holds (user_id, resource_id, created_ts) VALUES (?, ?, ?) RETURNING id",
+                  (user_id, resource_id, int(time.time())))
+        hold_id = c.fetchone()[0]
+        c.execute("SELECT COUNT(*) FROM holds WHERE resource_id=? AND status='waiting' AND id<=?",
+                  (resource_id, hold_id))
+        position = c.fetchone()[0]
+        cache.publish(c, "holds", _user_scope(user_id))
+    
+    cache.bump("holds", _user_scope(user_id))
+    return True, f"You are number {position} on the waiting list. The next returned copy is checked out to you when your turn comes."
 
+@db.retry_on_busy()
+def cancel_hold(user_id, hold_id):
+    """Leave a waiting list; returns False if the hold was no longer waiting"""
+    with db.transaction(immediate=True) as c:
+        c.execute("""UPDATE holds SET status='cancelled', closed_ts=? 
+                     WHERE id=? AND user_id=? AND status='waiting'""",
+                  (int(time.time()), hold_id, user_id))
+        cancelled = c.rowcount > 0
+        if cancelled:
+            cache.publish(c, "holds", _user_scope(user_id))
+    
+    if cancelled:
+        cache.bump("holds", _user_scope(user_id))
+    return cancelled
+
+@cache.cached_read(_user_scope, "holds")
+def get_user_holds(user_id, limit=20):
+    """Get a student's most recent holds, newest first.
+
+    Rows are (hold id, resource id, title, author, type, status, created_ts,
+    closed_ts, queue position). The position counts waiting holds up to this
+    one on the queue index, and is None once the hold is no longer waiting.
+    """
+    with db.transaction() as c:
+        c.execute("""SELECT h.id, r.id, r.title, r.author, r.resource_type, h.status, h.created_ts, h.closed_ts,
+                            CASE WHEN h.status='waiting' THEN
+                                (SELECT COUNT(*) FROM holds q 
+                                 WHERE q.resource_id=h.resource_id AND q.status='waiting' AND q.id<=h.id)
+                            END
+                     FROM holds h
+                     JOIN resources r ON h.resource_id = r.id
+                     WHERE h.user_id=?
+                     ORDER BY h.id DESC LIMIT ?""",
+                  (user_id, limit))
+        
+        return c.fetchall()
+
+@cache.cached_read(_user_scope)
 def get_user_borrowings(user_id):
-    """Get all borrowings for a user"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    c.execute("""SELECT b.id, r.title, r.author, r.resource_type, b.borrowed_at, b.due_date, b.status, r.id
-                 FROM borrowings b
-                 JOIN resources r ON b.resource_id = r.id
-                 WHERE b.user_id=? AND b.status='active'
-                 ORDER BY b.borrowed_at DESC""",
-              (user_id,))
-    
-    results = c.fetchall()
-    conn.close()
-    return results
-
-def get_all_borrowings():
-    """Get all borrowings (admin view)"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    c.execute("""SELECT b.id, u.username, r.title, r.resource_type, b.borrowed_at, b.due_date, b.status
-                 FROM borrowings b
-                 JOIN users u ON b.user_id = u.id
-                 JOIN resources r ON b.resource_id = r.id
-                 ORDER BY b.borrowed_at DESC
-                 LIMIT 50""")
-    
-    results = c.fetchall()
-    conn.close()
-    return results
+    """Get a user's active borrowings, classified by due date.
+
+    Each row ends with due_ts, the seconds left until it is due (negative once
+    overdue), a status of 'overdue', 'due_soon' or 'on_time' and the number of
+    times the loan has been renewed. Rows are
+    cached, so the classification can lag the clock by up to cache.TTL.
+    """
+    now = int(time.time())
+    with db.transaction() as c:
+        c.execute("""SELECT b.id, r.title, r.author, r.resource_type, b.borrowed_at, b.due_date, b.status, r.id,
+                            b.due_ts, b.due_ts - ?,
+                            CASE WHEN b.due_ts < ? THEN 'overdue'
+                                 WHEN b.due_ts < ? THEN 'due_soon'
+                                 ELSE 'on_time' END,
+                            b.renewals
+                     FROM borrowings b
+                     JOIN resources r ON b.resource_id = r.id
+                     WHERE b.user_id=? AND b.status='active'
+                     ORDER BY b.borrowed_at DESC""",
+                  (now, now, now + overdue_scanner.DUE_SOON_SECONDS, user_id))
+        
+        return c.fetchall()
+
+@cache.cached_read("borrowings")
+def get_borrowing_history(username=None, resource_ids=None, status=None, start=None, end=None,
+                          after=None, limit=None):
+    """One page of the borrowing history, newest first (see borrowing_history.history_page)"""
+    return borrowing_history.history_page(username, resource_ids, status, start, end, before=after, limit=limit)
+
+@cache.cached_read("borrowings")
+def get_loan_alerts():
+    """Overdue/due-soon counts from the latest overdue_scanner pass, or None if it has not run"""
+    return overdue_scanner.status()
 
+@cache.cached_read("catalogue", "borrowings")
+def get_analytics(days=90):
+    """Circulation report for the last `days` days from the rollups; `python analytics.py run` keeps them current"""
+    return analytics.report(days)
+
+@cache.cached_read("catalogue", "borrowings", "users")
 def get_library_stats():
-    """Get library statistics"""
-    conn = sqlite3.connect('elibrary.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT COUNT(*) FROM resources")
-    total_resources = c.fetchone()[0]
+    """Get library statistics from the trigger-maintained summary row"""
+    with db.transaction() as c:
+        c.execute("""SELECT total_resources, total_copies, active_borrowings, total_students 
+                     FROM library_stats WHERE id=1""")
+        total_resources, total_copies, active_borrowings, total_students = c.fetchone()
     
-    c.execute("SELECT SUM(quantity) FROM resources")
-    total_copies = c.fetchone()[0] or 0
-    
-    c.execute("SELECT COUNT(*) FROM borrowings WHERE status='active'")
-    active_borrowings = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM users WHERE role='student'")
-    total_students = c.fetchone()[0]
-    
-    conn.close()
     return {
         "total_resources": total_resources,
         "total_copies": total_copies,
@@ -484,6 +662,283 @@ def get_library_stats():
         "total_students": total_students
     }
 
+# Pagination helpers
+PAGE_SIZE = 20
+
+def fetch_page(state_key, reset_token, fetch, page_size=PAGE_SIZE):
+    """Fetch the current keyset page of a listing.
+
+    Page start cursors are kept as a stack in session state and reset whenever
+    `reset_token` (e.g. the active search and filter) changes. `fetch` is called
+    as fetch(after, limit) and must return rows whose first column is the id.
+    """
+    if st.session_state.get(f"{state_key}_token") != reset_token:
+        st.session_state[f"{state_key}_token"] = reset_token
+        st.session_state[f"{state_key}_cursors"] = [None]
+    cursors = st.session_state[f"{state_key}_cursors"]
+    
+    # Ask for one extra row to know whether there is a next page
+    rows = fetch(cursors[-1], page_size + 1)
+    return rows[:page_size], len(rows) > page_size
+
+def page_controls(state_key, rows, has_next):
+    """Render previous/next buttons for a listing fetched with fetch_page"""
+    cursors = st.session_state[f"{state_key}_cursors"]
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("◀ Previous", key=f"{state_key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next ▶", key=f"{state_key}_next", disabled=not has_next):
+            cursors.append(rows[-1][0])
+            st.rerun()
+    with col3:
+        st.caption(f"Page {len(cursors)}")
+
+# Browse rendering helpers
+def resource_card(resource):
+    """Render a resource's summary card and thumbnail"""
+    resource_id, title, author, res_type, isbn, available, quantity, cover_url, file_path = resource
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        st.markdown(f"""
+        <div class="resource-card">
+            <h3 style="margin-top: 0; color: #667eea;">{title}</h3>
+            <p style="color: rgba(255,255,255,0.8);"><strong>Author:</strong> {author or 'Unknown'}</p>
+            <p style="color: rgba(255,255,255,0.7);"><strong>Type:</strong> {res_type.title()}</p>
+            <p style="color: rgba(255,255,255,0.7);"><strong>ISBN:</strong> {isbn or 'N/A'}</p>
+            <p style="color: {'#86efac' if available > 0 else '#fca5a5'};"><strong>Available:</strong> {available} of {quantity}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    with col2:
+        thumbnail = thumbnails.thumbnail_path(resource_id)
+        if thumbnail:
+            st.image(thumbnail, width=120)
+        elif cover_url:
+            # Until the background worker has made the thumbnail
+            st.image(cover_url, width=120)
+
+def resource_actions(resource):
+    """Render the Borrow/Preview buttons and whichever panel they have opened"""
+    resource_id, title, author, res_type, isbn, available, quantity, cover_url, file_path = resource
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
+    
+    with col1:
+        if available > 0:
+            if st.button(f"📚 Borrow", key=f"borrow_{resource_id}"):
+                st.session_state[f'show_borrow_modal_{resource_id}'] = True
+        else:
+            # No copy to borrow: join the waiting list instead of checking back later
+            st.button("🔔 Place Hold", key=f"hold_{resource_id}", on_click=_place_hold, args=(resource_id,),
+                      help="The next returned copy is checked out to the first student waiting")
+    
+    with col2:
+        if file_path:
+            if st.button("👁️ Preview", key=f"preview_{resource_id}"):
+                st.session_state[f'show_preview_{resource_id}'] = True
+
+def _set_state(key, value):
+    st.session_state[key] = value
+
+def _confirm_borrow(resource_id):
+    """Button callback: borrow, keep the outcome for the next render and close the panel on success"""
+    success, message = borrow_resource(st.session_state.user_id, resource_id)
+    st.session_state[f'borrow_result_{resource_id}'] = (success, message)
+    if success:
+        st.session_state[f'show_borrow_modal_{resource_id}'] = False
+
+def _place_hold(resource_id):
+    """Button callback: join the waiting list and keep the outcome for the next render"""
+    st.session_state[f'hold_result_{resource_id}'] = place_hold(st.session_state.user_id, resource_id)
+
+def borrow_panel(resource):
+    """Borrow confirmation for one resource"""
+    resource_id, title, author, res_type, isbn, available, quantity, cover_url, file_path = resource
+    borrow_count = len(get_user_borrowings(st.session_state.user_id))
+    
+    st.markdown("---")
+    st.markdown(f"### 📚 Borrowing: {title}")
+    
+    st.info(f"""
+    **Borrowing Details:**
+    - **Title:** {title}
+    - **Author:** {author or 'Unknown'}
+    - **Type:** {res_type.title()}
+    - **Loan Period:** {LOAN_DAYS} days
+    - **Due Date:** {(datetime.now() + timedelta(days=LOAN_DAYS)).strftime('%B %d, %Y')}
+    - **Current Borrowed:** {borrow_count}/{MAX_LOANS} books
+    """)
+    
+    st.markdown("""
+    <div style="background: rgba(102, 126, 234, 0.1); padding: 1rem; border-radius: 10px; margin: 1rem 0;">
+    <h4 style="margin: 0; color: #667eea;">📋 Terms & Conditions</h4>
+    <ul style="color: rgba(255,255,255,0.8); margin-top: 0.5rem;">
+        <li>Return the resource on or before the due date</li>
+        <li>Handle the resource with care</li>
+        <li>Late returns may incur fines</li>
+        <li>Resources are non-transferable</li>
+    </ul>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        st.button("✅ Confirm Borrow", key=f"confirm_{resource_id}", width=200,
+                  on_click=_confirm_borrow, args=(resource_id,))
+    
+    with col2:
+        st.button("❌ Cancel", key=f"cancel_{resource_id}", width=200,
+                  on_click=_set_state, args=(f'show_borrow_modal_{resource_id}', False))
+    
+    st.markdown("---")
+
+def download_link(label, file_path, file_name, mime=None):
+    """Download an upload: a streamed file-server link, or through Streamlit when FILE_SERVER_URL is unset"""
+    if file_server.enabled():
+        st.link_button(label, file_server.signed_url(file_path, file_name))
+    else:
+        with open(file_path, "rb") as f:
+            st.download_button(label=label, data=f, file_name=file_name, mime=mime)
+
+def cover_image(thumbnail):
+    """Image source for a cover thumbnail: a signed link, or the small file inlined as a data URL"""
+    if file_server.enabled():
+        return file_server.signed_url(thumbnail)
+    mime = mimetypes.guess_type(thumbnail)[0] or "image/jpeg"
+    with open(thumbnail, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
+
+def preview_panel(resource):
+    """Inline preview of a resource's uploaded file"""
+    resource_id, title, author, res_type, isbn, available, quantity, cover_url, file_path = resource
+    
+    st.markdown("---")
+    st.markdown(f"### 👁️ Preview: {title}")
+    
+    # With FILE_SERVER_URL set, files are streamed to the browser by the file server and
+    # never loaded whole here; without it Streamlit delivers them itself
+    source = file_server.signed_url(file_path) if file_server.enabled() else file_path
+    try:
+        if file_path.lower().endswith(('.pdf')):
+            download_link("📥 Download PDF", file_path, f"{title}.pdf", mime="application/pdf")
+            st.pdf(source, height=600)
+        elif file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
+            st.image(source, caption=title)
+        elif file_path.lower().endswith(('.txt', '.md')):
+            page_key = f'preview_page_{resource_id}'
+            page = st.session_state.get(page_key, 0)
+            content, has_more = file_server.read_text_page(file_path, page)
+            st.text_area("Content Preview", content, height=300, key=f"preview_text_{resource_id}_{page}")
+            
+            col1, col2, col3 = st.columns([1, 1, 4])
+            with col1:
+                st.button("◀ Previous", key=f"preview_prev_{resource_id}", disabled=page == 0,
+                          on_click=_set_state, args=(page_key, page - 1))
+            with col2:
+                st.button("Next ▶", key=f"preview_next_{resource_id}", disabled=not has_more,
+                          on_click=_set_state, args=(page_key, page + 1))
+            with col3:
+                st.caption(f"Part {page + 1}")
+            download_link("📥 Download", file_path, os.path.basename(file_path))
+        else:
+            st.warning("Preview not available for this file type")
+    except Exception as e:
+        st.error(f"Error loading preview: {str(e)}")
+    
+    st.button("Close Preview", key=f"close_preview_{resource_id}",
+              on_click=_set_state, args=(f'show_preview_{resource_id}', False))
+    
+    st.markdown("---")
+
+def resource_panels(resource):
+    """Render the outcome of a borrow or hold and the open borrow and preview panels of a resource.
+
+    Panel buttons act through callbacks rather than st.rerun, so the same
+    panels work in a full rerun and in a fragment rerun.
+    """
+    resource_id = resource[0]
+    file_path = resource[8]
+    result = st.session_state.pop(f'borrow_result_{resource_id}', None)
+    if result:
+        success, message = result
+        if success:
+            st.success(f"✅ {message}")
+            st.balloons()
+        else:
+            st.error(f"❌ {message}")
+    result = st.session_state.pop(f'hold_result_{resource_id}', None)
+    if result:
+        success, message = result
+        if success:
+            st.success(f"🔔 {message}")
+        else:
+            st.warning(message)
+    if st.session_state.get(f'show_borrow_modal_{resource_id}', False):
+        borrow_panel(resource)
+    if st.session_state.get(f'show_preview_{resource_id}', False) and file_path:
+        preview_panel(resource)
+
+@st.fragment
+def resource_browser(resources):
+    """Compact listing of one page: a single table, with details only for the selected row.
+
+    This runs as a fragment, so selecting a row, borrowing or previewing reruns
+    just the listing instead of the whole dashboard.
+    """
+    rows = []
+    for resource_id, title, author, res_type, isbn, available, quantity, cover_url, file_path in resources:
+        thumbnail = thumbnails.thumbnail_path(resource_id)
+        rows.append({
+            "Cover": cover_image(thumbnail) if thumbnail else None,
+            "Title": title,
+            "Author": author or "Unknown",
+            "Type": res_type.title(),
+            "ISBN": isbn or "N/A",
+            "Available": f"{available} of {quantity}",
+        })
+    
+    # Keyed by the page's ids so a selection does not carry over to another page
+    event = st.dataframe(rows, hide_index=True, on_select="rerun", selection_mode="single-row",
+                         key=f"browse_table_{hash(tuple(r[0] for r in resources))}",
+                         column_config={"Cover": st.column_config.ImageColumn("Cover", width="small")})
+    if not event.selection.rows:
+        st.caption("Select a row to borrow or preview it.")
+        return
+    
+    # Re-read the row so availability is current after a borrow in this fragment
+    resource = get_resource(resources[event.selection.rows[0]][0])
+    if resource is None:
+        st.warning("This resource is no longer in the catalogue.")
+        return
+    resource_card(resource)
+    resource_actions(resource)
+    resource_panels(resource)
+
+# Dashboard navigation
+def section_nav(key, sections):
+    """Horizontal navigation between dashboard sections; returns the selected name"""
+    return st.radio("Section", list(sections), horizontal=True, key=key, label_visibility="collapsed")
+
+@st.fragment
+def dashboard_section(name, render):
+    """Render one dashboard section as a fragment and show how long it took.
+
+    Only the selected section runs, and widget input inside it reruns just
+    this fragment, not the dashboard header or the other sections.
+    """
+    sql_calls, sql_seconds = metrics.thread_sql()
+    started = time.perf_counter()
+    render()
+    elapsed = time.perf_counter() - started
+    metrics.observe("dashboard_section", elapsed, section=name)
+    # SQL run by this script thread during the section, so its share of the render time shows
+    sql_calls_after, sql_seconds_after = metrics.thread_sql()
+    st.caption(f"⏱️ {name} rendered in {elapsed * 1000:.0f} ms "
+               f"({sql_calls_after - sql_calls} SQL statements, {(sql_seconds_after - sql_seconds) * 1000:.0f} ms)")
+
 # Main application
 def main():
     init_db()
@@ -510,16 +965,20 @@ def main():
                 password = st.text_input("Password", type="password", key="login_password", placeholder="Enter your password")
                 
                 if st.button("Login", width=300):
-                    user = authenticate(username, password)
-                    if user:
-                        st.session_state.logged_in = True
-                        st.session_state.user_id = user[0]
-                        st.session_state.username = user[1]
-                        st.session_state.role = user[2]
-                        st.success(f"Welcome back, {username}!")
-                        st.rerun()
+                    try:
+                        user = authenticate(username, password, client_ip())
+                    except (passwords.TooManyAttempts, passwords.Busy) as e:
+                        st.error(str(e))
                     else:
-                        st.error("Invalid credentials!")
+                        if user:
+                            st.session_state.logged_in = True
+                            st.session_state.user_id = user[0]
+                            st.session_state.username = user[1]
+                            st.session_state.role = user[2]
+                            st.success(f"Welcome back, {username}!")
+                            st.rerun()
+                        else:
+                            st.error("Invalid credentials!")
                 
                 st.info("**If you are not registered, please create an account to access the library resources.**")
             
@@ -535,10 +994,15 @@ def main():
                     elif len(new_password) < 6:
                         st.error("Password must be at least 6 characters!")
                     else:
-                        if register_user(new_username, new_password):
-                            st.success("Registration successful! Please login.")
+                        try:
+                            registered = register_user(new_username, new_password)
+                        except passwords.Busy as e:
+                            st.error(str(e))
                         else:
-                            st.error("Username already exists!")
+                            if registered:
+                                st.success("Registration successful! Please login.")
+                            else:
+                                st.error("Username already exists!")
         return
     
     # Sidebar
@@ -557,6 +1021,198 @@ def main():
     else:
         student_dashboard()
 
+# (color, label) for each due status get_user_borrowings assigns
+DUE_STATUS_STYLES = {
+    "on_time": ("#86efac", "✅ On Time"),
+    "due_soon": ("#fbbf24", "⚠️ Due Soon"),
+    "overdue": ("#fca5a5", "🔴 Overdue"),
+}
+
+def student_browse():
+    """Browse & Search section: one keyset page of the catalogue"""
+    st.markdown("### Explore Our Collection")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        search_query = st.text_input("🔎 Search by title or author", placeholder="Search for books, journals, audio files...")
+    with col2:
+        resource_filter = st.selectbox("Filter by type", ["all", "book", "journal", "audio"])
+    
+    st.button("Search", width=200)
+    view = st.radio("View", ["Compact", "Cards"], horizontal=True, key="browse_view",
+                    help="Compact shows the page as one table and loads details for the selected row only")
+    
+    if search_query:
+        resources, has_next = fetch_page(
+            "browse", (search_query, resource_filter),
+            lambda after, limit: search_resources(search_query, resource_filter, after, limit))
+    else:
+        resources, has_next = fetch_page(
+            "browse", ("", resource_filter),
+            lambda after, limit: get_all_resources(resource_filter, after, limit))
+    
+    if resources:
+        st.markdown(f"**Showing {len(resources)} resources**")
+        
+        if view == "Compact":
+            resource_browser(resources)
+        else:
+            # Display resources in cards
+            for resource in resources:
+                with st.container():
+                    resource_card(resource)
+                    resource_actions(resource)
+                    resource_panels(resource)
+        
+        page_controls("browse", resources, has_next)
+    else:
+        st.info("No resources found. Try a different search term.")
+
+def student_borrowings():
+    """My Borrowings section: active loans with their due status"""
+    borrowings = get_user_borrowings(st.session_state.user_id)
+    
+    st.markdown("### Your Borrowed Items")
+    
+    if borrowings:
+        for borrowing in borrowings:
+            (borrow_id, title, author, res_type, borrowed_at, due_date, status, resource_id,
+             due_ts, seconds_left, due_status, renewals) = borrowing
+            
+            days = abs(seconds_left) // 86400
+            color, status_text = DUE_STATUS_STYLES[due_status]
+            
+            st.markdown(f"""
+            <div class="resource-card">
+                <h3 style="margin-top: 0; color: #667eea;">{title}</h3>
+                <p style="color: rgba(255,255,255,0.8);"><strong>Author:</strong> {author}</p>
+                <p style="color: rgba(255,255,255,0.7);"><strong>Type:</strong> {res_type.title()}</p>
+                <p style="color: rgba(255,255,255,0.7);"><strong>Borrowed:</strong> {str(borrowed_at).split('.')[0]}</p>
+                <p style="color: {color};"><strong>Due Date:</strong> {datetime.fromtimestamp(due_ts).strftime('%B %d, %Y')} ({days} days {'left' if seconds_left >= 0 else 'overdue'})</p>
+                <p style="color: {color}; font-weight: bold;">{status_text}</p>
+                <p style="color: rgba(255,255,255,0.7);"><strong>Renewed:</strong> {renewals} of {MAX_RENEWALS} times</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            col1, col2, col3 = st.columns([1, 1, 4])
+            with col1:
+                if st.button(f"📤 Return", key=f"return_{borrow_id}"):
+                    if return_resource(borrow_id):
+                        st.success("Resource returned successfully!")
+                        st.rerun()
+                    else:
+                        st.error("Unable to return resource!")
+            with col2:
+                if st.button("🔁 Renew", key=f"renew_{borrow_id}", disabled=renewals >= MAX_RENEWALS):
+                    success, message = renew_resource(st.session_state.user_id, borrow_id)
+                    if success:
+                        st.success(message)
+                        st.rerun()
+                    else:
+                        st.warning(message)
+    else:
+        st.info("You haven't borrowed any resources yet. Browse the collection to get started!")
+
+# (color, label) for each hold status
+HOLD_STATUS_STYLES = {
+    "waiting": ("#fbbf24", "⏳ Waiting"),
+    "fulfilled": ("#86efac", "✅ Checked out to you"),
+    "cancelled": ("rgba(255,255,255,0.5)", "Cancelled"),
+}
+
+def student_holds():
+    """My Holds section: waiting-list places and the holds already served"""
+    holds = get_user_holds(st.session_state.user_id)
+    
+    st.markdown("### Your Holds")
+    st.caption("When a copy is returned it is checked out straight to the first student waiting, "
+               "so a held resource appears under My Borrowings without you having to check back.")
+    
+    if not holds:
+        st.info("You have no holds. Place one on any unavailable resource from Browse & Search.")
+        return
+    
+    for hold_id, resource_id, title, author, res_type, status, created_ts, closed_ts, position in holds:
+        color, status_text = HOLD_STATUS_STYLES[status]
+        if status == "waiting":
+            detail = f"Number {position} in the queue"
+        else:
+            detail = datetime.fromtimestamp(closed_ts).strftime('%B %d, %Y')
+        
+        st.markdown(f"""
+        <div class="resource-card">
+            <h3 style="margin-top: 0; color: #667eea;">{title}</h3>
+            <p style="color: rgba(255,255,255,0.8);"><strong>Author:</strong> {author or 'Unknown'}</p>
+            <p style="color: rgba(255,255,255,0.7);"><strong>Type:</strong> {res_type.title()}</p>
+            <p style="color: rgba(255,255,255,0.7);"><strong>Placed:</strong> {datetime.fromtimestamp(created_ts).strftime('%B %d, %Y')}</p>
+            <p style="color: {color}; font-weight: bold;">{status_text} · {detail}</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        if status == "waiting":
+            if st.button("✖️ Cancel Hold", key=f"cancel_hold_{hold_id}"):
+                if cancel_hold(st.session_state.user_id, hold_id):
+                    st.success("Hold cancelled.")
+                    st.rerun()
+                else:
+                    st.warning("This hold has already been served or cancelled.")
+
+def student_about():
+    """About section: library policy and the student's own figures"""
+    borrowings = get_user_borrowings(st.session_state.user_id)
+    borrow_count = len(borrowings)
+    due_counts = Counter(b[10] for b in borrowings)
+    
+    st.markdown("### About FSS E-Library")
+    st.markdown(f"""
+    Welcome to **FSS E-Library**, your comprehensive digital library platform!
+    
+    #### Features:
+    - 📚 Browse extensive collection of books, journals, and audio files
+    - 🔍 Smart search functionality
+    - 📖 Easy borrowing and returns with confirmation system
+    - 🔔 Holds on unavailable resources, checked out to you when a copy comes back
+    - 👁️ Preview resources before borrowing
+    - ⏰ Track due dates and borrowing history
+    - 📊 Real-time borrowing statistics
+    - 📱 Accessible anytime, anywhere
+    
+    #### Borrowing Policy:
+    - **Maximum limit:** {MAX_LOANS} resources at a time
+    - **Borrowing period:** {LOAN_DAYS} days
+    - **Cannot borrow duplicates:** Each resource can only be borrowed once
+    - **Late returns:** May incur fines (contact librarian)
+    - **Renewals:** Up to {MAX_RENEWALS} times, {LOAN_DAYS} days each, if no one is waiting
+    - **Holds:** Up to {MAX_HOLDS} at a time; the first student waiting gets the next returned copy
+    
+    #### Color Coding:
+    - 🟢 **Green:** More than 3 days remaining
+    - 🟡 **Yellow:** Due soon (within 3 days)
+    - 🔴 **Red:** Overdue
+    
+    #### Need Help?
+    Contact the librarian for any assistance.
+    """)
+    
+    st.markdown("---")
+    st.markdown("**Your Library Statistics:**")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Borrowed", borrow_count)
+    with col2:
+        st.metric("Slots Available", MAX_LOANS - borrow_count)
+    with col3:
+        on_time = borrow_count - due_counts["overdue"]
+        st.metric("On-Time Returns", f"{on_time}/{borrow_count}" if borrow_count > 0 else "N/A")
+
+# Student dashboard sections, in navigation order
+STUDENT_SECTIONS = {
+    "🔍 Browse & Search": student_browse,
+    "📖 My Borrowings": student_borrowings,
+    "🔔 My Holds": student_holds,
+    "ℹ️ About": student_about,
+}
+
 def student_dashboard():
     """Student dashboard interface"""
     st.title("📚 FSS E-Library")
@@ -564,240 +1220,361 @@ def student_dashboard():
     # Get current borrowing count
     borrowings = get_user_borrowings(st.session_state.user_id)
     borrow_count = len(borrowings)
+    # The header metrics come from one pass over the SQL-classified loans; sections read them from the cache
+    due_counts = Counter(b[10] for b in borrowings)
     
     # Display borrowing limit info
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("📖 Books Borrowed", f"{borrow_count}/5")
+        st.metric("📖 Books Borrowed", f"{borrow_count}/{MAX_LOANS}")
     with col2:
-        st.metric("📚 Available Slots", f"{5 - borrow_count}")
+        st.metric("📚 Available Slots", f"{MAX_LOANS - borrow_count}")
     with col3:
-        overdue_count = sum(1 for b in borrowings if (datetime.strptime(b[5].split('.')[0], "%Y-%m-%d %H:%M:%S") - datetime.now()).days < 0)
-        st.metric("⚠️ Overdue Items", overdue_count)
+        st.metric("⚠️ Overdue Items", due_counts["overdue"])
     
     st.markdown("---")
     
-    tab1, tab2, tab3 = st.tabs(["🔍 Browse & Search", "📖 My Borrowings", "ℹ️ About"])
+    section = section_nav("student_section", STUDENT_SECTIONS)
+    dashboard_section(section, STUDENT_SECTIONS[section])
+
+def admin_add_resource():
+    """Add Resource section: manual entry with an optional file upload"""
+    st.markdown("### Add New Resource")
     
-    with tab1:
-        st.markdown("### Explore Our Collection")
+    col1, col2 = st.columns(2)
+    with col1:
+        title = st.text_input("Title *", placeholder="Enter resource title")
+        author = st.text_input("Author", placeholder="Enter author name")
+        resource_type = st.selectbox("Resource Type *", ["book", "journal", "audio"])
+    with col2:
+        isbn = st.text_input("ISBN", placeholder="Enter ISBN if available")
+        quantity = st.number_input("Quantity *", min_value=1, value=1)
+        cover_url = st.text_input("Cover Image URL", placeholder="Optional cover image URL")
+    
+    description = st.text_area("Description", placeholder="Brief description of the resource")
+    
+    # File upload section
+    st.markdown("#### 📎 Upload Resource File (Optional)")
+    uploaded_file = st.file_uploader(
+        "Upload PDF, image, or text file", 
+        type=['pdf', 'jpg', 'jpeg', 'png', 'txt', 'md'],
+        help="Upload the actual resource file for preview and download"
+    )
+    
+    file_path = ""
+    if uploaded_file is not None:
+        # Store each selected upload once, not on every rerun while it sits in the uploader
+        if st.session_state.get("stored_upload_id") != uploaded_file.file_id:
+            st.session_state.stored_upload_path = blob_store.store(uploaded_file, uploaded_file.name, uploaded_file.type)
+            st.session_state.stored_upload_id = uploaded_file.file_id
+        file_path = st.session_state.stored_upload_path
         
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            search_query = st.text_input("🔎 Search by title or author", placeholder="Search for books, journals, audio files...")
-        with col2:
-            resource_filter = st.selectbox("Filter by type", ["all", "book", "journal", "audio"])
+        st.success(f"✅ File '{uploaded_file.name}' uploaded successfully!")
+    
+    if st.button("Add Resource", width=200):
+        if title and resource_type:
+            add_resource(title, author, resource_type, isbn, description, quantity, cover_url, file_path)
+            st.success(f"'{title}' added successfully!")
+            st.balloons()
+        else:
+            st.error("Please fill in all required fields!")
+
+def admin_manage_resources():
+    """Manage Resources section: one keyset page of the catalogue"""
+    st.markdown("### Resource Catalog")
+    
+    filter_type = st.selectbox("Filter by type", ["all", "book", "journal", "audio"], key="manage_filter")
+    resources, has_next = fetch_page(
+        "catalog", filter_type,
+        lambda after, limit: get_all_resources(filter_type, after, limit))
+    
+    if resources:
+        import pandas as pd
+        df = pd.DataFrame(resources, columns=["ID", "Title", "Author", "Type", "ISBN", "Available", "Total", "Cover URL", "File Path"])
+        # Show only relevant columns
+        display_df = df[["ID", "Title", "Author", "Type", "ISBN", "Available", "Total"]]
+        st.dataframe(display_df, width=1200, hide_index=True)
         
-        if st.button("Search", width=200) or search_query:
-            if search_query:
-                resources = search_resources(search_query, resource_filter)
+        # Show resources with files
+        resources_with_files = df[df["File Path"].notna() & (df["File Path"] != "")]
+        if not resources_with_files.empty:
+            st.markdown("#### 📎 Resources with Uploaded Files")
+            st.dataframe(resources_with_files[["ID", "Title", "File Path"]], width=1200, hide_index=True)
+        
+        page_controls("catalog", resources, has_next)
+    else:
+        st.info("No resources in the library yet.")
+
+def admin_borrowing_records():
+    """Borrowing Records section: filtered loan history and exports"""
+    st.markdown("### Borrowing Records")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        history_student = st.text_input("Student", placeholder="Username", key="history_student")
+    with col2:
+        history_resource = st.text_input("Resource", placeholder="Title, author or ISBN", key="history_resource")
+    with col3:
+        history_status = st.selectbox("Status", ["all", "active", "returned"], key="history_status")
+    with col4:
+        history_dates = st.date_input("Borrowed between", value=[], key="history_dates")
+    
+    # The range is open-ended while only its first day is picked
+    dates = tuple(history_dates)
+    start, end = borrowing_history.day_bounds(dates[0] if dates else None, dates[1] if len(dates) > 1 else None)
+    filters = {
+        "username": history_student.strip() or None,
+        # Resource text is matched with the catalogue search, capped to its best 100 matches
+        "resource_ids": (tuple(r[0] for r in search_resources(history_resource, limit=100))
+                         if history_resource.strip() else None),
+        "status": history_status,
+        "start": start,
+        "end": end,
+    }
+    borrowings, has_next = fetch_page(
+        "history", tuple(filters.items()),
+        lambda after, limit: get_borrowing_history(**filters, after=after, limit=limit),
+        page_size=borrowing_history.PAGE_SIZE)
+    
+    if borrowings:
+        import pandas as pd
+        df = pd.DataFrame(borrowings, columns=borrowing_history.COLUMNS)
+        st.dataframe(df, width=1200, hide_index=True)
+        page_controls("history", borrowings, has_next)
+    else:
+        st.info("No borrowing records match these filters.")
+    
+    # Exports are written to disk chunk by chunk and downloaded through the file server when it is reachable
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        export_format = st.radio("Export format", ["csv", "parquet"], horizontal=True, key="history_format")
+    with col2:
+        if st.button("📤 Export matching records", key="history_export"):
+            progress_text = st.empty()
+            try:
+                path, count = borrowing_history.export_file(
+                    export_format, progress=lambda n: progress_text.caption(f"Exported {n} records..."),
+                    **filters)
+            except Exception as e:
+                st.error(f"Export failed: {str(e)}")
             else:
-                resources = get_all_resources(resource_filter)
-        else:
-            resources = get_all_resources(resource_filter)
+                st.session_state.history_export_file = (path, count)
+    if st.session_state.get("history_export_file"):
+        path, count = st.session_state.history_export_file
+        if os.path.exists(path):
+            download_link(f"📥 Download {count} records ({os.path.basename(path)})", path,
+                          os.path.basename(path))
+
+def admin_fetch_api():
+    """Fetch from API section: look up one book on Open Library"""
+    st.markdown("### Fetch Resource from External API")
+    st.info("Fetch book information from Open Library API using ISBN or title")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        api_query = st.text_input("Enter ISBN or Book Title", placeholder="e.g., 9780140328721 or 'The Great Gatsby'")
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        search_api = st.button("Fetch from API", use_container_width=True)
+    
+    if search_api and api_query:
+        with st.spinner("Fetching from Open Library..."):
+            # Kept in session state so the result survives the "Add to Library" rerun
+            st.session_state.api_result = fetch_book_from_api(api_query)
+            st.session_state.api_result_query = api_query
+    
+    if st.session_state.get("api_result_query"):
+        book_data = st.session_state.api_result
         
-        if resources:
-            st.markdown(f"**Found {len(resources)} resources**")
+        if book_data:
+            st.success("Book found!")
             
-            # Display resources in cards
-            for resource in resources:
-                resource_id, title, author, res_type, isbn, available, quantity, cover_url, file_path = resource
-                
-                with st.container():
-                    col1, col2 = st.columns([3, 1])
-                    
-                    with col1:
-                        st.markdown(f"""
-                        <div class="resource-card">
-                            <h3 style="margin-top: 0; color: #667eea;">{title}</h3>
-                            <p style="color: rgba(255,255,255,0.8);"><strong>Author:</strong> {author or 'Unknown'}</p>
-                            <p style="color: rgba(255,255,255,0.7);"><strong>Type:</strong> {res_type.title()}</p>
-                            <p style="color: rgba(255,255,255,0.7);"><strong>ISBN:</strong> {isbn or 'N/A'}</p>
-                            <p style="color: {'#86efac' if available > 0 else '#fca5a5'};"><strong>Available:</strong> {available} of {quantity}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col2:
-                        if cover_url:
-                            st.image(cover_url, width=120)
-                    
-                    col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
-                    
-                    with col1:
-                        if available > 0:
-                            if st.button(f"📚 Borrow", key=f"borrow_{resource_id}"):
-                                st.session_state[f'show_borrow_modal_{resource_id}'] = True
-                        else:
-                            st.button("❌ Unavailable", disabled=True, key=f"unavail_{resource_id}")
-                    
-                    with col2:
-                        if file_path:
-                            if st.button("👁️ Preview", key=f"preview_{resource_id}"):
-                                st.session_state[f'show_preview_{resource_id}'] = True
-                                st.pdf(file_path)
-                                
-                    
-                    # Borrowing Modal
-                    if st.session_state.get(f'show_borrow_modal_{resource_id}', False):
-                        st.markdown("---")
-                        st.markdown(f"### 📚 Borrowing: {title}")
-                        
-                        st.info(f"""
-                        **Borrowing Details:**
-                        - **Title:** {title}
-                        - **Author:** {author or 'Unknown'}
-                        - **Type:** {res_type.title()}
-                        - **Loan Period:** 14 days
-                        - **Due Date:** {(datetime.now() + timedelta(days=14)).strftime('%B %d, %Y')}
-                        - **Current Borrowed:** {borrow_count}/5 books
-                        """)
-                        
-                        st.markdown("""
-                        <div style="background: rgba(102, 126, 234, 0.1); padding: 1rem; border-radius: 10px; margin: 1rem 0;">
-                        <h4 style="margin: 0; color: #667eea;">📋 Terms & Conditions</h4>
-                        <ul style="color: rgba(255,255,255,0.8); margin-top: 0.5rem;">
-                            <li>Return the resource on or before the due date</li>
-                            <li>Handle the resource with care</li>
-                            <li>Late returns may incur fines</li>
-                            <li>Resources are non-transferable</li>
-                        </ul>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        col1, col2, col3 = st.columns([1, 1, 2])
-                        with col1:
-                            if st.button("✅ Confirm Borrow", key=f"confirm_{resource_id}", width=200):
-                                success, message = borrow_resource(st.session_state.user_id, resource_id)
-                                if success:
-                                    st.success(f"✅ {message}")
-                                    st.balloons()
-                                    st.session_state[f'show_borrow_modal_{resource_id}'] = False
-                                    st.rerun()
-                                else:
-                                    st.error(f"❌ {message}")
-                        
-                        with col2:
-                            if st.button("❌ Cancel", key=f"cancel_{resource_id}", width=200):
-                                st.session_state[f'show_borrow_modal_{resource_id}'] = False
-                                st.rerun()
-                        
-                        st.markdown("---")
-                    
-                    # Preview Modal
-                    if st.session_state.get(f'show_preview_{resource_id}', False) and file_path:
-                        st.markdown("---")
-                        st.markdown(f"### 👁️ Preview: {title}")
-                        
-                        try:
-                            if file_path.lower().endswith(('.pdf')):
-                                with open(file_path, "rb") as f:
-                                    st.download_button(
-                                        label="📥 Download PDF",
-                                        data=f,
-                                        file_name=f"{title}.pdf",
-                                        mime="application/pdf"
-                                    )
-                                st.info("PDF preview - Click download to view the full document")
-                            elif file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                                st.image(file_path, caption=title)
-                            elif file_path.lower().endswith(('.txt', '.md')):
-                                with open(file_path, "r", encoding='utf-8') as f:
-                                    content = f.read()
-                                    st.text_area("Content Preview", content, height=300)
-                            else:
-                                st.warning("Preview not available for this file type")
-                        except Exception as e:
-                            st.error(f"Error loading preview: {str(e)}")
-                        
-                        if st.button("Close Preview", key=f"close_preview_{resource_id}"):
-                            st.session_state[f'show_preview_{resource_id}'] = False
-                            st.rerun()
-                        
-                        st.markdown("---")
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                if book_data.get('cover_url'):
+                    st.image(book_data['cover_url'], width=200)
+            
+            with col2:
+                st.markdown(f"**Title:** {book_data['title']}")
+                st.markdown(f"**Author:** {book_data['author']}")
+                st.markdown(f"**ISBN:** {book_data['isbn']}")
+                if book_data['description']:
+                    st.markdown(f"**Description:** {book_data['description']}")
+            
+            st.markdown("---")
+            quantity = st.number_input("Number of copies to add", min_value=1, value=1, key="api_quantity")
+            
+            if st.button("Add to Library", width=200):
+                add_resource(
+                    book_data['title'],
+                    book_data['author'],
+                    'book',
+                    book_data['isbn'],
+                    book_data['description'],
+                    quantity,
+                    book_data['cover_url'],
+                    ""  # No file path for API fetched books
+                )
+                st.session_state.api_result_query = None
+                st.success(f"'{book_data['title']}' added to library!")
+                st.balloons()
         else:
-            st.info("No resources found. Try a different search term.")
+            st.error("Book not found in Open Library. Try a different ISBN or title.")
     
-    with tab2:
-        st.markdown("### Your Borrowed Items")
-        
-        if borrowings:
-            for borrowing in borrowings:
-                borrow_id, title, author, res_type, borrowed_at, due_date, status, resource_id = borrowing
-                
-                # Parse due date safely
-                try:
-                    due_date_str = due_date.split('.')[0]  # Remove microseconds
-                    due_date_obj = datetime.strptime(due_date_str, "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    due_date_obj = datetime.strptime(due_date, "%Y-%m-%d %H:%M:%S")
-                
-                days_left = (due_date_obj - datetime.now()).days
-                
-                color = "#86efac" if days_left > 3 else "#fbbf24" if days_left > 0 else "#fca5a5"
-                status_text = "✅ On Time" if days_left > 3 else "⚠️ Due Soon" if days_left > 0 else "🔴 Overdue"
-                
-                st.markdown(f"""
-                <div class="resource-card">
-                    <h3 style="margin-top: 0; color: #667eea;">{title}</h3>
-                    <p style="color: rgba(255,255,255,0.8);"><strong>Author:</strong> {author}</p>
-                    <p style="color: rgba(255,255,255,0.7);"><strong>Type:</strong> {res_type.title()}</p>
-                    <p style="color: rgba(255,255,255,0.7);"><strong>Borrowed:</strong> {borrowed_at.split('.')[0]}</p>
-                    <p style="color: {color};"><strong>Due Date:</strong> {due_date_obj.strftime('%B %d, %Y')} ({abs(days_left)} days {'left' if days_left >= 0 else 'overdue'})</p>
-                    <p style="color: {color}; font-weight: bold;">{status_text}</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    if st.button(f"📤 Return", key=f"return_{borrow_id}"):
-                        if return_resource(borrow_id):
-                            st.success("Resource returned successfully!")
-                            st.rerun()
-                        else:
-                            st.error("Unable to return resource!")
+    lookups = openlibrary.cache_stats()
+    st.caption(f"Lookup cache: {lookups['hits']} hits, {lookups['negative_hits']} cached misses, "
+               f"{lookups['misses']} upstream fetches, {lookups['upstream_errors']} upstream errors")
+
+def admin_bulk_import():
+    """Bulk Import section: import a list of ISBNs"""
+    st.markdown("### Bulk Import by ISBN")
+    st.info("Upload a CSV or text file of ISBNs, or paste them below. Books are looked up on Open Library in batches.")
+    
+    isbn_file = st.file_uploader("ISBN list", type=['csv', 'txt'], key="bulk_isbn_file")
+    isbn_text = st.text_area("Or paste ISBNs", placeholder="9780140328721, 9780747532699 ...", key="bulk_isbn_text")
+    bulk_quantity = st.number_input("Copies of each book", min_value=1, value=1, key="bulk_quantity")
+    
+    if st.button("Import Books", width=200):
+        text = isbn_file.getvalue().decode("utf-8", errors="ignore") if isbn_file is not None else isbn_text
+        isbns = isbn_import.parse_isbns(text)
+        if not isbns:
+            st.error("No ISBNs found in the input!")
         else:
-            st.info("You haven't borrowed any resources yet. Browse the collection to get started!")
+            progress_bar = st.progress(0.0, text=f"Resolving {len(isbns)} ISBNs...")
+            report = isbn_import.import_isbns(
+                isbns, bulk_quantity,
+                progress=lambda done, total: progress_bar.progress(done / total, text=f"Resolved {done}/{total}"))
+            thumbnails.wake()
+            
+            st.success(f"Imported {report['imported']} of {report['requested']} books "
+                       f"in {report['elapsed']:.1f}s ({report['per_second']:.0f} ISBNs/s)")
+            if report['duplicates']:
+                st.warning(f"Already in the catalogue ({len(report['duplicates'])}): {', '.join(report['duplicates'])}")
+            if report['not_found']:
+                st.warning(f"Not found on Open Library ({len(report['not_found'])}): {', '.join(report['not_found'])}")
+            if report['failed']:
+                import pandas as pd
+                st.error(f"{len(report['failed'])} ISBNs failed to resolve")
+                st.dataframe(pd.DataFrame(list(report['failed'].items()), columns=["ISBN", "Error"]),
+                             width=1200, hide_index=True)
+
+def admin_analytics():
+    """Analytics section: circulation figures from the loan rollups"""
+    st.markdown("### Circulation Analytics")
+    
+    days = st.select_slider("Period", options=[30, 90, 180, 365], value=90, key="analytics_days",
+                            format_func=lambda d: f"Last {d} days")
+    report = get_analytics(days)
+    if report['refreshed_at'] is None:
+        st.caption("Loan rollups have not been built yet: start the worker with `python analytics.py run`.")
+    else:
+        st.caption(f"Rollups last refreshed: {datetime.fromtimestamp(report['refreshed_at']).strftime('%Y-%m-%d %H:%M')}")
     
-    with tab3:
-        st.markdown("### About FSS E-Library")
-        st.markdown("""
-        Welcome to **FSS E-Library**, your comprehensive digital library platform!
-        
-        #### Features:
-        - 📚 Browse extensive collection of books, journals, and audio files
-        - 🔍 Smart search functionality
-        - 📖 Easy borrowing and returns with confirmation system
-        - 👁️ Preview resources before borrowing
-        - ⏰ Track due dates and borrowing history
-        - 📊 Real-time borrowing statistics
-        - 📱 Accessible anytime, anywhere
-        
-        #### Borrowing Policy:
-        - **Maximum limit:** 5 resources at a time
-        - **Borrowing period:** 14 days
-        - **Cannot borrow duplicates:** Each resource can only be borrowed once
-        - **Late returns:** May incur fines (contact librarian)
-        - Resources can be renewed if no one is waiting
-        
-        #### Color Coding:
-        - 🟢 **Green:** More than 3 days remaining
-        - 🟡 **Yellow:** Due soon (1-3 days)
-        - 🔴 **Red:** Overdue
-        
-        #### Need Help?
-        Contact the librarian for any assistance.
-        """)
-        
-        st.markdown("---")
-        st.markdown("**Your Library Statistics:**")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Borrowed", borrow_count)
-        with col2:
-            st.metric("Slots Available", 5 - borrow_count)
-        with col3:
-            on_time = sum(1 for b in borrowings if (datetime.strptime(b[5].split('.')[0], "%Y-%m-%d %H:%M:%S") - datetime.now()).days >= 0)
-            st.metric("On-Time Returns", f"{on_time}/{borrow_count}" if borrow_count > 0 else "N/A")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📚 Loans", report['loans'])
+    with col2:
+        st.metric("⏱️ Average Loan", f"{report['avg_loan_days']:.1f} days" if report['avg_loan_days'] is not None else "N/A")
+    with col3:
+        st.metric("🐢 Returned Late", f"{report['late_return_rate']:.0%}" if report['late_return_rate'] is not None else "N/A")
+    with col4:
+        st.metric("⏰ Overdue Now", f"{report['overdue_now']} of {report['active']}",
+                  f"{report['overdue_rate']:.0%} of active loans" if report['overdue_rate'] is not None else None,
+                  delta_color="off")
+    
+    st.markdown("#### Loans and Returns per Day")
+    st.line_chart(report['daily'].rename(columns={"loans": "Loans", "returns": "Returns"}))
+    st.markdown("#### Loans per Week")
+    st.bar_chart(report['weekly'].rename(columns={"loans": "Loans", "returns": "Returns"}), stack=False)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("#### Most Borrowed (All Time)")
+        if report['top_resources'].empty:
+            st.info("No loans yet.")
+        else:
+            st.dataframe(report['top_resources'], hide_index=True)
+    with col2:
+        st.markdown("#### Utilization by Type")
+        utilization = report['utilization']
+        if utilization.empty:
+            st.info("No resources yet.")
+        else:
+            st.bar_chart((utilization['utilization'] * 100).rename("% of copies on loan"))
+            st.caption(" · ".join(f"{t.title()}: {int(row.on_loan)}/{int(row.copies)} copies on loan"
+                                  for t, row in utilization.iterrows()))
+
+def admin_performance():
+    """Performance section: SQL, Open Library and render timings of this app process"""
+    import pandas as pd
+    st.markdown("### Performance")
+    
+    statements = metrics.statements()
+    timings = metrics.summaries()
+    slow, slow_total = metrics.slow_queries()
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🗄️ SQL Statements", sum(s['calls'] for s in statements))
+    with col2:
+        st.metric("⏱️ Time in Database", f"{sum(s['total_ms'] for s in statements) / 1000:.1f} s")
+    with col3:
+        st.metric("🐢 Slow Queries", slow_total)
+    with col4:
+        st.metric("🌐 Open Library Requests", sum(t['count'] for t in timings if t['name'] == "openlibrary_request"))
+    
+    st.markdown("#### Statements by Total Time")
+    if statements:
+        st.dataframe(pd.DataFrame([(s['statement'], s['calls'], s['total_ms'], s['mean_ms'], s['max_ms'], s['rows'], s['errors'])
+                                   for s in statements[:50]],
+                                  columns=["Statement", "Calls", "Total ms", "Mean ms", "Max ms", "Rows", "Errors"]),
+                     width=1200, hide_index=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.2f") for c in ["Total ms", "Mean ms", "Max ms"]})
+    else:
+        st.info("No SQL statements recorded yet.")
+    
+    st.markdown("#### Reruns, Sections and Open Library Calls")
+    if timings:
+        st.dataframe(pd.DataFrame([(t['name'], ", ".join(f"{k}={v}" for k, v in t['labels'].items()),
+                                    t['count'], t['mean_ms'], t['max_ms'], t['total_ms'])
+                                   for t in timings],
+                                  columns=["Timing", "Labels", "Count", "Mean ms", "Max ms", "Total ms"]),
+                     width=1200, hide_index=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ["Mean ms", "Max ms", "Total ms"]})
+    
+    st.markdown("#### Slow Query Log")
+    threshold = st.number_input("Log statements slower than (ms)", min_value=0.0, value=float(metrics.SLOW_QUERY_MS),
+                                step=10.0, key="slow_query_ms")
+    if threshold != metrics.SLOW_QUERY_MS:
+        metrics.configure(slow_query_ms=threshold)
+    if slow:
+        for entry in slow[:20]:
+            with st.expander(f"{entry['ms']:.1f} ms · {datetime.fromtimestamp(entry['at']).strftime('%H:%M:%S')} · "
+                             f"{entry['statement'][:80]}"):
+                st.code(entry['statement'], language="sql")
+                st.code("\n".join(entry['plan']) or "(no plan)", language="text")
+    else:
+        st.caption("No slow statements logged.")
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.download_button("📥 Prometheus Export", metrics.prometheus_text(), file_name="elibrary-metrics.prom",
+                           mime="text/plain")
+    with col2:
+        st.button("🔄 Reset Counters", key="metrics_reset", on_click=metrics.reset)
+    st.caption("Counters cover this app process since its start or the last reset. "
+               "Set METRICS_TOKEN to let Prometheus scrape them from the file server's /metrics.")
+
+# Admin dashboard sections, in navigation order
+ADMIN_SECTIONS = {
+    "➕ Add Resource": admin_add_resource,
+    "📚 Manage Resources": admin_manage_resources,
+    "🔄 Borrowing Records": admin_borrowing_records,
+    "🌐 Fetch from API": admin_fetch_api,
+    "📦 Bulk Import": admin_bulk_import,
+    "📈 Analytics": admin_analytics,
+    "⚡ Performance": admin_performance,
+}
 
 def admin_dashboard():
     """Admin/Librarian dashboard interface"""
@@ -816,137 +1593,48 @@ def admin_dashboard():
     with col4:
         st.metric("👥 Students", stats['total_students'])
     
-    st.markdown("---")
-    
-    tab1, tab2, tab3, tab4 = st.tabs(["➕ Add Resource", "📚 Manage Resources", "🔄 Borrowing Records", "🌐 Fetch from API"])
-    
-    with tab1:
-        st.markdown("### Add New Resource")
-        
-        col1, col2 = st.columns(2)
+    # Precomputed by the overdue_scanner worker, so no loans are scanned here
+    alerts = get_loan_alerts()
+    if alerts:
+        col1, col2, col3 = st.columns(3)
         with col1:
-            title = st.text_input("Title *", placeholder="Enter resource title")
-            author = st.text_input("Author", placeholder="Enter author name")
-            resource_type = st.selectbox("Resource Type *", ["book", "journal", "audio"])
+            st.metric("⏰ Overdue Loans", alerts['overdue'])
         with col2:
-            isbn = st.text_input("ISBN", placeholder="Enter ISBN if available")
-            quantity = st.number_input("Quantity *", min_value=1, value=1)
-            cover_url = st.text_input("Cover Image URL", placeholder="Optional cover image URL")
-        
-        description = st.text_area("Description", placeholder="Brief description of the resource")
-        
-        # File upload section
-        st.markdown("#### 📎 Upload Resource File (Optional)")
-        uploaded_file = st.file_uploader(
-            "Upload PDF, image, or text file", 
-            type=['pdf', 'jpg', 'jpeg', 'png', 'txt', 'md'],
-            help="Upload the actual resource file for preview and download"
-        )
-        
-        file_path = ""
-        if uploaded_file is not None:
-            # Create uploads directory if it doesn't exist
-            import os
-            uploads_dir = "uploads"
-            if not os.path.exists(uploads_dir):
-                os.makedirs(uploads_dir)
-            
-            # Save the uploaded file
-            file_path = os.path.join(uploads_dir, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            st.success(f"✅ File '{uploaded_file.name}' uploaded successfully!")
-        
-        if st.button("Add Resource", width=200):
-            if title and resource_type:
-                add_resource(title, author, resource_type, isbn, description, quantity, cover_url, file_path)
-                st.success(f"'{title}' added successfully!")
-                st.balloons()
-            else:
-                st.error("Please fill in all required fields!")
+            st.metric("📅 Due Within 3 Days", alerts['due_soon'])
+        with col3:
+            st.metric("📬 Unsent Notifications", alerts['pending_notifications'])
+        st.caption(f"Last overdue scan: {datetime.fromtimestamp(alerts['scanned_at']).strftime('%Y-%m-%d %H:%M')}")
+    else:
+        st.caption("Overdue loans are not tracked yet: start the scanner with `python overdue_scanner.py run`.")
     
-    with tab2:
-        st.markdown("### Resource Catalog")
-        
-        filter_type = st.selectbox("Filter by type", ["all", "book", "journal", "audio"], key="manage_filter")
-        resources = get_all_resources(filter_type)
-        
-        if resources:
-            import pandas as pd
-            df = pd.DataFrame(resources, columns=["ID", "Title", "Author", "Type", "ISBN", "Available", "Total", "Cover URL", "File Path"])
-            # Show only relevant columns
-            display_df = df[["ID", "Title", "Author", "Type", "ISBN", "Available", "Total"]]
-            st.dataframe(display_df, width=1200, hide_index=True)
-            
-            # Show resources with files
-            resources_with_files = df[df["File Path"].notna() & (df["File Path"] != "")]
-            if not resources_with_files.empty:
-                st.markdown("#### 📎 Resources with Uploaded Files")
-                st.dataframe(resources_with_files[["ID", "Title", "File Path"]], width=1200, hide_index=True)
-        else:
-            st.info("No resources in the library yet.")
+    with st.expander("🔌 Database Connection Pool"):
+        pool = db.pool_stats()
+        st.caption(f"Backend: {pool['backend']}")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Checkouts", pool['checkouts'])
+        with col2:
+            st.metric("Waits", pool['waits'])
+        with col3:
+            st.metric("Open Connections", f"{pool['open_connections']}/{pool['max_size']}")
     
-    with tab3:
-        st.markdown("### Borrowing Records")
-        
-        borrowings = get_all_borrowings()
-        
-        if borrowings:
+    with st.expander("🗃️ Read Cache"):
+        cache_stats = cache.stats()
+        if cache_stats:
             import pandas as pd
-            df = pd.DataFrame(borrowings, columns=["ID", "Student", "Resource", "Type", "Borrowed", "Due Date", "Status"])
+            df = pd.DataFrame([(name, s['calls'], s['hits'], s['misses'], f"{s['hit_rate']:.0%}")
+                               for name, s in sorted(cache_stats.items())],
+                              columns=["Function", "Calls", "Hits", "Misses", "Hit Rate"])
             st.dataframe(df, width=1200, hide_index=True)
         else:
-            st.info("No borrowing records yet.")
+            st.info("No cached reads yet.")
     
-    with tab4:
-        st.markdown("### Fetch Resource from External API")
-        st.info("Fetch book information from Open Library API using ISBN or title")
-        
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            api_query = st.text_input("Enter ISBN or Book Title", placeholder="e.g., 9780140328721 or 'The Great Gatsby'")
-        with col2:
-            st.markdown("<br>", unsafe_allow_html=True)
-            search_api = st.button("Fetch from API", use_container_width=True)
-        
-        if search_api and api_query:
-            with st.spinner("Fetching from Open Library..."):
-                book_data = fetch_book_from_api(api_query)
-                
-                if book_data:
-                    st.success("Book found!")
-                    
-                    col1, col2 = st.columns([1, 2])
-                    with col1:
-                        if book_data.get('cover_url'):
-                            st.image(book_data['cover_url'], width=200)
-                    
-                    with col2:
-                        st.markdown(f"**Title:** {book_data['title']}")
-                        st.markdown(f"**Author:** {book_data['author']}")
-                        st.markdown(f"**ISBN:** {book_data['isbn']}")
-                        if book_data['description']:
-                            st.markdown(f"**Description:** {book_data['description']}")
-                    
-                    st.markdown("---")
-                    quantity = st.number_input("Number of copies to add", min_value=1, value=1, key="api_quantity")
-                    
-                    if st.button("Add to Library", width=200):
-                        add_resource(
-                            book_data['title'],
-                            book_data['author'],
-                            'book',
-                            book_data['isbn'],
-                            book_data['description'],
-                            quantity,
-                            book_data['cover_url'],
-                            ""  # No file path for API fetched books
-                        )
-                        st.success(f"'{book_data['title']}' added to library!")
-                        st.balloons()
-                else:
-                    st.error("Book not found in Open Library. Try a different ISBN or title.")
+    st.markdown("---")
+    
+    section = section_nav("admin_section", ADMIN_SECTIONS)
+    dashboard_section(section, ADMIN_SECTIONS[section])
 
 if __name__ == "__main__":
-    main()
+    # Wall time of every full rerun, by the page it started on
+    with metrics.timed("app_rerun", page=st.session_state.get("role") or "login"):
+        main()
@@ -0,0 +1,6 @@
+"""Benchmarks for the e-library data layer. Run each module with ``python -m benchmarks.<name>``.
+
+``fixtures`` builds large deterministic databases to run them against;
+``data_functions`` and ``pages`` write JSON reports that ``compare`` checks
+for regressions.
+"""
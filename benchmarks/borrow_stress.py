@@ -0,0 +1,96 @@
+"""Concurrent borrow/return stress test against a single resource.
+
+N worker threads, each acting as its own student, repeatedly borrow and
+return copies of the same resource. Afterwards the available count must equal
+quantity minus active loans and never be negative:
+
+    python -m benchmarks.borrow_stress [--workers 16] [--copies 3] [--seconds 10]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import migrations
+
+
+def worker(app, user_id, resource_id, stop, counts, lock):
+    borrowed = refused = errors = 0
+    while not stop.is_set():
+        try:
+            ok, _ = app.borrow_resource(user_id, resource_id)
+            if ok:
+                borrowed += 1
+                for loan in app.get_user_borrowings(user_id):
+                    app.return_resource(loan[0])
+            else:
+                refused += 1
+        except Exception:
+            errors += 1
+    with lock:
+        counts["borrowed"] += borrowed
+        counts["refused"] += refused
+        counts["errors"] += errors
+
+
+def run(workers, copies, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "stress.db"), max_size=workers)
+        migrations.migrate()
+
+        logging.disable(logging.WARNING)
+        import app
+
+        app.add_resource("Contended Book", "Stress", "book", quantity=copies)
+        resource_id = app.get_all_resources()[0][0]
+        user_ids = []
+        for i in range(workers):
+            app.register_user(f"stress{i}", "secret")
+            user_ids.append(app.authenticate(f"stress{i}", "secret")[0])
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        counts = {"borrowed": 0, "refused": 0, "errors": 0}
+        threads = [threading.Thread(target=worker, args=(app, uid, resource_id, stop, counts, lock))
+                   for uid in user_ids]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        with db.transaction() as c:
+            c.execute("SELECT available, quantity FROM resources WHERE id=?", (resource_id,))
+            available, quantity = c.fetchone()
+            c.execute("SELECT COUNT(*) FROM borrowings WHERE resource_id=? AND status='active'", (resource_id,))
+            active = c.fetchone()[0]
+        pool = db.pool_stats()
+        db.get_pool().close()
+
+    print(f"workers={workers} copies={copies} elapsed={elapsed:.1f}s")
+    print(f"borrows={counts['borrowed']} ({counts['borrowed'] / elapsed:.0f}/s) "
+          f"refused={counts['refused']} errors={counts['errors']}")
+    print(f"pool checkouts={pool['checkouts']} waits={pool['waits']}")
+    ok = available >= 0 and available + active == quantity and counts["errors"] == 0
+    print(f"available={available} active={active} quantity={quantity} -> {'OK' if ok else 'INVARIANT VIOLATED'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent borrow/return stress test")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args(argv)
+    sys.exit(0 if run(args.workers, args.copies, args.seconds) else 1)
+
+
+if __name__ == "__main__":
+    main()
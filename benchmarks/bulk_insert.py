@@ -0,0 +1,72 @@
+"""Rows/sec for add_resources_bulk versus the per-row add_resource path.
+
+    python -m benchmarks.bulk_insert [--rows 100000] [--per-row-rows 10000] [--chunk-size 5000]
+
+The per-row path commits once per resource, so it is timed on a smaller
+sample (--per-row-rows) and reported as a rate.
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import catalog_import
+import db
+import migrations
+
+
+def synthetic_resources(count, seed=7):
+    rng = random.Random(seed)
+    types = ["book", "journal", "audio"]
+    for i in range(count):
+        yield {
+            "title": f"Synthetic Title {i} {rng.randint(1, 10**6)}",
+            "author": f"Author {rng.randint(1, 20000)}",
+            "resource_type": rng.choice(types),
+            "isbn": f"979{i:010d}",
+            "description": "Generated for benchmarking",
+            "quantity": rng.randint(1, 5),
+        }
+
+
+def bench_bulk(path, rows, chunk_size):
+    db.configure(path)
+    migrations.migrate()
+    started = time.perf_counter()
+    result = catalog_import.add_resources_bulk(synthetic_resources(rows), chunk_size)
+    return result["inserted"] / (time.perf_counter() - started)
+
+
+def bench_per_row(path, rows):
+    db.configure(path)
+    migrations.migrate()
+    logging.disable(logging.WARNING)
+    import app
+
+    started = time.perf_counter()
+    for r in synthetic_resources(rows):
+        app.add_resource(r["title"], r["author"], r["resource_type"], r["isbn"], r["description"], r["quantity"])
+    return rows / (time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk versus per-row resource insert throughput")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--per-row-rows", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=catalog_import.CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bulk = bench_bulk(os.path.join(tmp, "bulk.db"), args.rows, args.chunk_size)
+        per_row = bench_per_row(os.path.join(tmp, "per_row.db"), args.per_row_rows)
+        db.get_pool().close()
+
+    print(f"add_resources_bulk: {args.rows} rows, {bulk:,.0f} rows/s")
+    print(f"add_resource:       {args.per_row_rows} rows, {per_row:,.0f} rows/s")
+    print(f"speedup: {bulk / per_row:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare two benchmark reports and flag regressions.
+
+A benchmark regresses when the chosen percentile in the new report exceeds
+the baseline's by more than --threshold (a fraction) and by more than
+--min-ms, so sub-millisecond noise is not reported. Exits non-zero if any
+benchmark regressed:
+
+    python -m benchmarks.compare baseline.json current.json [--metric p95_ms] [--threshold 0.2]
+"""
+import argparse
+import json
+import sys
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "mean_ms", "max_ms"]
+# Fixture parameters that change the data; build time and end date do not
+FIXTURE_KEYS = ["resources", "users", "borrowings", "seed"]
+
+
+def compare(baseline, current, metric="p95_ms", threshold=0.2, min_ms=0.5):
+    """[(name, baseline value, current value, ratio, regressed)] for benchmarks in both reports"""
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        old, new = before[metric], result[metric]
+        ratio = new / old if old else float("inf") if new else 1.0
+        rows.append((name, old, new, ratio, ratio > 1 + threshold and new - old > min_ms))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--metric", choices=METRICS, default="p95_ms")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, e.g. 0.2 for 20%%")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore differences smaller than this")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("suite") != current.get("suite"):
+        sys.exit(f"Reports are from different suites: {baseline.get('suite')} and {current.get('suite')}")
+    if any(baseline["fixture"].get(k) != current["fixture"].get(k) for k in FIXTURE_KEYS):
+        print("Warning: the reports were made with different fixtures")
+
+    rows = compare(baseline, current, args.metric, args.threshold, args.min_ms)
+    print(f"{'benchmark':<44} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, old, new, ratio, regressed in rows:
+        print(f"{name:<44} {old:>10.2f} {new:>10.2f} {ratio - 1:>+8.0%}{'  REGRESSED' if regressed else ''}")
+    regressions = sum(row[4] for row in rows)
+    print(f"{len(rows)} benchmarks compared on {args.metric}, {regressions} regressed")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Latency of each data function in app.py against a fixture database.
+
+Read functions are timed twice: uncached (the undecorated function, so every
+call reaches SQLite) and cached (repeat calls served by cache.py). Borrows
+and returns are timed on students with no loans out, and undone afterwards so
+the fixture is left as it was:
+
+    python -m benchmarks.data_functions [--db bench.db] [--iterations 200] [--json report.json]
+
+Without --db a small temporary fixture is built first (see benchmarks.fixtures).
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+
+import cache
+import db
+import migrations
+from benchmarks import fixtures, timing
+
+
+def _sample(c, sql, params=()):
+    c.execute(sql, params)
+    return [row[0] for row in c.fetchall()]
+
+
+def read_benchmarks(app, rng, count):
+    """(name, function, argument tuples) for every read function, `count` argument tuples each"""
+    with db.transaction() as c:
+        c.execute("SELECT MAX(id) FROM resources")
+        max_resource = c.fetchone()[0]
+        borrowers = _sample(c, "SELECT DISTINCT user_id FROM borrowings WHERE status='active' LIMIT 1000")
+        usernames = _sample(c, "SELECT username FROM users WHERE role='student' LIMIT 1000")
+    types = ["all", "all", "book", "journal", "audio"]
+
+    def search_args():
+        first, second = rng.sample(fixtures.WORDS, 2)
+        # The second word is cut short, as while typing
+        return (f"{first} {second[:max(3, len(second) // 2)]}", rng.choice(types), None, app.PAGE_SIZE + 1)
+
+    return [
+        ("search_resources", app.search_resources, [search_args() for _ in range(count)]),
+        ("get_all_resources", app.get_all_resources,
+         [(rng.choice(types), rng.randrange(max_resource), app.PAGE_SIZE + 1) for _ in range(count)]),
+        ("get_resource", app.get_resource, [(rng.randint(1, max_resource),) for _ in range(count)]),
+        ("get_user_borrowings", app.get_user_borrowings, [(rng.choice(borrowers),) for _ in range(count)]),
+        ("get_library_stats", app.get_library_stats, [() for _ in range(count)]),
+        ("get_borrowing_history", app.get_borrowing_history,
+         [(None, None, "all", None, None, None, 51) for _ in range(count)]),
+        ("get_borrowing_history[student]", app.get_borrowing_history,
+         [(rng.choice(usernames), None, "all", None, None, None, 51) for _ in range(count)]),
+        ("get_loan_alerts", app.get_loan_alerts, [() for _ in range(count)]),
+        ("get_analytics", app.get_analytics, [(90,) for _ in range(count)]),
+    ]
+
+
+def bench_reads(app, rng, iterations, warmup):
+    results = {}
+    for name, func, args in read_benchmarks(app, rng, warmup + iterations):
+        results[name] = timing.summarize(timing.measure(lambda i: func.__wrapped__(*args[i]), iterations, warmup))
+        func(*args[0])
+        results[f"{name}[cached]"] = timing.summarize(timing.measure(lambda i: func(*args[0]), iterations, warmup))
+    return results
+
+
+def bench_borrow_return(app, rng, iterations):
+    """Borrow then return `iterations` loans, each by a different student; removes them afterwards"""
+    with db.transaction() as c:
+        c.execute("SELECT MAX(id) FROM borrowings")
+        last_loan = c.fetchone()[0] or 0
+        students = _sample(c, """SELECT id FROM users WHERE role='student' AND id NOT IN
+                                 (SELECT user_id FROM borrowings WHERE status='active')""")
+        available = _sample(c, "SELECT id FROM resources WHERE available > 1")
+    iterations = min(iterations, len(students), len(available))
+    pairs = list(zip(rng.sample(students, iterations), rng.sample(available, iterations)))
+
+    def borrow(i):
+        ok, message = app.borrow_resource(*pairs[i])
+        if not ok:
+            raise RuntimeError(f"borrow {pairs[i]} refused: {message}")
+
+    borrows = timing.measure(borrow, iterations)
+    with db.transaction() as c:
+        loans = _sample(c, "SELECT id FROM borrowings WHERE id > ? ORDER BY id", (last_loan,))
+    returns = timing.measure(lambda i: app.return_resource(loans[i]), len(loans))
+    with db.transaction() as c:
+        c.execute("DELETE FROM borrowings WHERE id > ?", (last_loan,))
+    cache.bump("catalogue", "borrowings")
+    return {"borrow_resource": timing.summarize(borrows), "return_resource": timing.summarize(returns)}
+
+
+def run(path, iterations, warmup, seed):
+    db.configure(path)
+    migrations.migrate()
+    logging.disable(logging.WARNING)
+    import app
+
+    rng = random.Random(seed)
+    results = bench_reads(app, rng, iterations, warmup)
+    results.update(bench_borrow_return(app, rng, iterations))
+    db.get_pool().close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each data function against a fixture database")
+    parser.add_argument("--db", help="fixture built with benchmarks.fixtures (default: a small temporary one)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report here ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "bench.db")
+            fixtures.build(path, **fixtures.SMALL, progress=lambda message: None)
+        results = run(path, args.iterations, args.warmup, args.seed)
+        fixture = fixtures.describe(path)
+
+    if args.json != "-":
+        timing.print_table(results)
+    if args.json:
+        timing.write_report(args.json, "data_functions", results, fixture,
+                            {"iterations": args.iterations, "warmup": args.warmup, "seed": args.seed})
+
+
+if __name__ == "__main__":
+    main()
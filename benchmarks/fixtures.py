@@ -0,0 +1,208 @@
+"""Deterministic synthetic database fixtures for the benchmarks.
+
+Builds a fully migrated e-library database with the given numbers of
+resources, students and loans. The same seed always yields the same
+catalogue, students and loans; loan times are laid out backwards from --end
+(default: today), so a fixture built on another day has the same loans
+shifted in time:
+
+    python -m benchmarks.fixtures bench.db [--resources 500000] [--users 50000]
+                                  [--borrowings 5000000] [--seed 1] [--end 2026-01-01]
+
+Every student's password is FIXTURE_PASSWORD. The parameters are written
+next to the database as <db>.json and copied into each benchmark report.
+The output may also be the URL of an empty PostgreSQL database, which gets
+no parameters file.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from datetime import date, datetime
+
+import analytics
+import catalog_import
+import db
+import migrations
+import overdue_scanner
+import passwords
+
+FIXTURE_PASSWORD = "secret"
+HISTORY_DAYS = 730
+LOAN_DAYS = 14
+MAX_ACTIVE = 5
+# Only loans made this recently can still be out; the oldest of them are overdue
+ACTIVE_WINDOW_DAYS = 21
+ACTIVE_SHARE = 0.6
+
+WORDS = """statistics probability survey sampling regression inference bayesian estimation data
+analysis econometrics demography census population index price inflation labour market trade
+agriculture health education finance accounting computing algorithms programming networks
+database systems mathematics calculus algebra geometry matrix linear nonlinear models methods
+theory applied introduction principles handbook guide advanced practical modern history africa
+nigeria economy development policy planning research design experiments quality control time
+series forecasting multivariate official national regional rural urban energy climate water
+journal review quarterly annual report bulletin proceedings lectures essays readings""".split()
+FIRST_NAMES = """Adebayo Chinedu Ngozi Funmilayo Ibrahim Aisha Emeka Tunde Kemi Yusuf Amaka Segun
+Halima Olumide Zainab Chiamaka Babatunde Fatima Ifeanyi Bola John Mary David Sarah""".split()
+LAST_NAMES = """Adeyemi Okafor Bello Eze Ogunleye Mohammed Nwosu Balogun Abubakar Okeke Adewale
+Lawal Obi Afolabi Musa Nnamdi Smith Johnson Williams Brown Taylor Wilson""".split()
+TYPES = ["book", "book", "book", "journal", "audio"]
+
+# Built by the benchmarks when no fixture is given; quick enough to make on every run
+SMALL = {"resources": 50_000, "users": 5_000, "borrowings": 500_000}
+
+
+def _resources(count, rng):
+    for i in range(count):
+        yield {
+            "title": " ".join(rng.sample(WORDS, 3)).title() + f" {i}",
+            "author": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "resource_type": rng.choice(TYPES),
+            "isbn": f"979{i:010d}",
+            "description": " ".join(rng.sample(WORDS, 8)),
+            "quantity": rng.randint(1, 5),
+        }
+
+
+def _loans(count, users, quantities, end_ts, rng, out):
+    """Loan rows in borrowing order; `out` collects {resource_id: copies still out}.
+
+    Resources are picked with a skew towards low ids, so some titles are far
+    more popular than others. Loans in the last ACTIVE_WINDOW_DAYS stay out
+    when the student and the resource allow it, under the app's own rules.
+    """
+    span = HISTORY_DAYS * 86400
+    first_ts = end_ts - span
+    active_from = end_ts - ACTIVE_WINDOW_DAYS * 86400
+    resources = len(quantities)
+    held = {}
+    for i in range(count):
+        borrowed_ts = first_ts + (span - 60) * i // count + rng.randrange(60)
+        user_id = rng.randrange(users) + 2      # id 1 is the admin
+        resource_id = int(resources * rng.random() ** 3) + 1
+        due_ts = borrowed_ts + LOAN_DAYS * 86400
+        active = False
+        if borrowed_ts >= active_from and rng.random() < ACTIVE_SHARE:
+            loans = held.setdefault(user_id, set())
+            if (len(loans) < MAX_ACTIVE and resource_id not in loans
+                    and out.get(resource_id, 0) < quantities[resource_id - 1]):
+                loans.add(resource_id)
+                out[resource_id] = out.get(resource_id, 0) + 1
+                active = True
+        if active:
+            returned_ts = None
+        else:
+            # Most come back within the loan period, some late
+            returned_ts = min(borrowed_ts + rng.randint(3600, (LOAN_DAYS + 10) * 86400), end_ts - 1)
+        yield (user_id, resource_id,
+               time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(borrowed_ts)),
+               str(datetime.fromtimestamp(due_ts)),
+               str(datetime.fromtimestamp(returned_ts)) if returned_ts else None,
+               "active" if active else "returned",
+               borrowed_ts, due_ts, returned_ts)
+
+
+def _file(path):
+    """The database file behind a fixture path or sqlite:/// URL, or None for a PostgreSQL URL"""
+    if path.startswith(("postgresql://", "postgres://")):
+        return None
+    return path[len("sqlite:///"):] if path.startswith("sqlite:///") else path
+
+
+def build(path, resources=500_000, users=50_000, borrowings=5_000_000, seed=1, end=None, progress=print):
+    """Create the fixture database at `path` (which must not exist, or be an empty database URL); returns its parameters"""
+    file = _file(path)
+    if file and os.path.exists(file):
+        raise FileExistsError(f"{path} already exists")
+    end = end or date.today()
+    end_ts = int(datetime.combine(end, datetime.min.time()).timestamp())
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    db.configure(path, max_size=2)
+    migrations.migrate()
+    with db.transaction() as c:
+        c.execute("SELECT EXISTS (SELECT 1 FROM resources)")
+        if c.fetchone()[0]:
+            raise FileExistsError(f"{path} already has a catalogue")
+
+    progress(f"resources: {resources}")
+    catalog_import.add_resources_bulk(_resources(resources, rng), skip_duplicates=False)
+    with db.transaction() as c:
+        c.execute("SELECT quantity FROM resources ORDER BY id")
+        quantities = [row[0] for row in c.fetchall()]
+
+    progress(f"students: {users}")
+    # One hash for everyone: hashing each password would dominate the build
+    hashed = passwords.hash_password_sync(FIXTURE_PASSWORD)
+    # Triggers suspended: on PostgreSQL, updating the stats row once per insert slows down quadratically
+    with db.transaction(immediate=True) as c:
+        catalog_import.insert_suspended(
+            c, "users", "INSERT INTO users (username, password, role) VALUES (?, ?, 'student')",
+            ((f"student{i}", hashed) for i in range(users)))
+        c.execute("""UPDATE library_stats
+                     SET total_students = (SELECT COUNT(*) FROM users WHERE role='student')
+                     WHERE id = 1""")
+
+    progress(f"loans: {borrowings}")
+    with db.transaction(immediate=True) as c:
+        out = {}
+        catalog_import.insert_suspended(
+            c, "borrowings",
+            """INSERT INTO borrowings (user_id, resource_id, borrowed_at, due_date, returned_at, status,
+                                       borrowed_ts, due_ts, returned_ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            _loans(borrowings, users, quantities, end_ts, rng, out))
+        c.executemany("UPDATE resources SET available = quantity - ? WHERE id = ?",
+                      ((n, resource_id) for resource_id, n in out.items()))
+        c.execute("""UPDATE library_stats
+                     SET active_borrowings = (SELECT COUNT(*) FROM borrowings WHERE status='active')
+                     WHERE id = 1""")
+
+    progress("rollups and overdue scan")
+    analytics.refresh()
+    overdue_scanner.scan()
+    with db.transaction() as c:
+        c.execute("ANALYZE")
+    db.get_pool().close()
+
+    params = {"resources": resources, "users": users, "borrowings": borrowings, "seed": seed,
+              "end": end.isoformat(), "build_seconds": round(time.perf_counter() - started, 1)}
+    if file:
+        with open(file + ".json", "w") as f:
+            json.dump(params, f, indent=2)
+    return params
+
+
+def describe(path):
+    """The parameters a fixture was built with, or {} if unknown"""
+    file = _file(path)
+    if not file:
+        return {}
+    try:
+        with open(file + ".json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a synthetic benchmark database")
+    parser.add_argument("output", help="path of the database to create, or an empty database's URL")
+    parser.add_argument("--resources", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--borrowings", type=int, default=5_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--end", type=date.fromisoformat, help="day the loan history runs up to, YYYY-MM-DD")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    params = build(args.output, args.resources, args.users, args.borrowings, args.seed, args.end)
+    print(f"Built {args.output} in {params['build_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""End-to-end page timings of the student and admin dashboards with AppTest.
+
+Each dashboard section is opened in a logged-in AppTest session and rerun
+repeatedly. Every rerun executes the whole app script, as a browser rerun
+does. A rerun is timed warm, with the read cache as the previous rerun left
+it, and cold, with every cache scope bumped first so all reads reach SQLite:
+
+    python -m benchmarks.pages [--db bench.db] [--iterations 20] [--json report.json]
+
+Without --db a small temporary fixture is built first (see benchmarks.fixtures).
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+import cache
+import db
+import migrations
+from benchmarks import fixtures, timing
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+SCOPES = ["catalogue", "borrowings", "users", "holds"]
+
+
+def _session(user_id, username, role):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.session_state.logged_in = True
+    at.session_state.user_id = user_id
+    at.session_state.username = username
+    at.session_state.role = role
+    return at
+
+
+def _rerun(at, user_id, cold):
+    if cold:
+        cache.bump(*SCOPES, f"user:{user_id}")
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+
+def bench_dashboard(user_id, username, role, iterations, warmup):
+    """{"<role>: <section>" and "... [cold]": summary} for every section of one dashboard"""
+    import app
+
+    sections = app.ADMIN_SECTIONS if role == "admin" else app.STUDENT_SECTIONS
+    key = "admin_section" if role == "admin" else "student_section"
+    at = _session(user_id, username, role)
+    _rerun(at, user_id, cold=False)
+    results = {}
+    for section in sections:
+        at.radio(key=key).set_value(section)
+        for cold in (False, True):
+            samples = timing.measure(lambda i: _rerun(at, user_id, cold), iterations, warmup)
+            results[f"{role}: {section}{' [cold]' if cold else ''}"] = timing.summarize(samples)
+    return results
+
+
+def run(path, iterations, warmup):
+    db.configure(path)
+    migrations.migrate()
+    logging.disable(logging.WARNING)
+
+    with db.transaction() as c:
+        # The student with the most loans out, so My Borrowings has the most to render
+        c.execute("""SELECT u.id, u.username FROM borrowings b JOIN users u ON u.id = b.user_id
+                     WHERE b.status='active' GROUP BY u.id ORDER BY COUNT(*) DESC, u.id LIMIT 1""")
+        student = c.fetchone() or (None, None)
+        c.execute("SELECT id, username FROM users WHERE role='admin' ORDER BY id LIMIT 1")
+        admin = c.fetchone()
+
+    results = {}
+    if student[0] is not None:
+        results.update(bench_dashboard(*student, "student", iterations, warmup))
+    results.update(bench_dashboard(*admin, "admin", iterations, warmup))
+    db.get_pool().close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time dashboard reruns with Streamlit's AppTest")
+    parser.add_argument("--db", help="fixture built with benchmarks.fixtures (default: a small temporary one)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--json", help="write the report here ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "bench.db")
+            fixtures.build(path, **fixtures.SMALL, progress=lambda message: None)
+        results = run(path, args.iterations, args.warmup)
+        fixture = fixtures.describe(path)
+
+    if args.json != "-":
+        timing.print_table(results)
+    if args.json:
+        timing.write_report(args.json, "pages", results, fixture,
+                            {"iterations": args.iterations, "warmup": args.warmup})
+
+
+if __name__ == "__main__":
+    main()
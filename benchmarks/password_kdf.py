@@ -0,0 +1,98 @@
+"""Login throughput at each password KDF cost setting.
+
+For every setting, users are registered with that cost and N threads log in
+through app.authenticate for a fixed time, so the figures include the
+database lookup and the bounded KDF pool:
+
+    python -m benchmarks.password_kdf [--threads 8] [--seconds 3] [--kdf-workers 2]
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import db
+import migrations
+import passwords
+
+SETTINGS = [
+    ("scrypt", {"n": 2 ** 12, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 13, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 14, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 15, "r": 8, "p": 1}),
+    ("pbkdf2_sha256", {"iterations": 100_000}),
+    ("pbkdf2_sha256", {"iterations": 300_000}),
+    ("pbkdf2_sha256", {"iterations": 600_000}),
+]
+
+
+def worker(app, username, stop, latencies, lock):
+    own = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        if not app.authenticate(username, "secret"):
+            raise RuntimeError(f"login failed for {username}")
+        own.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(own)
+
+
+def run_setting(app, algorithm, cost, threads, seconds):
+    passwords.ALGORITHM = algorithm
+    passwords.COST[algorithm] = cost
+    prefix = f"{algorithm}_{'_'.join(map(str, cost.values()))}"
+    for i in range(threads):
+        app.register_user(f"{prefix}_{i}", "secret")
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+    pool = [threading.Thread(target=worker, args=(app, f"{prefix}_{i}", stop, latencies, lock))
+            for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "logins": len(latencies),
+        "per_second": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Login throughput per password KDF cost")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent login loops")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--kdf-workers", type=int, default=passwords.KDF_WORKERS)
+    args = parser.parse_args(argv)
+
+    passwords.KDF_WORKERS = args.kdf_workers
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "logins.db"), max_size=args.threads)
+        migrations.migrate()
+
+        logging.disable(logging.WARNING)
+        import app
+
+        print(f"threads={args.threads} kdf_workers={args.kdf_workers} seconds={args.seconds}")
+        print(f"{'setting':<34} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        for algorithm, cost in SETTINGS:
+            result = run_setting(app, algorithm, dict(cost), args.threads, args.seconds)
+            label = f"{algorithm} {' '.join(f'{k}={v}' for k, v in cost.items())}"
+            print(f"{label:<34} {result['per_second']:>9.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+        db.get_pool().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Latency sampling and JSON reports shared by the benchmark suites.
+
+A report is one JSON document per run:
+
+    {"suite": "data_functions", "created": "...", "environment": {...},
+     "fixture": {...}, "params": {...},
+     "results": {"<name>": {"n": 200, "mean_ms": ..., "p50_ms": ..., "p95_ms": ...,
+                            "p99_ms": ..., "max_ms": ...}}}
+
+Compare two reports with ``python -m benchmarks.compare``.
+"""
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime
+
+
+def measure(func, iterations, warmup=0):
+    """Call func(i) for i in range(warmup + iterations); returns the timed durations in seconds"""
+    for i in range(warmup):
+        func(i)
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        func(warmup + i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    """Count, mean and p50/p95/p99/max in milliseconds of a list of durations in seconds"""
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {"n": len(ms), "mean_ms": round(statistics.fmean(ms), 3), "p50_ms": round(p50, 3),
+            "p95_ms": round(p95, 3), "p99_ms": round(p99, 3), "max_ms": round(ms[-1], 3)}
+
+
+def environment():
+    return {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "processor": platform.processor() or platform.machine()}
+
+
+def print_table(results):
+    print(f"{'benchmark':<44} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<44} {r['n']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['max_ms']:>9.2f}")
+
+
+def write_report(path, suite, results, fixture=None, params=None):
+    """Write a report; a path of "-" prints it to stdout instead"""
+    report = {
+        "suite": suite,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "fixture": fixture or {},
+        "params": params or {},
+        "results": results,
+    }
+    if path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
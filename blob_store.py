@@ -0,0 +1,148 @@
+"""Content-addressed storage for uploaded resource files.
+
+Uploads are hashed while they are copied to a temporary file, then renamed
+into uploads/blobs/<aa>/<bb>/<sha256><ext>. Identical content is stored once
+and recorded in the ``files`` table, whose ``path`` is what resources.file_path
+points at. Blobs no longer referenced by any resource can be removed with:
+
+    python blob_store.py gc [--dry-run] [--db elibrary.db]
+"""
+import argparse
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import db
+import file_server
+import migrations
+
+BLOBS_DIR = os.path.join(file_server.UPLOADS_DIR, "blobs")
+TMP_DIR = os.path.join(BLOBS_DIR, "tmp")
+CHUNK_SIZE = 1024 * 1024
+
+
+def _blob_path(sha256, ext):
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256[2:4], sha256 + ext).replace(os.sep, "/")
+
+
+def _timestamp(seconds_ago=0):
+    # created_at is UTC, written as "YYYY-MM-DD HH:MM:SS" by SQLite
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def store(fileobj, filename, mime=None):
+    """Store a readable binary file object and return its path under uploads/blobs.
+
+    The content is hashed in CHUNK_SIZE pieces while it is written, so memory
+    use does not depend on the file size. If the same content is already
+    stored, the temporary copy is discarded and the existing path returned;
+    its created_at is refreshed, so gc() gives the new upload the same grace
+    period as a first one.
+    """
+    os.makedirs(TMP_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        sha256 = digest.hexdigest()
+
+        with db.transaction(immediate=True) as c:
+            c.execute("SELECT path FROM files WHERE sha256=?", (sha256,))
+            row = c.fetchone()
+            if row and os.path.exists(row[0]):
+                c.execute("UPDATE files SET created_at = ? WHERE sha256=?", (_timestamp(), sha256))
+                return row[0]
+
+            ext = os.path.splitext(filename)[1].lower()
+            path = _blob_path(sha256, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            tmp_path = None
+            # A row whose blob went missing is rewritten, with a fresh created_at
+            c.execute("""INSERT INTO files (sha256, path, size, mime, original_name)
+                         VALUES (?, ?, ?, ?, ?)
+                         ON CONFLICT (sha256) DO UPDATE SET path = excluded.path, size = excluded.size,
+                             mime = excluded.mime, original_name = excluded.original_name,
+                             created_at = excluded.created_at""",
+                      (sha256, path, size, mime or mimetypes.guess_type(filename)[0] or "application/octet-stream",
+                       filename))
+            return path
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def gc(dry_run=False, min_age=86400):
+    """Delete blobs and files rows no resource references, plus stale temp files.
+
+    Anything younger than `min_age` seconds is kept, so a file uploaded for a
+    resource that has not been saved yet survives. Returns the removed paths.
+    Only files under uploads/blobs are considered, so legacy uploads stored by
+    name are never touched.
+    """
+    removed = []
+    cutoff = _timestamp(min_age)
+    with db.transaction(immediate=True) as c:
+        c.execute("""SELECT f.sha256, f.path FROM files f
+                     WHERE f.created_at < ?
+                       AND NOT EXISTS (SELECT 1 FROM resources r WHERE r.file_path = f.path)""",
+                  (cutoff,))
+        orphans = c.fetchall()
+        if not dry_run:
+            c.executemany("DELETE FROM files WHERE sha256=?", [(sha256,) for sha256, _ in orphans])
+
+        c.execute("SELECT path FROM files")
+        known = {os.path.normpath(row[0]) for row in c.fetchall()}
+
+    # Files are only deleted once their rows are gone for good
+    for _, path in orphans:
+        removed.append(path)
+        if not dry_run and os.path.exists(path):
+            os.remove(path)
+
+    # Blobs on disk with no files row (e.g. a crash between rename and insert),
+    # and leftover temp files; recent ones may belong to an upload in progress
+    cutoff = time.time() - min_age
+    for dirpath, _, filenames in os.walk(BLOBS_DIR):
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(dirpath, filename))
+            if path in known or os.path.getmtime(path) > cutoff:
+                continue
+            removed.append(path)
+            if not dry_run:
+                os.remove(path)
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressed upload storage maintenance")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc_parser = sub.add_parser("gc", help="remove blobs no resource references")
+    gc_parser.add_argument("--dry-run", action="store_true", help="only list what would be removed")
+    gc_parser.add_argument("--min-age", type=int, default=86400, help="keep files younger than this many seconds")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    removed = gc(args.dry_run, args.min_age)
+    for path in removed:
+        print(("would remove " if args.dry_run else "removed ") + path)
+    print(f"{len(removed)} orphaned files")
+
+
+if __name__ == "__main__":
+    main()
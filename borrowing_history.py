@@ -0,0 +1,230 @@
+"""Borrowing history: filtered keyset pages and streamed exports.
+
+Pages are ordered newest first by (borrowed_ts, id) and continue from the id
+of the previous page's last row. Exports read one cursor in fixed-size chunks
+and write each chunk straight to disk, so memory use does not grow with the
+number of loans:
+
+    python borrowing_history.py export history.csv [--student NAME] [--status returned]
+                                [--from 2025-01-01] [--to 2025-12-31] [--db elibrary.db]
+
+A .parquet output path writes Parquet instead of CSV (needs pyarrow).
+"""
+import argparse
+import csv
+import os
+import secrets
+import time
+from datetime import date, datetime, timedelta
+
+import db
+import file_server
+import migrations
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ["ID", "Student", "Resource", "Type", "Borrowed", "Due", "Returned", "Status"]
+PAGE_SIZE = 50
+EXPORT_CHUNK = 5000
+EXPORTS_DIR = os.path.join(file_server.UPLOADS_DIR, "exports")
+EXPORT_MAX_AGE = file_server.URL_TTL
+
+# A Unix time column as local "YYYY-MM-DD HH:MM:SS" text, per SQL dialect
+LOCAL_TIME = {
+    "sqlite": "datetime({}, 'unixepoch', 'localtime')",
+    "postgresql": "to_char(to_timestamp({}), 'YYYY-MM-DD HH24:MI:SS')",
+}
+
+
+def _select():
+    local_time = LOCAL_TIME[db.dialect()]
+    return f"""SELECT b.id, u.username, r.title, r.resource_type,
+                      {local_time.format('b.borrowed_ts')},
+                      {local_time.format('b.due_ts')},
+                      {local_time.format('b.returned_ts')},
+                      b.status
+               FROM borrowings b
+               JOIN users u ON u.id = b.user_id
+               JOIN resources r ON r.id = b.resource_id"""
+
+
+def _where(username=None, resource_ids=None, status=None, start=None, end=None):
+    """WHERE clauses and parameters for the history filters.
+
+    `resource_ids` limits the loans to those resources (an empty sequence
+    matches nothing); `start` and `end` are Unix times bounding borrowed_ts,
+    end exclusive.
+    """
+    clauses, params = [], []
+    if username:
+        clauses.append("b.user_id = (SELECT id FROM users WHERE username = ?)")
+        params.append(username)
+    if resource_ids is not None:
+        resource_ids = list(resource_ids)
+        if resource_ids:
+            clauses.append(f"b.resource_id IN ({','.join('?' * len(resource_ids))})")
+            params.extend(resource_ids)
+        else:
+            # PostgreSQL has no empty IN ()
+            clauses.append("1 = 0")
+    if status and status != "all":
+        clauses.append("b.status = ?")
+        params.append(status)
+    if start is not None:
+        clauses.append("b.borrowed_ts >= ?")
+        params.append(int(start))
+    if end is not None:
+        clauses.append("b.borrowed_ts < ?")
+        params.append(int(end))
+    return clauses, params
+
+
+def history_page(username=None, resource_ids=None, status=None, start=None, end=None, before=None,
+                 limit=PAGE_SIZE):
+    """One page of loans matching the filters, newest first.
+
+    Pass the id of the previous page's last row as `before` to continue; its
+    borrowed_ts is looked up again, so the page boundary stays exact even
+    when several loans share a timestamp.
+    """
+    clauses, params = _where(username, resource_ids, status, start, end)
+    if before is not None:
+        clauses.append("""(b.borrowed_ts < (SELECT borrowed_ts FROM borrowings WHERE id = ?)
+                           OR (b.borrowed_ts = (SELECT borrowed_ts FROM borrowings WHERE id = ?) AND b.id < ?))""")
+        params.extend([before, before, before])
+    sql = _select()
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY b.borrowed_ts DESC, b.id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with db.transaction() as c:
+        c.execute(sql, params)
+        return c.fetchall()
+
+
+def iter_history(chunk_size=EXPORT_CHUNK, **filters):
+    """Yield lists of up to `chunk_size` matching loans, newest first, from a single cursor"""
+    clauses, params = _where(**filters)
+    sql = _select()
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY b.borrowed_ts DESC, b.id DESC"
+    # One read transaction, so the export is a consistent snapshot
+    with db.transaction() as c:
+        # On PostgreSQL a plain cursor would buffer the whole result client-side
+        stream = db.streaming_cursor(c)
+        try:
+            stream.execute(sql, params)
+            while True:
+                rows = stream.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            stream.close()
+
+
+def _write_csv(path, chunks, progress):
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for rows in chunks:
+            writer.writerows(rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+    return written
+
+
+def _write_parquet(path, chunks, progress):
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs the pyarrow package")
+    schema = pyarrow.schema([(COLUMNS[0], pyarrow.int64())] + [(name, pyarrow.string()) for name in COLUMNS[1:]])
+    written = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), schema)],
+                schema=schema))
+            written += len(rows)
+            if progress:
+                progress(written)
+        if not written:
+            writer.write_table(schema.empty_table())
+    return written
+
+
+def export(path, fmt="csv", chunk_size=EXPORT_CHUNK, progress=None, **filters):
+    """Write matching loans to `path` as "csv" or "parquet"; returns the row count.
+
+    `progress(rows_written)` is called after every chunk. The file is written
+    under a temporary name and renamed when complete.
+    """
+    writer = {"csv": _write_csv, "parquet": _write_parquet}[fmt]
+    tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+    try:
+        written = writer(tmp_path, iter_history(chunk_size, **filters), progress)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written
+
+
+def export_file(fmt="csv", progress=None, **filters):
+    """Export into the uploads/exports directory, for download through the file server or Streamlit.
+
+    Returns (path, row count). Exports older than a signed URL's lifetime are
+    removed first.
+    """
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    cutoff = time.time() - EXPORT_MAX_AGE
+    for name in os.listdir(EXPORTS_DIR):
+        old = os.path.join(EXPORTS_DIR, name)
+        if os.path.getmtime(old) < cutoff:
+            os.remove(old)
+    name = f"borrowings-{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}.{fmt}"
+    path = os.path.join(EXPORTS_DIR, name).replace(os.sep, "/")
+    return path, export(path, fmt, progress=progress, **filters)
+
+
+def day_bounds(first=None, last=None):
+    """(start, end) Unix times covering local calendar days first..last inclusive; None stays open"""
+    start = int(datetime.combine(first, datetime.min.time()).timestamp()) if first else None
+    end = int(datetime.combine(last + timedelta(days=1), datetime.min.time()).timestamp()) if last else None
+    return start, end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the borrowing history")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="write matching loans to a .csv or .parquet file")
+    export_parser.add_argument("output")
+    export_parser.add_argument("--student", help="username")
+    export_parser.add_argument("--status", choices=["all", "active", "returned"], default="all")
+    export_parser.add_argument("--from", dest="first", type=date.fromisoformat, help="first borrow date, YYYY-MM-DD")
+    export_parser.add_argument("--to", dest="last", type=date.fromisoformat, help="last borrow date, YYYY-MM-DD")
+    export_parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK)
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    start, end = day_bounds(args.first, args.last)
+    fmt = "parquet" if args.output.lower().endswith(".parquet") else "csv"
+    started = time.perf_counter()
+    written = export(args.output, fmt, args.chunk_size,
+                     lambda n: print(f"\rExported {n} loans", end="", flush=True),
+                     username=args.student, status=args.status, start=start, end=end)
+    print(f"\rExported {written} loans to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
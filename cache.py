@@ -0,0 +1,204 @@
+"""In-process read cache invalidated by write generations.
+
+Cached read functions fold the current generation of every scope they depend
+on into their cache key; write paths bump the scopes they change, so the next
+read misses and reloads.
+
+Invalidations are shared through the database, so replicas behind a load
+balancer (or the app and its worker processes) invalidate each other: inside
+its transaction, a write path calls publish(c, ...), which stamps its scopes
+in the ``cache_scopes`` table with a new version number, and after the commit
+it calls bump(...) for this process. Every process polls that table for newer
+versions at most once per SYNC_INTERVAL before a cached read, so a write in
+another process is seen within about SYNC_INTERVAL seconds; TTL remains as a
+backstop. Scopes used by the app:
+
+    "catalogue"        resources and their availability
+    "borrowings"       the loan table as a whole
+    "users"            user accounts
+    "holds"            the waiting lists, and so every queue position
+    "user:<id>"        one student's loans
+"""
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import db
+
+TTL = 60  # seconds; expires entries even if no invalidation arrives
+SYNC_INTERVAL = 1.0  # seconds; bounds staleness from writes made by other processes
+# seconds; on PostgreSQL a version is drawn just before its commit, so commits
+# can land slightly out of version order. Polls re-read versions this recent
+SETTLE = 1.0
+
+# Stamps scopes with a new version. SQLite serializes writers, so MAX + 1 is
+# safe inside the writer's transaction; PostgreSQL writers draw from a sequence,
+# again on conflict, so a scope's version only grows
+_PUBLISH = {
+    "sqlite": """INSERT INTO cache_scopes (scope, version)
+                 VALUES (?, (SELECT COALESCE(MAX(version), 0) + 1 FROM cache_scopes))
+                 ON CONFLICT (scope) DO UPDATE SET version = excluded.version
+                 RETURNING version""",
+    "postgresql": """INSERT INTO cache_scopes (scope, version) VALUES (?, nextval('cache_scopes_version_seq'))
+                     ON CONFLICT (scope) DO UPDATE SET version = nextval('cache_scopes_version_seq')
+                     RETURNING version""",
+}
+
+_lock = threading.Lock()
+_generations = defaultdict(int)
+_calls = defaultdict(int)
+_misses = defaultdict(int)
+# Entries live here rather than in the decorator because Streamlit re-executes
+# app.py, and so re-decorates its functions, on every rerun
+_entries = defaultdict(OrderedDict)
+_entries_lock = threading.Lock()
+# Polling state: versions up to _floor are final and never re-read; _seen is
+# the version last applied (or published here) per scope above it, and _marks
+# the highest version known at each recent poll, oldest first
+_sync_lock = threading.Lock()
+_synced_at = 0.0
+_floor = None
+_seen = {}
+_marks = deque()
+# Versions published by this thread's current transaction, until its bump()
+_pending = threading.local()
+
+
+def generation(scope):
+    with _lock:
+        return _generations[scope]
+
+
+def publish(c, *scopes):
+    """Stamp `scopes` as changed for every process, inside the writer's transaction on cursor `c`"""
+    versions = {}
+    for scope in set(scopes):
+        c.execute(_PUBLISH[db.dialect()], (scope,))
+        versions[scope] = c.fetchone()[0]
+    _pending.versions = versions
+
+
+def bump(*scopes):
+    """Invalidate every cached read in this process that depends on one of `scopes`; call after the commit"""
+    versions = getattr(_pending, "versions", {})
+    _pending.versions = {}
+    with _lock:
+        for scope in scopes:
+            _generations[scope] += 1
+            # Its own version need not invalidate again when polled back
+            if scope in versions and _floor is not None and versions[scope] > _seen.get(scope, _floor):
+                _seen[scope] = versions[scope]
+
+
+def sync():
+    """Apply invalidations published by other processes; polls at most every SYNC_INTERVAL"""
+    global _synced_at, _floor
+    now = time.monotonic()
+    if now - _synced_at < SYNC_INTERVAL or not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        with db.transaction() as c:
+            if _floor is None:
+                # Nothing is cached before the first poll, so older versions do not matter
+                c.execute("SELECT COALESCE(MAX(version), 0) FROM cache_scopes")
+                latest, changed = c.fetchone()[0], []
+            else:
+                c.execute("SELECT scope, version FROM cache_scopes WHERE version > ?", (_floor,))
+                changed = c.fetchall()
+                latest = max([_marks[-1][1] if _marks else _floor] + [version for _, version in changed])
+        with _lock:
+            if _floor is None:
+                _floor = latest
+            for scope, version in changed:
+                if version > _seen.get(scope, _floor):
+                    _generations[scope] += 1
+                    _seen[scope] = version
+            _marks.append((now, latest))
+            while _marks and now - _marks[0][0] >= SETTLE:
+                _floor = max(_floor, _marks.popleft()[1])
+            for scope in [scope for scope, version in _seen.items() if version <= _floor]:
+                del _seen[scope]
+        _synced_at = now
+    finally:
+        _sync_lock.release()
+
+
+def clear():
+    """Drop every cached entry and the polling state, e.g. after pointing db at another database"""
+    global _synced_at, _floor
+    with _entries_lock:
+        for entries in _entries.values():
+            entries.clear()
+    with _lock:
+        _generations.clear()
+        _seen.clear()
+        _marks.clear()
+        _synced_at = 0.0
+        _floor = None
+
+
+def record_call(name):
+    with _lock:
+        _calls[name] += 1
+
+
+def record_miss(name):
+    with _lock:
+        _misses[name] += 1
+
+
+def stats():
+    """{function name: {"calls", "hits", "misses", "hit_rate"}} for this process"""
+    with _lock:
+        result = {}
+        for name, calls in _calls.items():
+            misses = min(_misses[name], calls)
+            result[name] = {
+                "calls": calls,
+                "hits": calls - misses,
+                "misses": misses,
+                "hit_rate": (calls - misses) / calls if calls else 0.0,
+            }
+        return result
+
+
+def cached_read(*scopes, max_entries=256, ttl=TTL):
+    """Cache a read function's results per argument tuple in a bounded LRU.
+
+    Each scope is a scope name, or a callable that derives one from the
+    function's arguments (e.g. one student's borrowings). Entries expire after
+    `ttl` seconds even without a bump. Callers get a shallow copy of the
+    cached value.
+    """
+    def decorator(func):
+        name = func.__name__
+        entries = _entries[name]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record_call(name)
+            sync()
+            generations = tuple(generation(scope(*args, **kwargs) if callable(scope) else scope)
+                                for scope in scopes)
+            key = (generations, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with _entries_lock:
+                entry = entries.get(key)
+                if entry and entry[0] > now:
+                    entries.move_to_end(key)
+                    return copy.copy(entry[1])
+
+            record_miss(name)
+            value = func(*args, **kwargs)
+            with _entries_lock:
+                entries[key] = (now + ttl, value)
+                entries.move_to_end(key)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return copy.copy(value)
+
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    return decorator
@@ -0,0 +1,221 @@
+"""Bulk catalogue loading.
+
+add_resources_bulk() inserts many resources in one transaction with
+executemany, skipping ISBNs that already exist. Once a load grows large
+relative to the catalogue, full-text and secondary index maintenance is
+suspended for the rest of it and caught up once at the end; small batches
+keep the indexes and triggers in place, since rebuilding them covers the whole
+table. Run this module to import a CSV or JSONL catalogue dump:
+
+    python catalog_import.py catalogue.csv [--chunk-size 5000] [--allow-duplicates] [--db elibrary.db]
+"""
+import argparse
+import csv
+import itertools
+import json
+import time
+
+import cache
+import db
+import migrations
+
+CHUNK_SIZE = 5000
+
+FIELDS = ["title", "author", "resource_type", "isbn", "description", "quantity", "cover_url", "file_path"]
+
+# Per-row work suspended during a bulk load and redone in one pass afterwards
+DEFERRED_TRIGGERS = ["resources_fts_insert", "stats_resources_insert", "thumbnails_enqueue_insert"]
+DEFERRED_INDEXES = ["idx_resources_type", "idx_resources_search"]
+# Rows a load inserts with the indexes and triggers in place before suspending
+# them: at least SUSPEND_MIN_ROWS, or SUSPEND_SHARE of the catalogue if larger
+SUSPEND_MIN_ROWS = 10_000
+SUSPEND_SHARE = 0.1
+
+
+def _row(resource):
+    """Insert parameters for a resource dict, applying add_resource's defaults"""
+    quantity = int(resource.get("quantity") or 1)
+    return (resource["title"], resource.get("author") or "", resource.get("resource_type") or "book",
+            resource.get("isbn") or "", resource.get("description") or "", quantity, quantity,
+            resource.get("cover_url") or "", resource.get("file_path") or "")
+
+
+def _existing_isbns(c, isbns):
+    found = set()
+    for start in range(0, len(isbns), 500):
+        chunk = isbns[start:start + 500]
+        c.execute(f"SELECT isbn FROM resources WHERE isbn IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(row[0] for row in c.fetchall())
+    return found
+
+
+def table_objects(c, table):
+    """Names of the triggers and the indexes other than constraints' on `table`, which a bulk load can drop"""
+    if db.dialect() == "postgresql":
+        c.execute("""SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = ?
+                       AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = ?::regclass)
+                     UNION ALL
+                     SELECT tgname FROM pg_trigger WHERE tgrelid = ?::regclass AND NOT tgisinternal""",
+                  (table, table, table))
+    else:
+        c.execute("""SELECT name FROM sqlite_master
+                     WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL""", (table,))
+    return [row[0] for row in c.fetchall()]
+
+
+def drop_object(c, name):
+    """Drop a trigger or index if it exists; returns the SQL that recreates it, or None"""
+    if db.dialect() == "postgresql":
+        # Dropping takes an exclusive lock on the table, so reads of it wait for the load
+        c.execute("SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND indexname = ?",
+                  (name,))
+        row = c.fetchone()
+        if row:
+            c.execute(f"DROP INDEX {name}")
+            return row[0]
+        c.execute("""SELECT pg_get_triggerdef(t.oid), t.tgrelid::regclass::text FROM pg_trigger t
+                     WHERE t.tgname = ? AND NOT t.tgisinternal""", (name,))
+        row = c.fetchone()
+        if row:
+            c.execute(f"DROP TRIGGER {name} ON {row[1]}")
+            return row[0]
+        return None
+    c.execute("SELECT type, sql FROM sqlite_master WHERE name=?", (name,))
+    row = c.fetchone()
+    if row:
+        c.execute(f"DROP {row[0].upper()} {name}")
+        return row[1]
+    return None
+
+
+def insert_suspended(c, table, sql, rows):
+    """executemany `sql` over `rows` with the table's triggers and non-constraint indexes dropped meanwhile.
+
+    The triggers' per-row work is skipped rather than deferred, so the caller
+    redoes whatever of it it needs, e.g. the library_stats totals.
+    """
+    saved = [drop_object(c, name) for name in table_objects(c, table)]
+    c.executemany(sql, rows)
+    for statement in saved:
+        c.execute(statement)
+
+
+def add_resources_bulk(resources, chunk_size=CHUNK_SIZE, skip_duplicates=True):
+    """Insert an iterable of resource dicts in a single transaction.
+
+    Each dict needs a title; other keys follow add_resource's parameters.
+    Rows whose non-empty ISBN is already in the catalogue (or earlier in the
+    same batch) are skipped unless skip_duplicates is False. Returns
+    {"inserted": n, "duplicates": [isbn, ...]}.
+    """
+    inserted = 0
+    duplicates = []
+    rows = iter(resources)
+    with db.transaction(immediate=True) as c:
+        # MAX(id) stands in for the catalogue size; COUNT(*) would read the whole table
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM resources")
+        threshold = max(SUSPEND_MIN_ROWS, int(c.fetchone()[0] * SUSPEND_SHARE))
+        saved = None
+
+        while True:
+            chunk = [_row(r) for r in itertools.islice(rows, chunk_size)]
+            if not chunk:
+                break
+            if saved is None and inserted + len(chunk) > threshold:
+                # Rows inserted so far were indexed as they went; only later ones need catching up
+                saved = {}
+                for name in DEFERRED_TRIGGERS + DEFERRED_INDEXES:
+                    sql = drop_object(c, name)
+                    if sql:
+                        saved[name] = sql
+                c.execute("SELECT COALESCE(MAX(id), 0) FROM resources")
+                first_new_id = c.fetchone()[0]
+            if skip_duplicates:
+                isbns = [r[3] for r in chunk if r[3]]
+                # Earlier chunks are already in the table, so this also catches repeats within the load
+                taken = _existing_isbns(c, isbns)
+                kept = []
+                for r in chunk:
+                    if r[3] and r[3] in taken:
+                        duplicates.append(r[3])
+                        continue
+                    if r[3]:
+                        taken.add(r[3])
+                    kept.append(r)
+                chunk = kept
+            c.executemany("""INSERT INTO resources
+                             (title, author, resource_type, isbn, description, quantity, available, cover_url, file_path)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", chunk)
+            inserted += len(chunk)
+
+        # Catch up on the suspended per-row work for the new id range only
+        saved = saved or {}
+        if "resources_fts_insert" in saved:
+            c.execute("""INSERT INTO resources_fts (rowid, title, author, description, isbn)
+                         SELECT id, title, author, description, isbn FROM resources WHERE id > ?""",
+                      (first_new_id,))
+        if "stats_resources_insert" in saved:
+            c.execute("""UPDATE library_stats
+                         SET total_resources = total_resources + (SELECT COUNT(*) FROM resources WHERE id > ?),
+                             total_copies = total_copies
+                                            + (SELECT COALESCE(SUM(quantity), 0) FROM resources WHERE id > ?)
+                         WHERE id = 1""", (first_new_id, first_new_id))
+        if "thumbnails_enqueue_insert" in saved:
+            c.execute("""INSERT INTO thumbnails (resource_id)
+                         SELECT id FROM resources
+                         WHERE id > ? AND (cover_url <> '' OR lower(file_path) LIKE '%.pdf')
+                         ON CONFLICT (resource_id) DO UPDATE SET status = 'pending', attempts = 0, error = NULL,
+                             updated_at = 0""",
+                      (first_new_id,))
+        for sql in saved.values():
+            c.execute(sql)
+        cache.publish(c, "catalogue")
+
+    cache.bump("catalogue")
+    return {"inserted": inserted, "duplicates": duplicates}
+
+
+def read_catalogue(path):
+    """Resource dicts from a CSV (with a header row) or JSONL file"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a CSV or JSONL catalogue dump")
+    parser.add_argument("file", help=f"CSV with a header row or JSONL; columns/keys: {', '.join(FIELDS)}")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--allow-duplicates", action="store_true", help="insert rows whose ISBN already exists")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    started = time.perf_counter()
+    invalid = 0
+
+    def valid_rows():
+        nonlocal invalid
+        for resource in read_catalogue(args.file):
+            if resource.get("title"):
+                yield resource
+            else:
+                invalid += 1
+
+    result = add_resources_bulk(valid_rows(), args.chunk_size, not args.allow_duplicates)
+    elapsed = time.perf_counter() - started
+    print(f"Inserted {result['inserted']} resources in {elapsed:.1f}s "
+          f"({result['inserted'] / elapsed if elapsed else 0:.0f} rows/s)")
+    if result["duplicates"]:
+        print(f"Skipped {len(result['duplicates'])} duplicate ISBNs")
+    if invalid:
+        print(f"Skipped {invalid} rows without a title")
+
+
+if __name__ == "__main__":
+    main()
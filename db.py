@@ -0,0 +1,257 @@
+import functools
+import os
+import random
+import sqlite3
+import threading
+import time
+import queue
+from contextlib import contextmanager
+
+import metrics
+
+try:
+    import postgres_backend
+except ImportError:  # psycopg is not installed; only SQLite is available
+    postgres_backend = None
+
+# A SQLite file path (optionally as sqlite:///path) or a postgresql:// URL,
+# which selects the PostgreSQL backend in postgres_backend.py
+DB_PATH = os.environ.get("DATABASE_URL", "elibrary.db")
+
+# Per-connection tuning applied once when a connection is opened
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,       # ~20 MB page cache
+    "mmap_size": 268435456,     # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+# Constraint violations from either backend, e.g. a duplicate username
+IntegrityError = (sqlite3.IntegrityError,) + ((postgres_backend.IntegrityError,) if postgres_backend else ())
+
+
+class PoolTimeout(RuntimeError):
+    """No pooled connection became free within the pool's timeout"""
+
+
+class SQLiteBackend:
+    """One SQLite database file; every connection gets PRAGMAS, so the file runs in WAL mode"""
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               factory=metrics.InstrumentedConnection if metrics.SQL_METRICS else sqlite3.Connection)
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def begin(self, conn, immediate):
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+    def is_busy(self, error):
+        message = str(error)
+        return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+    def streaming_cursor(self, conn):
+        # SQLite cursors already step through their rows one at a time
+        return conn.cursor()
+
+
+def open_backend(target):
+    """Backend for a SQLite path (or sqlite:///path) or a postgres(ql):// URL"""
+    if target.startswith(("postgresql://", "postgres://")):
+        if postgres_backend is None:
+            raise RuntimeError("A PostgreSQL database needs the psycopg package")
+        return postgres_backend.PostgresBackend(target)
+    if target.startswith("sqlite:///"):
+        target = target[len("sqlite:///"):]
+    return SQLiteBackend(target)
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived database connections opened by a backend.
+
+    Streamlit runs every rerun of every session on its own script thread, so
+    connections are checked out for the duration of a unit of work and handed
+    back afterwards instead of being bound to a thread.
+    """
+
+    def __init__(self, backend, max_size=8, timeout=10.0):
+        self.backend = backend
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._checkouts = 0
+        self._waits = 0
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if below max_size"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._open < self.max_size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    conn = self.backend.connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                with self._lock:
+                    self._waits += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout("Timed out waiting for a database connection")
+        with self._lock:
+            self._checkouts += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction.
+
+        A connection that cannot even roll back (e.g. the server went away) is
+        closed instead, and a fresh one is opened on a later checkout.
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._open -= 1
+
+    def stats(self):
+        """Pool metrics: checkouts, waits, open and idle connections"""
+        with self._lock:
+            return {
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "open_connections": self._open,
+                "idle_connections": self._idle.qsize(),
+                "max_size": self.max_size,
+                "backend": self.backend.name,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(open_backend(DB_PATH))
+    return _pool
+
+
+def configure(path=None, **options):
+    """Point the process-wide pool at another database (a path or URL, see DB_PATH) or change pool options"""
+    global _pool, DB_PATH
+    with _pool_lock:
+        if path is not None:
+            DB_PATH = path
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(open_backend(DB_PATH), **options)
+    return _pool
+
+
+def dialect():
+    """Name of the configured backend's SQL dialect: sqlite or postgresql"""
+    return get_pool().backend.name
+
+
+def streaming_cursor(c):
+    """A cursor on c's connection that fetches large results from the server as they are read"""
+    return get_pool().backend.streaming_cursor(c.connection)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """Run a unit of work in a single transaction and yield a cursor.
+
+    Commits on success and rolls back on any exception. Pass immediate=True to
+    take the write lock up front (BEGIN IMMEDIATE) for read-modify-write work;
+    on PostgreSQL this is an advisory lock shared by every replica.
+    """
+    pool = get_pool()
+    with pool.connection() as conn:
+        pool.backend.begin(conn, immediate)
+        c = conn.cursor()
+        try:
+            yield c
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            c.close()
+
+
+def retry_on_busy(attempts=5, backoff=0.05):
+    """Retry a unit of work when the database reports a transient conflict.
+
+    That is a locked or busy database on SQLite, and a serialization failure,
+    deadlock or lock timeout on PostgreSQL. busy_timeout (lock_timeout) already
+    waits inside the database; this covers the cases where the wait runs out
+    under heavy write contention. Delays grow exponentially with jitter:
+    backoff, 2*backoff, 4*backoff, ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == attempts - 1 or not get_pool().backend.is_busy(e):
+                        raise
+                    time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+        return wrapper
+    return decorator
+
+
+def pool_stats():
+    """Metrics for the process-wide connection pool"""
+    return get_pool().stats()
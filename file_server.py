@@ -0,0 +1,256 @@
+"""Streaming file endpoint for uploaded resources.
+
+A small threaded HTTP server, started once per process, serves files from the
+uploads directory in fixed-size chunks with HTTP Range support, so viewers and
+downloads never pull a whole file into server memory. URLs are HMAC-signed
+and expire, since the endpoint sits outside the app's login.
+
+Environment:
+    UPLOADS_DIR                           root of uploads, blobs, thumbnails and exports
+                                          (default ./uploads); replicas must share it,
+                                          e.g. an NFS or other shared mount at the same path
+    FILE_SERVER_HOST / FILE_SERVER_PORT   bind address (default 127.0.0.1:8502)
+    FILE_SERVER_URL                       base URL as seen by browsers, e.g.
+                                          https://library.example.org/files-proxy
+    FILE_SERVER_SECRET                    signing key shared by all replicas
+    METRICS_TOKEN                         enables GET /metrics (Prometheus text, see
+                                          metrics.py) for requests sending it as a bearer token
+
+Signed links point at FILE_SERVER_URL, typically a reverse-proxy path to
+FILE_SERVER_HOST:FILE_SERVER_PORT; keep the port fixed. Without it there is no
+address browsers are known to reach, so no links are issued: enabled() is
+False and the app delivers files itself, through Streamlit, as it did before
+the file server existed. For a local setup, FILE_SERVER_URL=http://localhost:8502
+turns streaming on.
+"""
+import hashlib
+import hmac
+import logging
+import mimetypes
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import metrics
+
+UPLOADS_DIR = os.environ.get("UPLOADS_DIR", "uploads")
+HOST = os.environ.get("FILE_SERVER_HOST", "127.0.0.1")
+PORT = int(os.environ.get("FILE_SERVER_PORT", "8502"))
+PUBLIC_URL = os.environ.get("FILE_SERVER_URL")
+CHUNK_SIZE = 64 * 1024
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+URL_TTL = 3600
+PREVIEW_BYTES = 16 * 1024
+
+_SECRET = os.environ.get("FILE_SERVER_SECRET", "").encode() or secrets.token_bytes(32)
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+log = logging.getLogger(__name__)
+
+_server = None
+_base_url = None
+_server_lock = threading.Lock()
+
+
+def _root():
+    return os.path.realpath(UPLOADS_DIR)
+
+
+def _relative(file_path):
+    """Path of an upload relative to the uploads directory, or ValueError if outside it"""
+    root = _root()
+    full = os.path.realpath(file_path)
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError(f"{file_path} is outside the uploads directory")
+    return os.path.relpath(full, root).replace(os.sep, "/")
+
+
+def _sign(rel, expires, name):
+    message = f"{rel}\n{expires}\n{name}".encode()
+    return hmac.new(_SECRET, message, hashlib.sha256).hexdigest()
+
+
+def enabled():
+    """Whether files can be linked to: only once FILE_SERVER_URL says where browsers reach the server"""
+    return bool(PUBLIC_URL)
+
+
+def signed_url(file_path, download_name=None, ttl=URL_TTL):
+    """Expiring URL for an uploaded file; with download_name it is served as an attachment.
+
+    The expiry is rounded to a ttl-sized bucket, so the same file gets the same
+    URL on every rerun within the bucket and browsers reuse their cached copy.
+    A URL stays valid for between ttl and 2 * ttl seconds. Raises RuntimeError
+    when FILE_SERVER_URL is not set (see enabled()).
+    """
+    if not enabled():
+        raise RuntimeError("FILE_SERVER_URL is not set, so browsers have no address for the file server")
+    base = start()
+    rel = _relative(file_path)
+    expires = int((time.time() // ttl + 2) * ttl)
+    name = download_name or ""
+    url = f"{base}/files/{quote(rel)}?expires={expires}&sig={_sign(rel, expires, name)}"
+    if name:
+        url += f"&name={quote(name)}"
+    return url
+
+
+def read_text_page(file_path, page, page_bytes=PREVIEW_BYTES):
+    """(text, has_more) for one fixed-size page of a text file, reading only that page"""
+    with open(file_path, "rb") as f:
+        f.seek(page * page_bytes)
+        data = f.read(page_bytes + 1)
+    # Characters split across a page boundary are dropped rather than garbled
+    return data[:page_bytes].decode("utf-8", errors="ignore"), len(data) > page_bytes
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _cors(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers", "Range")
+        self.send_header("Access-Control-Expose-Headers", "Accept-Ranges, Content-Length, Content-Range")
+
+    def _error(self, status, extra_headers=()):
+        self.send_response(status)
+        self._cors()
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._cors()
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/metrics":
+            return self._metrics()
+        self._serve(send_body=True)
+
+    def _metrics(self):
+        """This process's counters for a Prometheus scrape; off unless METRICS_TOKEN is set"""
+        if not METRICS_TOKEN:
+            return self._error(404)
+        if not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            return self._error(401, [("WWW-Authenticate", "Bearer")])
+        body = metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _resolve(self):
+        """Filesystem path for a valid, unexpired signed request, else None"""
+        url = urlparse(self.path)
+        if not url.path.startswith("/files/"):
+            return None, None
+        rel = unquote(url.path[len("/files/"):])
+        query = parse_qs(url.query)
+        try:
+            expires = int(query["expires"][0])
+            sig = query["sig"][0]
+        except (KeyError, ValueError):
+            return None, None
+        name = query.get("name", [""])[0]
+        if expires < time.time() or not hmac.compare_digest(sig, _sign(rel, expires, name)):
+            return None, None
+        try:
+            full = os.path.join(_root(), rel)
+            _relative(full)
+        except ValueError:
+            return None, None
+        return full, name
+
+    def _serve(self, send_body):
+        path, name = self._resolve()
+        if path is None:
+            return self._error(403)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return self._error(404)
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = 200
+            header = self.headers.get("Range")
+            if header:
+                match = _RANGE.match(header.strip())
+                if not match or not (match.group(1) or match.group(2)):
+                    return self._error(416, [("Content-Range", f"bytes */{size}")])
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    # Suffix range: the last N bytes
+                    start = max(size - int(match.group(2)), 0)
+                if start > end or start >= size:
+                    return self._error(416, [("Content-Range", f"bytes */{size}")])
+                status = 206
+
+            length = end - start + 1
+            self.send_response(status)
+            self._cors()
+            self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Cache-Control", "private, max-age=3600")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            if name:
+                self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(name)}")
+            self.end_headers()
+            if not send_body:
+                return
+
+            f.seek(start)
+            remaining = length
+            try:
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # Viewers routinely abort range requests they no longer need
+                self.close_connection = True
+
+
+def start():
+    """Start the file server once per process and return its public base URL"""
+    global _server, _base_url
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                try:
+                    server = ThreadingHTTPServer((HOST, PORT), _Handler)
+                except OSError:
+                    if PUBLIC_URL:
+                        raise
+                    # Port taken (e.g. a second app process on this host); without FILE_SERVER_URL
+                    # the server only answers /metrics, so any free port will do
+                    server = ThreadingHTTPServer((HOST, 0), _Handler)
+                    log.warning("File server port %s is in use, serving on %s instead",
+                                PORT, server.server_address[1])
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, name="file-server", daemon=True).start()
+                _base_url = (PUBLIC_URL or f"http://localhost:{server.server_address[1]}").rstrip("/")
+                _server = server
+    return _base_url
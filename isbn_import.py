@@ -0,0 +1,111 @@
+"""Bulk catalogue import from a list of ISBNs via Open Library.
+
+ISBNs are resolved in multi-bibkey batches on a bounded thread pool and the
+books found are inserted in a single transaction, skipping ISBNs already in
+the catalogue:
+
+    python isbn_import.py isbns.csv [--quantity 1] [--workers 4] [--batch-size 50] [--db elibrary.db]
+"""
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import catalog_import
+import db
+import migrations
+import openlibrary
+
+BATCH_SIZE = 50
+WORKERS = 4
+
+
+def parse_isbns(text):
+    """Unique ISBN-10/13s, in order, from CSV or free text (headers and other cells are ignored)"""
+    seen = {}
+    for token in re.split(r"[,;\s]+", text):
+        isbn = openlibrary.normalize_isbn(token.strip().strip('"'))
+        if isbn and len(isbn) in (10, 13):
+            seen.setdefault(isbn, None)
+    return list(seen)
+
+
+def resolve_isbns(isbns, batch_size=BATCH_SIZE, workers=WORKERS, progress=None):
+    """Look up ISBNs concurrently in batches.
+
+    Returns (found, not_found, failed) where found maps ISBN to book metadata
+    and failed maps ISBN to the error of its batch. `progress(done, total)` is
+    called from the calling thread as batches complete.
+    """
+    batches = [isbns[i:i + batch_size] for i in range(0, len(isbns), batch_size)]
+    found, not_found, failed = {}, [], {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(openlibrary.lookup_isbns, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                for isbn, book in future.result().items():
+                    if book:
+                        found[isbn] = book
+                    else:
+                        not_found.append(isbn)
+            except Exception as e:
+                for isbn in batch:
+                    failed[isbn] = str(e)
+            done += len(batch)
+            if progress:
+                progress(done, len(isbns))
+    return found, not_found, failed
+
+
+def import_isbns(isbns, quantity=1, batch_size=BATCH_SIZE, workers=WORKERS, progress=None):
+    """Resolve and insert ISBNs, returning a report dict"""
+    started = time.perf_counter()
+    found, not_found, failed = resolve_isbns(isbns, batch_size, workers, progress)
+    # Keep the input order for the inserted rows
+    result = catalog_import.add_resources_bulk(
+        dict(found[isbn], resource_type="book", quantity=quantity) for isbn in isbns if isbn in found)
+    elapsed = time.perf_counter() - started
+    return {
+        "requested": len(isbns),
+        "imported": result["inserted"],
+        "duplicates": result["duplicates"],
+        "not_found": not_found,
+        "failed": failed,
+        "elapsed": elapsed,
+        "per_second": len(isbns) / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import books from a CSV or text list of ISBNs")
+    parser.add_argument("file", help="CSV or text file containing ISBNs")
+    parser.add_argument("--quantity", type=int, default=1, help="copies of each book")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    with open(args.file, encoding="utf-8") as f:
+        isbns = parse_isbns(f.read())
+
+    def progress(done, total):
+        print(f"\rResolved {done}/{total}", end="", flush=True)
+
+    report = import_isbns(isbns, args.quantity, args.batch_size, args.workers, progress)
+    print()
+    print(f"Imported {report['imported']} of {report['requested']} ISBNs "
+          f"in {report['elapsed']:.1f}s ({report['per_second']:.0f} ISBNs/s)")
+    if report["duplicates"]:
+        print(f"Already in the catalogue ({len(report['duplicates'])}): {', '.join(report['duplicates'])}")
+    if report["not_found"]:
+        print(f"Not found ({len(report['not_found'])}): {', '.join(report['not_found'])}")
+    for isbn, error in report["failed"].items():
+        print(f"Failed {isbn}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Process-wide performance counters: SQL statements, upstream calls and render times.
+
+Every connection the pool opens has cursors with StatementTiming (SQLite's
+InstrumentedConnection, or postgres_backend's cursors), which time each
+statement from execute() until its rows are fetched and count the rows
+returned. Statements are aggregated by normalized text (literals and
+IN-lists replaced by placeholders). A statement slower than the slow-query
+threshold is also kept in the slow-query log together with its query plan,
+taken on a separate connection.
+
+Other timings (Open Library requests, app reruns, dashboard sections) are
+recorded with observe() or timed() as count/sum/max summaries per label set.
+prometheus_text() renders everything in the Prometheus text format.
+
+Environment:
+    SQL_METRICS        "0" opens plain connections, without statement timing (default "1")
+    SLOW_QUERY_MS      slow-query threshold in milliseconds (default 100)
+    SLOW_QUERY_LOG     file to append slow queries to as JSON lines (default: memory only)
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SQL_METRICS = os.environ.get("SQL_METRICS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG")
+SLOW_LOG_SIZE = 200
+MAX_STATEMENTS = 1000           # distinct statements tracked; the rest are counted as "(other)"
+
+_lock = threading.Lock()
+_statements = {}                # normalized sql -> [calls, seconds, max seconds, rows, errors]
+_summaries = {}                 # (name, labels) -> [count, seconds, max seconds]
+_slow = deque(maxlen=SLOW_LOG_SIZE)
+_slow_total = 0
+_started = time.time()
+_thread = threading.local()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(sql):
+    """Statement text with whitespace collapsed and literals and value lists replaced by placeholders"""
+    sql = " ".join(sql.split())
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _LIST.sub("(?, ...)", sql)
+
+
+def configure(slow_query_ms=None, slow_query_log=None):
+    """Change the slow-query threshold or log file at runtime"""
+    global SLOW_QUERY_MS, SLOW_QUERY_LOG
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = float(slow_query_ms)
+    if slow_query_log is not None:
+        SLOW_QUERY_LOG = slow_query_log or None
+
+
+def _explain(path, sql, parameters):
+    """EXPLAIN QUERY PLAN details, from a short-lived connection so the caller's transaction is untouched"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, parameters or ()).fetchall()
+    finally:
+        conn.close()
+    return [row[3] for row in rows]
+
+
+def _plan(explain, sql, parameters):
+    try:
+        return explain(sql, parameters)
+    except Exception as e:
+        return [f"(no plan: {e})"]
+
+
+def record_statement(sql, seconds, rows, error=False, explain=None, parameters=None):
+    """Count one finished statement; logs it with its plan if it was slow.
+
+    `explain(sql, parameters)` returns the plan lines, and is only called for
+    slow statements.
+    """
+    global _slow_total
+    key = normalize(sql)
+    with _lock:
+        stats = _statements.get(key)
+        if stats is None:
+            if len(_statements) >= MAX_STATEMENTS:
+                key = "(other)"
+            stats = _statements.setdefault(key, [0, 0.0, 0.0, 0, 0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        stats[3] += rows
+        stats[4] += error
+    _thread.sql_calls = getattr(_thread, "sql_calls", 0) + 1
+    _thread.sql_seconds = getattr(_thread, "sql_seconds", 0.0) + seconds
+
+    if seconds * 1000 < SLOW_QUERY_MS or sql.split(None, 1)[0].upper() in ("BEGIN", "COMMIT", "ROLLBACK"):
+        return
+    entry = {
+        "at": time.time(),
+        "ms": round(seconds * 1000, 3),
+        "rows": rows,
+        "statement": " ".join(sql.split()),
+        "plan": _plan(explain, sql, parameters) if explain else [],
+    }
+    with _lock:
+        _slow.append(entry)
+        _slow_total += 1
+    if SLOW_QUERY_LOG:
+        try:
+            with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError:
+            pass
+
+
+class StatementTiming:
+    """Cursor mixin that reports each statement to record_statement once its rows are read.
+
+    A statement finishes when its rows run out, the cursor runs another
+    statement, or the cursor is closed or collected. The cursor's connection
+    may have an explain(sql, parameters) method for the slow-query log.
+    """
+    _pending = None
+
+    def _start(self, sql, parameters):
+        self._finish()
+        self._pending = [sql, parameters, 0.0, 0, False]
+
+    def _add(self, seconds, rows=0):
+        if self._pending is not None:
+            self._pending[2] += seconds
+            self._pending[3] += rows
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, parameters, seconds, rows, error = pending
+            record_statement(sql, seconds, rows, error, getattr(self.connection, "explain", None), parameters)
+
+    def _run(self, method, sql, parameters):
+        self._start(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        except BaseException:
+            self._pending[4] = True
+            raise
+        finally:
+            pending = self._pending
+            pending[2] += time.perf_counter() - started
+            # Failed statements, and those with no rows to fetch, finish here
+            if pending[4] or self.description is None:
+                if not pending[4]:
+                    pending[3] += max(self.rowcount, 0)
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._run(super().executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - started, len(rows))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - started)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedCursor(StatementTiming, sqlite3.Cursor):
+    """sqlite3 cursor with statement timing"""
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors, including those of execute(), are instrumented"""
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.path = database
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def explain(self, sql, parameters):
+        return _explain(self.path, sql, parameters)
+
+    # The C implementations of these bypass cursor(), so they are routed through it here
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record_statement("COMMIT", time.perf_counter() - started, 0)
+
+    def rollback(self):
+        started = time.perf_counter()
+        try:
+            super().rollback()
+        finally:
+            record_statement("ROLLBACK", time.perf_counter() - started, 0)
+
+
+def observe(name, seconds, **labels):
+    """Add one timing to the `name` summary for this label set"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        summary = _summaries.setdefault(key, [0, 0.0, 0.0])
+        summary[0] += 1
+        summary[1] += seconds
+        summary[2] = max(summary[2], seconds)
+
+
+class timed:
+    """Context manager recording the wall time of its block with observe(), even if it raises.
+
+    Labels can be added inside the block: ``with timed("x") as t: t.labels["status"] = "ok"``.
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        observe(self.name, self.elapsed, **self.labels)
+        return False
+
+
+def thread_sql():
+    """(statements, seconds) of SQL run so far on the current thread, for before/after differences"""
+    return getattr(_thread, "sql_calls", 0), getattr(_thread, "sql_seconds", 0.0)
+
+
+def statements():
+    """[{statement, calls, total_ms, mean_ms, max_ms, rows, errors}], by total time, most first"""
+    with _lock:
+        items = [(sql, list(s)) for sql, s in _statements.items()]
+    items.sort(key=lambda item: item[1][1], reverse=True)
+    return [{"statement": sql, "calls": calls, "total_ms": seconds * 1000, "mean_ms": seconds * 1000 / calls,
+             "max_ms": longest * 1000, "rows": rows, "errors": errors}
+            for sql, (calls, seconds, longest, rows, errors) in items]
+
+
+def summaries():
+    """[{name, labels, count, total_ms, mean_ms, max_ms}], sorted by name and labels"""
+    with _lock:
+        items = sorted((key, list(s)) for key, s in _summaries.items())
+    return [{"name": name, "labels": dict(labels), "count": count, "total_ms": seconds * 1000,
+             "mean_ms": seconds * 1000 / count, "max_ms": longest * 1000}
+            for (name, labels), (count, seconds, longest) in items]
+
+
+def slow_queries():
+    """Logged slow statements, newest first, and how many were logged in total"""
+    with _lock:
+        return list(reversed(_slow)), _slow_total
+
+
+def reset():
+    """Clear every counter and the slow-query log"""
+    global _slow_total, _started
+    with _lock:
+        _statements.clear()
+        _summaries.clear()
+        _slow.clear()
+        _slow_total = 0
+        _started = time.time()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}" if labels else ""
+
+
+def prometheus_text():
+    """All counters in the Prometheus text exposition format"""
+    # Imported here because db imports this module
+    import cache
+    import db
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {value}")
+
+    rows = statements()
+    metric("elibrary_sql_statements_total", "counter", "SQL statements executed, by normalized statement",
+           [({"statement": r["statement"]}, r["calls"]) for r in rows])
+    metric("elibrary_sql_seconds_total", "counter", "Time spent executing and fetching SQL statements",
+           [({"statement": r["statement"]}, r["total_ms"] / 1000) for r in rows])
+    metric("elibrary_sql_rows_total", "counter", "Rows returned or changed by SQL statements",
+           [({"statement": r["statement"]}, r["rows"]) for r in rows])
+    metric("elibrary_sql_errors_total", "counter", "SQL statements that raised",
+           [({"statement": r["statement"]}, r["errors"]) for r in rows if r["errors"]])
+    metric("elibrary_sql_slow_statements_total", "counter", "Statements slower than the slow-query threshold",
+           [({}, slow_queries()[1])])
+
+    by_name = {}
+    for s in summaries():
+        by_name.setdefault(s["name"], []).append(s)
+    for name, items in by_name.items():
+        full = f"elibrary_{name}_seconds"
+        lines.append(f"# HELP {full} Wall time of {name.replace('_', ' ')}")
+        lines.append(f"# TYPE {full} summary")
+        for s in items:
+            lines.append(f"{full}_count{_labels(**s['labels'])} {s['count']}")
+            lines.append(f"{full}_sum{_labels(**s['labels'])} {s['total_ms'] / 1000}")
+        metric(f"{full}_max", "gauge", f"Longest {name.replace('_', ' ')}",
+               [(s["labels"], s["max_ms"] / 1000) for s in items])
+
+    pool = db.pool_stats()
+    metric("elibrary_db_pool_checkouts_total", "counter", "Connections checked out of the pool",
+           [({}, pool["checkouts"])])
+    metric("elibrary_db_pool_waits_total", "counter", "Checkouts that waited for a free connection",
+           [({}, pool["waits"])])
+    metric("elibrary_db_pool_open_connections", "gauge", "Open pooled connections",
+           [({}, pool["open_connections"])])
+    cached = cache.stats()
+    metric("elibrary_read_cache_calls_total", "counter", "Calls to cached read functions",
+           [({"function": name}, s["calls"]) for name, s in sorted(cached.items())])
+    metric("elibrary_read_cache_misses_total", "counter", "Cached read calls that reached the database",
+           [({"function": name}, s["misses"]) for name, s in sorted(cached.items())])
+    metric("elibrary_metrics_start_time_seconds", "gauge", "When these counters were last reset",
+           [({}, _started)])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,628 @@
+"""Versioned schema migrations for the e-library database.
+
+The applied version is stored in ``PRAGMA user_version`` and each applied
+migration is also recorded in the ``schema_version`` table. A PostgreSQL
+database (see postgres_backend.py) starts from a baseline of the current
+schema and tracks its version in ``schema_version`` alone. Run this module
+directly to apply migrations offline:
+
+    python migrations.py migrate [--db elibrary.db]
+    python migrations.py status [--db elibrary.db]
+    python migrations.py rebuild-fts [--db elibrary.db]
+"""
+import argparse
+import hashlib
+
+import db
+
+
+def _initial_schema(c):
+    # Users table
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT UNIQUE NOT NULL,
+                  password TEXT NOT NULL,
+                  role TEXT NOT NULL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Resources table
+    c.execute('''CREATE TABLE IF NOT EXISTS resources
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  title TEXT NOT NULL,
+                  author TEXT,
+                  resource_type TEXT NOT NULL,
+                  isbn TEXT,
+                  description TEXT,
+                  quantity INTEGER DEFAULT 1,
+                  available INTEGER DEFAULT 1,
+                  cover_url TEXT,
+                  file_path TEXT,
+                  added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Borrowing records table
+    c.execute('''CREATE TABLE IF NOT EXISTS borrowings
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER,
+                  resource_id INTEGER,
+                  borrowed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  due_date TIMESTAMP,
+                  returned_at TIMESTAMP,
+                  status TEXT DEFAULT 'active',
+                  FOREIGN KEY (user_id) REFERENCES users(id),
+                  FOREIGN KEY (resource_id) REFERENCES resources(id))''')
+
+    # Create default admin if not exists
+    c.execute("SELECT * FROM users WHERE username='admin'")
+    if not c.fetchone():
+        admin_password = hashlib.sha256("admin123".encode()).hexdigest()
+        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                  ("admin", admin_password, "admin"))
+
+
+def _resources_fts(c):
+    # External-content FTS5 index over the searchable resource columns
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS resources_fts
+                 USING fts5(title, author, description, isbn,
+                            content='resources', content_rowid='id',
+                            tokenize='unicode61 remove_diacritics 2')''')
+
+    # Keep the index in sync with the resources table
+    c.execute('''CREATE TRIGGER IF NOT EXISTS resources_fts_insert AFTER INSERT ON resources BEGIN
+                     INSERT INTO resources_fts (rowid, title, author, description, isbn)
+                     VALUES (new.id, new.title, new.author, new.description, new.isbn);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS resources_fts_delete AFTER DELETE ON resources BEGIN
+                     INSERT INTO resources_fts (resources_fts, rowid, title, author, description, isbn)
+                     VALUES ('delete', old.id, old.title, old.author, old.description, old.isbn);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS resources_fts_update
+                 AFTER UPDATE OF title, author, description, isbn ON resources BEGIN
+                     INSERT INTO resources_fts (resources_fts, rowid, title, author, description, isbn)
+                     VALUES ('delete', old.id, old.title, old.author, old.description, old.isbn);
+                     INSERT INTO resources_fts (rowid, title, author, description, isbn)
+                     VALUES (new.id, new.title, new.author, new.description, new.isbn);
+                 END''')
+
+    # Backfill rows that existed before the index
+    c.execute("INSERT INTO resources_fts (resources_fts) VALUES ('rebuild')")
+
+
+def _secondary_indexes(c):
+    # Active loans per user: borrow limit checks and the student's loan list, newest first
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_borrowings_active_user
+                 ON borrowings (user_id, borrowed_at, resource_id) WHERE status='active'""")
+    # Admin borrowing records, newest first
+    c.execute("CREATE INDEX IF NOT EXISTS idx_borrowings_borrowed_at ON borrowings (borrowed_at)")
+    # Catalogue filtered by type, paged by id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_resources_type ON resources (resource_type)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)")
+
+
+def _library_stats(c):
+    # Single-row summary of the admin dashboard totals, maintained by triggers
+    c.execute('''CREATE TABLE IF NOT EXISTS library_stats
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  total_resources INTEGER NOT NULL DEFAULT 0,
+                  total_copies INTEGER NOT NULL DEFAULT 0,
+                  active_borrowings INTEGER NOT NULL DEFAULT 0,
+                  total_students INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("""INSERT OR REPLACE INTO library_stats
+                 (id, total_resources, total_copies, active_borrowings, total_students)
+                 VALUES (1,
+                         (SELECT COUNT(*) FROM resources),
+                         (SELECT COALESCE(SUM(quantity), 0) FROM resources),
+                         (SELECT COUNT(*) FROM borrowings WHERE status='active'),
+                         (SELECT COUNT(*) FROM users WHERE role='student'))""")
+
+    triggers = {
+        "stats_resources_insert": """AFTER INSERT ON resources BEGIN
+            UPDATE library_stats SET total_resources = total_resources + 1,
+                                     total_copies = total_copies + COALESCE(new.quantity, 0) WHERE id = 1;
+        END""",
+        "stats_resources_delete": """AFTER DELETE ON resources BEGIN
+            UPDATE library_stats SET total_resources = total_resources - 1,
+                                     total_copies = total_copies - COALESCE(old.quantity, 0) WHERE id = 1;
+        END""",
+        "stats_resources_update": """AFTER UPDATE OF quantity ON resources BEGIN
+            UPDATE library_stats SET total_copies = total_copies
+                                     + COALESCE(new.quantity, 0) - COALESCE(old.quantity, 0) WHERE id = 1;
+        END""",
+        "stats_borrowings_insert": """AFTER INSERT ON borrowings WHEN new.status = 'active' BEGIN
+            UPDATE library_stats SET active_borrowings = active_borrowings + 1 WHERE id = 1;
+        END""",
+        "stats_borrowings_delete": """AFTER DELETE ON borrowings WHEN old.status = 'active' BEGIN
+            UPDATE library_stats SET active_borrowings = active_borrowings - 1 WHERE id = 1;
+        END""",
+        "stats_borrowings_update": """AFTER UPDATE OF status ON borrowings BEGIN
+            UPDATE library_stats SET active_borrowings = active_borrowings
+                                     + (new.status = 'active') - (old.status = 'active') WHERE id = 1;
+        END""",
+        "stats_users_insert": """AFTER INSERT ON users WHEN new.role = 'student' BEGIN
+            UPDATE library_stats SET total_students = total_students + 1 WHERE id = 1;
+        END""",
+        "stats_users_delete": """AFTER DELETE ON users WHEN old.role = 'student' BEGIN
+            UPDATE library_stats SET total_students = total_students - 1 WHERE id = 1;
+        END""",
+        "stats_users_update": """AFTER UPDATE OF role ON users BEGIN
+            UPDATE library_stats SET total_students = total_students
+                                     + (new.role = 'student') - (old.role = 'student') WHERE id = 1;
+        END""",
+    }
+    for name, body in triggers.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def _api_cache(c):
+    # Open Library lookups keyed by normalized ISBN/title; NULL payload caches a miss
+    c.execute('''CREATE TABLE IF NOT EXISTS api_cache
+                 (key TEXT PRIMARY KEY,
+                  payload TEXT,
+                  fetched_at REAL NOT NULL,
+                  expires_at REAL NOT NULL)''')
+
+
+def _isbn_index(c):
+    # Duplicate-ISBN checks during bulk imports
+    c.execute("CREATE INDEX IF NOT EXISTS idx_resources_isbn ON resources (isbn)")
+
+
+def _files(c):
+    # Content-addressed uploads; resources.file_path holds files.path
+    c.execute('''CREATE TABLE IF NOT EXISTS files
+                 (sha256 TEXT PRIMARY KEY,
+                  path TEXT UNIQUE NOT NULL,
+                  size INTEGER NOT NULL,
+                  mime TEXT,
+                  original_name TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def _thumbnails(c):
+    # Thumbnail queue and state per resource; images live in uploads/thumbnails/<id>.<ext>
+    c.execute('''CREATE TABLE IF NOT EXISTS thumbnails
+                 (resource_id INTEGER PRIMARY KEY,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  error TEXT,
+                  updated_at REAL NOT NULL DEFAULT 0)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_thumbnails_queue ON thumbnails (status, updated_at)")
+
+    wanted = "new.cover_url <> '' OR lower(new.file_path) LIKE '%.pdf'"
+    enqueue = """INSERT OR REPLACE INTO thumbnails (resource_id, status, attempts, updated_at)
+                 VALUES (new.id, 'pending', 0, 0);"""
+    triggers = {
+        "thumbnails_enqueue_insert": f"AFTER INSERT ON resources WHEN {wanted} BEGIN {enqueue} END",
+        "thumbnails_enqueue_update": f"""AFTER UPDATE OF cover_url, file_path ON resources
+            WHEN ({wanted}) AND (new.cover_url IS NOT old.cover_url OR new.file_path IS NOT old.file_path)
+            BEGIN {enqueue} END""",
+        "thumbnails_delete": """AFTER DELETE ON resources BEGIN
+            DELETE FROM thumbnails WHERE resource_id = old.id;
+        END""",
+    }
+    for name, body in triggers.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    c.execute("""INSERT OR IGNORE INTO thumbnails (resource_id)
+                 SELECT id FROM resources WHERE cover_url <> '' OR lower(file_path) LIKE '%.pdf'""")
+
+
+def _borrowing_epochs(c):
+    # Integer Unix times alongside the TEXT timestamps, so due-date checks are
+    # plain comparisons. due_date/returned_at were written in local time,
+    # borrowed_at by CURRENT_TIMESTAMP in UTC.
+    for column in ("borrowed_ts", "due_ts", "returned_ts"):
+        c.execute(f"ALTER TABLE borrowings ADD COLUMN {column} INTEGER")
+    c.execute("""UPDATE borrowings
+                 SET borrowed_ts = CAST(strftime('%s', borrowed_at) AS INTEGER),
+                     due_ts = CAST(strftime('%s', due_date, 'utc') AS INTEGER),
+                     returned_ts = CAST(strftime('%s', returned_at, 'utc') AS INTEGER)""")
+
+
+def _loan_notifications(c):
+    # Outbox of overdue/due-soon events written by overdue_scanner.py; one row per loan and kind
+    c.execute('''CREATE TABLE IF NOT EXISTS notifications
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL,
+                  borrowing_id INTEGER NOT NULL,
+                  kind TEXT NOT NULL,
+                  due_ts INTEGER,
+                  created_at INTEGER NOT NULL,
+                  sent_at INTEGER,
+                  UNIQUE (borrowing_id, kind),
+                  FOREIGN KEY (user_id) REFERENCES users(id),
+                  FOREIGN KEY (borrowing_id) REFERENCES borrowings(id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notifications_unsent ON notifications (created_at) WHERE sent_at IS NULL")
+    # Scanner results, read by the admin dashboard instead of counting loans itself
+    c.execute('''CREATE TABLE IF NOT EXISTS loan_scan
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  scanned_at INTEGER NOT NULL,
+                  overdue INTEGER NOT NULL,
+                  due_soon INTEGER NOT NULL,
+                  duration_ms REAL NOT NULL)''')
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_borrowings_active_due
+                 ON borrowings (due_ts) WHERE status='active'""")
+
+
+def _history_indexes(c):
+    # Borrowing history, newest first, overall and per student or resource;
+    # replaces the borrowed_at index of the old 50-row records view
+    c.execute("DROP INDEX IF EXISTS idx_borrowings_borrowed_at")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_borrowings_borrowed_ts ON borrowings (borrowed_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_borrowings_user_ts ON borrowings (user_id, borrowed_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_borrowings_resource_ts ON borrowings (resource_id, borrowed_ts)")
+
+
+def _loan_rollups(c):
+    # Daily circulation rollups kept by analytics.refresh(); day is the local
+    # calendar day as days since 1970-01-01
+    c.execute('''CREATE TABLE IF NOT EXISTS loan_daily
+                 (day INTEGER NOT NULL,
+                  resource_type TEXT NOT NULL,
+                  loans INTEGER NOT NULL DEFAULT 0,
+                  returns INTEGER NOT NULL DEFAULT 0,
+                  late_returns INTEGER NOT NULL DEFAULT 0,
+                  loan_seconds INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (day, resource_type)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS resource_loans
+                 (resource_id INTEGER PRIMARY KEY,
+                  loans INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_resource_loans_loans ON resource_loans (loans)")
+    # How far the rollups have read: loans by id, returns by (returned_ts, id)
+    c.execute('''CREATE TABLE IF NOT EXISTS analytics_state
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  last_borrowing_id INTEGER NOT NULL DEFAULT 0,
+                  last_returned_ts INTEGER NOT NULL DEFAULT 0,
+                  last_returned_id INTEGER NOT NULL DEFAULT 0,
+                  refreshed_at INTEGER)''')
+    c.execute("INSERT OR IGNORE INTO analytics_state (id) VALUES (1)")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_borrowings_returned_ts
+                 ON borrowings (returned_ts) WHERE returned_ts IS NOT NULL""")
+
+
+def _holds(c):
+    # Per-resource FIFO waiting lists; return_resource checks a returned copy
+    # out to the first waiting student in the same transaction
+    c.execute('''CREATE TABLE IF NOT EXISTS holds
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL,
+                  resource_id INTEGER NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'waiting',
+                  created_ts INTEGER NOT NULL,
+                  closed_ts INTEGER,
+                  borrowing_id INTEGER,
+                  FOREIGN KEY (user_id) REFERENCES users(id),
+                  FOREIGN KEY (resource_id) REFERENCES resources(id),
+                  FOREIGN KEY (borrowing_id) REFERENCES borrowings(id))''')
+    # The queue in order; partial, so it only ever holds the students still waiting
+    c.execute("CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (resource_id, id) WHERE status='waiting'")
+    # One place per student in each queue
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_waiting_user
+                 ON holds (user_id, resource_id) WHERE status='waiting'""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_holds_user ON holds (user_id, id)")
+    c.execute("ALTER TABLE borrowings ADD COLUMN renewals INTEGER NOT NULL DEFAULT 0")
+
+
+def _cache_scopes(c):
+    # Read-cache invalidations shared by every process on the database; each
+    # bump stamps its scopes with the next version, and cache.py polls for
+    # versions it has not seen yet. Same SQL on both backends
+    c.execute('''CREATE TABLE IF NOT EXISTS cache_scopes
+                 (scope TEXT PRIMARY KEY,
+                  version BIGINT NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cache_scopes_version ON cache_scopes (version)")
+
+
+def _cache_versions(c):
+    # Writers now publish inside their own transactions. SQLite serializes them,
+    # so cache.py numbers versions MAX(version) + 1 and needs nothing here;
+    # PostgreSQL writers run concurrently and draw versions from a sequence
+    if db.dialect() == "postgresql":
+        c.execute("CREATE SEQUENCE IF NOT EXISTS cache_scopes_version_seq")
+        c.execute("""SELECT setval('cache_scopes_version_seq',
+                                   (SELECT COALESCE(MAX(version), 0) + 1 FROM cache_scopes), false)""")
+
+
+# PostgreSQL starts from one baseline equal to the SQLite schema at version
+# 13. Full-text search is a weighted tsvector column with a GIN index instead
+# of FTS5, the trigger bodies are PL/pgSQL, and epoch columns are BIGINT
+_POSTGRES_TABLES = [
+    """CREATE TABLE IF NOT EXISTS users
+       (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'))""",
+    """CREATE TABLE IF NOT EXISTS resources
+       (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        title TEXT NOT NULL,
+        author TEXT,
+        resource_type TEXT NOT NULL,
+        isbn TEXT,
+        description TEXT,
+        quantity INTEGER DEFAULT 1,
+        available INTEGER DEFAULT 1,
+        cover_url TEXT,
+        file_path TEXT,
+        added_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
+        search TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', COALESCE(title, '')), 'A') ||
+            setweight(to_tsvector('simple', COALESCE(author, '')), 'B') ||
+            setweight(to_tsvector('simple', COALESCE(isbn, '')), 'C') ||
+            setweight(to_tsvector('simple', COALESCE(description, '')), 'D')) STORED)""",
+    """CREATE TABLE IF NOT EXISTS borrowings
+       (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        user_id BIGINT REFERENCES users(id),
+        resource_id BIGINT REFERENCES resources(id),
+        borrowed_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
+        due_date TIMESTAMP,
+        returned_at TIMESTAMP,
+        status TEXT DEFAULT 'active',
+        borrowed_ts BIGINT,
+        due_ts BIGINT,
+        returned_ts BIGINT,
+        renewals INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS library_stats
+       (id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_resources INTEGER NOT NULL DEFAULT 0,
+        total_copies INTEGER NOT NULL DEFAULT 0,
+        active_borrowings INTEGER NOT NULL DEFAULT 0,
+        total_students INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS api_cache
+       (key TEXT PRIMARY KEY,
+        payload TEXT,
+        fetched_at DOUBLE PRECISION NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS files
+       (sha256 TEXT PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        size BIGINT NOT NULL,
+        mime TEXT,
+        original_name TEXT,
+        created_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'))""",
+    """CREATE TABLE IF NOT EXISTS thumbnails
+       (resource_id BIGINT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        updated_at DOUBLE PRECISION NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS notifications
+       (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users(id),
+        borrowing_id BIGINT NOT NULL REFERENCES borrowings(id),
+        kind TEXT NOT NULL,
+        due_ts BIGINT,
+        created_at BIGINT NOT NULL,
+        sent_at BIGINT,
+        UNIQUE (borrowing_id, kind))""",
+    """CREATE TABLE IF NOT EXISTS loan_scan
+       (id INTEGER PRIMARY KEY CHECK (id = 1),
+        scanned_at BIGINT NOT NULL,
+        overdue INTEGER NOT NULL,
+        due_soon INTEGER NOT NULL,
+        duration_ms DOUBLE PRECISION NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS loan_daily
+       (day INTEGER NOT NULL,
+        resource_type TEXT NOT NULL,
+        loans INTEGER NOT NULL DEFAULT 0,
+        returns INTEGER NOT NULL DEFAULT 0,
+        late_returns INTEGER NOT NULL DEFAULT 0,
+        loan_seconds BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, resource_type))""",
+    """CREATE TABLE IF NOT EXISTS resource_loans
+       (resource_id BIGINT PRIMARY KEY,
+        loans INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS analytics_state
+       (id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_borrowing_id BIGINT NOT NULL DEFAULT 0,
+        last_returned_ts BIGINT NOT NULL DEFAULT 0,
+        last_returned_id BIGINT NOT NULL DEFAULT 0,
+        refreshed_at BIGINT)""",
+    """CREATE TABLE IF NOT EXISTS holds
+       (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users(id),
+        resource_id BIGINT NOT NULL REFERENCES resources(id),
+        status TEXT NOT NULL DEFAULT 'waiting',
+        created_ts BIGINT NOT NULL,
+        closed_ts BIGINT,
+        borrowing_id BIGINT REFERENCES borrowings(id))""",
+]
+
+_POSTGRES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)",
+    "CREATE INDEX IF NOT EXISTS idx_resources_type ON resources (resource_type)",
+    "CREATE INDEX IF NOT EXISTS idx_resources_isbn ON resources (isbn)",
+    "CREATE INDEX IF NOT EXISTS idx_resources_search ON resources USING GIN (search)",
+    """CREATE INDEX IF NOT EXISTS idx_borrowings_active_user
+       ON borrowings (user_id, borrowed_at, resource_id) WHERE status='active'""",
+    "CREATE INDEX IF NOT EXISTS idx_borrowings_active_due ON borrowings (due_ts) WHERE status='active'",
+    "CREATE INDEX IF NOT EXISTS idx_borrowings_borrowed_ts ON borrowings (borrowed_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_borrowings_user_ts ON borrowings (user_id, borrowed_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_borrowings_resource_ts ON borrowings (resource_id, borrowed_ts)",
+    """CREATE INDEX IF NOT EXISTS idx_borrowings_returned_ts
+       ON borrowings (returned_ts) WHERE returned_ts IS NOT NULL""",
+    "CREATE INDEX IF NOT EXISTS idx_thumbnails_queue ON thumbnails (status, updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_unsent ON notifications (created_at) WHERE sent_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_resource_loans_loans ON resource_loans (loans)",
+    "CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (resource_id, id) WHERE status='waiting'",
+    """CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_waiting_user
+       ON holds (user_id, resource_id) WHERE status='waiting'""",
+    "CREATE INDEX IF NOT EXISTS idx_holds_user ON holds (user_id, id)",
+]
+
+# name -> (trigger timing and condition, PL/pgSQL body); each becomes a
+# function and a row trigger of the same name, as the SQLite triggers are named
+_POSTGRES_TRIGGERS = {
+    "stats_resources_insert": ("AFTER INSERT ON resources FOR EACH ROW", """
+        UPDATE library_stats SET total_resources = total_resources + 1,
+                                 total_copies = total_copies + COALESCE(NEW.quantity, 0) WHERE id = 1;"""),
+    "stats_resources_delete": ("AFTER DELETE ON resources FOR EACH ROW", """
+        UPDATE library_stats SET total_resources = total_resources - 1,
+                                 total_copies = total_copies - COALESCE(OLD.quantity, 0) WHERE id = 1;"""),
+    "stats_resources_update": ("AFTER UPDATE OF quantity ON resources FOR EACH ROW", """
+        UPDATE library_stats SET total_copies = total_copies
+                                 + COALESCE(NEW.quantity, 0) - COALESCE(OLD.quantity, 0) WHERE id = 1;"""),
+    "stats_borrowings_insert": ("AFTER INSERT ON borrowings FOR EACH ROW WHEN (NEW.status = 'active')", """
+        UPDATE library_stats SET active_borrowings = active_borrowings + 1 WHERE id = 1;"""),
+    "stats_borrowings_delete": ("AFTER DELETE ON borrowings FOR EACH ROW WHEN (OLD.status = 'active')", """
+        UPDATE library_stats SET active_borrowings = active_borrowings - 1 WHERE id = 1;"""),
+    "stats_borrowings_update": ("AFTER UPDATE OF status ON borrowings FOR EACH ROW", """
+        UPDATE library_stats SET active_borrowings = active_borrowings
+                                 + (NEW.status = 'active')::int - (OLD.status = 'active')::int WHERE id = 1;"""),
+    "stats_users_insert": ("AFTER INSERT ON users FOR EACH ROW WHEN (NEW.role = 'student')", """
+        UPDATE library_stats SET total_students = total_students + 1 WHERE id = 1;"""),
+    "stats_users_delete": ("AFTER DELETE ON users FOR EACH ROW WHEN (OLD.role = 'student')", """
+        UPDATE library_stats SET total_students = total_students - 1 WHERE id = 1;"""),
+    "stats_users_update": ("AFTER UPDATE OF role ON users FOR EACH ROW", """
+        UPDATE library_stats SET total_students = total_students
+                                 + (NEW.role = 'student')::int - (OLD.role = 'student')::int WHERE id = 1;"""),
+    "thumbnails_enqueue_insert": ("""AFTER INSERT ON resources FOR EACH ROW
+        WHEN (NEW.cover_url <> '' OR lower(NEW.file_path) LIKE '%.pdf')""", """
+        INSERT INTO thumbnails (resource_id, status, attempts, updated_at) VALUES (NEW.id, 'pending', 0, 0)
+        ON CONFLICT (resource_id) DO UPDATE SET status = 'pending', attempts = 0, error = NULL, updated_at = 0;"""),
+    "thumbnails_enqueue_update": ("""AFTER UPDATE OF cover_url, file_path ON resources FOR EACH ROW
+        WHEN ((NEW.cover_url <> '' OR lower(NEW.file_path) LIKE '%.pdf')
+              AND (NEW.cover_url IS DISTINCT FROM OLD.cover_url OR NEW.file_path IS DISTINCT FROM OLD.file_path))""", """
+        INSERT INTO thumbnails (resource_id, status, attempts, updated_at) VALUES (NEW.id, 'pending', 0, 0)
+        ON CONFLICT (resource_id) DO UPDATE SET status = 'pending', attempts = 0, error = NULL, updated_at = 0;"""),
+    "thumbnails_delete": ("AFTER DELETE ON resources FOR EACH ROW", """
+        DELETE FROM thumbnails WHERE resource_id = OLD.id;"""),
+}
+
+
+def _postgres_baseline(c):
+    for sql in _POSTGRES_TABLES + _POSTGRES_INDEXES:
+        c.execute(sql)
+    for name, (timing, body) in _POSTGRES_TRIGGERS.items():
+        c.execute(f"""CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+                      BEGIN {body}
+                          RETURN NULL;
+                      END $$""")
+        c.execute(f"CREATE OR REPLACE TRIGGER {name} {timing} EXECUTE FUNCTION {name}()")
+
+    c.execute("INSERT INTO library_stats (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+    c.execute("INSERT INTO analytics_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+    c.execute("SELECT 1 FROM users WHERE username='admin'")
+    if not c.fetchone():
+        admin_password = hashlib.sha256("admin123".encode()).hexdigest()
+        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                  ("admin", admin_password, "admin"))
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "full-text search index on resources", _resources_fts),
+    (3, "secondary indexes on borrowings, resources and users", _secondary_indexes),
+    (4, "trigger-maintained library statistics", _library_stats),
+    (5, "Open Library lookup cache", _api_cache),
+    (6, "ISBN index on resources", _isbn_index),
+    (7, "content-addressed upload files", _files),
+    (8, "resource thumbnail queue", _thumbnails),
+    (9, "epoch timestamp columns on borrowings", _borrowing_epochs),
+    (10, "loan notification outbox and scan results", _loan_notifications),
+    (11, "borrowing history indexes", _history_indexes),
+    (12, "loan analytics rollups", _loan_rollups),
+    (13, "resource holds and loan renewals", _holds),
+    (14, "shared read-cache invalidation", _cache_scopes),
+    (15, "read-cache versions published by concurrent writers", _cache_versions),
+]
+
+# The same versions for PostgreSQL; a new migration adds an entry to both lists
+POSTGRES_MIGRATIONS = [
+    (13, "PostgreSQL baseline schema", _postgres_baseline),
+    (14, "shared read-cache invalidation", _cache_scopes),
+    (15, "read-cache versions published by concurrent writers", _cache_versions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _migrations():
+    return POSTGRES_MIGRATIONS if db.dialect() == "postgresql" else MIGRATIONS
+
+
+def current_version(c):
+    if db.dialect() == "postgresql":
+        # PostgreSQL has no user_version, so the schema_version table is the record
+        c.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not c.fetchone()[0]:
+            return 0
+        c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return c.fetchone()[0]
+    c.execute("PRAGMA user_version")
+    return c.fetchone()[0]
+
+
+def migrate():
+    """Apply all pending migrations and return the resulting schema version.
+
+    Runs under the write lock, so replicas starting together apply each
+    migration once.
+    """
+    with db.transaction(immediate=True) as c:
+        version = current_version(c)
+        if version >= LATEST_VERSION:
+            return version
+
+        c.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                     (version INTEGER PRIMARY KEY,
+                      description TEXT,
+                      applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        for number, description, apply in _migrations():
+            if number <= version:
+                continue
+            apply(c)
+            c.execute("""INSERT INTO schema_version (version, description) VALUES (?, ?)
+                         ON CONFLICT (version) DO UPDATE SET description = excluded.description""",
+                      (number, description))
+            if db.dialect() == "sqlite":
+                # user_version is transactional, so a failed migration leaves it untouched
+                c.execute(f"PRAGMA user_version={number}")
+            version = number
+    return version
+
+
+def status():
+    """Return (current version, list of pending migration descriptions)"""
+    with db.transaction() as c:
+        version = current_version(c)
+    pending = [f"{number}: {description}" for number, description, _ in _migrations() if number > version]
+    return version, pending
+
+
+def rebuild_fts():
+    """Rebuild the resources full-text index from the resources table"""
+    with db.transaction(immediate=True) as c:
+        if db.dialect() == "postgresql":
+            # The search column is generated with each row, so only its index can go stale
+            c.execute("REINDEX INDEX idx_resources_search")
+        else:
+            c.execute("INSERT INTO resources_fts (resources_fts) VALUES ('rebuild')")
+            c.execute("INSERT INTO resources_fts (resources_fts) VALUES ('optimize')")
+        c.execute("SELECT COUNT(*) FROM resources")
+        return c.fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E-library schema migrations")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("migrate", help="apply pending migrations (default)")
+    sub.add_parser("status", help="show the current schema version and pending migrations")
+    sub.add_parser("rebuild-fts", help="backfill the full-text search index from the resources table")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    if args.command == "status":
+        version, pending = status()
+        print(f"Schema version {version} (latest {LATEST_VERSION})")
+        for line in pending:
+            print(f"  pending {line}")
+    elif args.command == "rebuild-fts":
+        migrate()
+        print(f"Indexed {rebuild_fts()} resources")
+    else:
+        print(f"Schema at version {migrate()}")
+
+
+if __name__ == "__main__":
+    main()
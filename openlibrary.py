@@ -0,0 +1,204 @@
+"""Open Library client with a persistent lookup cache.
+
+Lookups go through one shared requests.Session (keep-alive, pooled
+connections) and are cached in the ``api_cache`` table keyed by normalized
+ISBN or title. Books that Open Library does not know are cached too, for a
+shorter time, so repeated misses do not hit the upstream either.
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import db
+import metrics
+
+BASE_URL = os.environ.get("OPENLIBRARY_URL", "https://openlibrary.org")
+COVERS_URL = "https://covers.openlibrary.org"
+TIMEOUT = 5
+
+POSITIVE_TTL = 7 * 24 * 3600    # found books
+NEGATIVE_TTL = 3600             # books Open Library does not have
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "upstream_errors": 0}
+
+
+def get_session():
+    """Shared HTTP session with connection pooling and retries on transient errors"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                              allowed_methods=("GET",))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = "FSS-E-Library/1.0"
+                _session = session
+    return _session
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def cache_stats():
+    """Hit/miss counters for this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def normalize_isbn(value):
+    """Digits of an ISBN with hyphens and spaces removed, or None if it is not one"""
+    digits = value.replace("-", "").replace(" ", "").strip()
+    return digits if digits.isdigit() else None
+
+
+def cache_key(isbn_or_title):
+    isbn = normalize_isbn(isbn_or_title)
+    if isbn:
+        return f"isbn:{isbn}"
+    return "title:" + " ".join(isbn_or_title.lower().split())
+
+
+def _cache_get_many(keys):
+    """{key: book} for fresh cache entries among `keys`; book is None for a cached miss"""
+    found = {}
+    with db.transaction() as c:
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            c.execute(f"""SELECT key, payload FROM api_cache
+                          WHERE key IN ({','.join('?' * len(chunk))}) AND expires_at > ?""",
+                      (*chunk, time.time()))
+            for key, payload in c.fetchall():
+                found[key] = json.loads(payload) if payload is not None else None
+    return found
+
+
+def _count_hit(book):
+    _count("hits" if book is not None else "negative_hits")
+
+
+def _cache_put(entries):
+    """Store (key, book-or-None) pairs, using the negative TTL for misses"""
+    now = time.time()
+    with db.transaction() as c:
+        c.executemany("""INSERT INTO api_cache (key, payload, fetched_at, expires_at)
+                         VALUES (?, ?, ?, ?)
+                         ON CONFLICT (key) DO UPDATE SET payload = excluded.payload,
+                             fetched_at = excluded.fetched_at, expires_at = excluded.expires_at""",
+                      [(key, json.dumps(book) if book is not None else None, now,
+                        now + (POSITIVE_TTL if book is not None else NEGATIVE_TTL))
+                       for key, book in entries])
+
+
+def parse_isbn_record(isbn, record):
+    """Book dict from an api/books jscmd=data record"""
+    return {
+        "title": record.get("title", ""),
+        "author": ", ".join([a["name"] for a in record.get("authors", [])]),
+        "isbn": isbn,
+        "description": record.get("notes", ""),
+        "cover_url": record.get("cover", {}).get("medium", "")
+    }
+
+
+def parse_search_doc(book):
+    """Book dict from a search.json result document"""
+    return {
+        "title": book.get("title", ""),
+        "author": ", ".join(book.get("author_name", [])),
+        "isbn": book.get("isbn", [""])[0] if book.get("isbn") else "",
+        "description": book.get("first_sentence", [""])[0] if book.get("first_sentence") else "",
+        "cover_url": f"{COVERS_URL}/b/id/{book.get('cover_i', '')}-M.jpg" if book.get('cover_i') else ""
+    }
+
+
+def _get(endpoint, params):
+    """GET an Open Library endpoint and decode its JSON, recording latency and status in metrics"""
+    with metrics.timed("openlibrary_request", endpoint=endpoint) as timer:
+        try:
+            response = get_session().get(f"{BASE_URL}/{endpoint}", params=params, timeout=TIMEOUT)
+            timer.labels["status"] = response.status_code
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            timer.labels.setdefault("status", type(e).__name__)
+            _count("upstream_errors")
+            raise
+
+
+def _fetch(isbn_or_title):
+    """Query Open Library directly; raises on network or HTTP errors"""
+    isbn = normalize_isbn(isbn_or_title)
+    if isbn:
+        data = _get("api/books", {"bibkeys": f"ISBN:{isbn}", "format": "json", "jscmd": "data"})
+    else:
+        data = _get("search.json", {"title": isbn_or_title, "limit": 1})
+
+    if isbn and f"ISBN:{isbn}" in data:
+        return parse_isbn_record(isbn, data[f"ISBN:{isbn}"])
+    if not isbn and data.get("docs"):
+        return parse_search_doc(data["docs"][0])
+    return None
+
+
+def lookup(isbn_or_title):
+    """Book metadata for an ISBN or title, or None if Open Library has no match.
+
+    Fresh cache entries (including cached misses) are returned without a
+    network call. Network and HTTP errors propagate and are not cached.
+    """
+    key = cache_key(isbn_or_title)
+    cached = _cache_get_many([key])
+    if key in cached:
+        _count_hit(cached[key])
+        return cached[key]
+
+    _count("misses")
+    book = _fetch(isbn_or_title)
+    _cache_put([(key, book)])
+    return book
+
+
+def lookup_isbns(isbns):
+    """{isbn: book or None} for normalized ISBNs.
+
+    Cache misses are resolved with a single multi-bibkey api/books request, so
+    callers should pass batches of a few dozen ISBNs.
+    """
+    cached = _cache_get_many([f"isbn:{isbn}" for isbn in isbns])
+    results = {}
+    missing = []
+    for isbn in isbns:
+        key = f"isbn:{isbn}"
+        if key in cached:
+            _count_hit(cached[key])
+            results[isbn] = cached[key]
+        else:
+            missing.append(isbn)
+    if not missing:
+        return results
+
+    _count("misses", len(missing))
+    data = _get("api/books", {"bibkeys": ",".join(f"ISBN:{isbn}" for isbn in missing),
+                              "format": "json", "jscmd": "data"})
+
+    fetched = []
+    for isbn in missing:
+        record = data.get(f"ISBN:{isbn}")
+        results[isbn] = parse_isbn_record(isbn, record) if record else None
+        fetched.append((f"isbn:{isbn}", results[isbn]))
+    _cache_put(fetched)
+    return results
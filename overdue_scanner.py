@@ -0,0 +1,109 @@
+"""Periodic overdue-loan scanner.
+
+Runs as its own worker process, outside the Streamlit app. Each pass walks
+the active loans due before now + DUE_SOON_SECONDS through the partial
+due-date index, queues one ``notifications`` row per loan and kind
+('due_soon', then 'overdue') and records the totals in ``loan_scan`` for the
+admin dashboard:
+
+    python overdue_scanner.py run [--interval 300] [--once] [--db elibrary.db]
+    python overdue_scanner.py status
+"""
+import argparse
+import time
+
+import db
+import migrations
+
+DUE_SOON_SECONDS = 3 * 24 * 3600
+BATCH_SIZE = 500
+INTERVAL = 300
+
+
+def scan(now=None, batch_size=BATCH_SIZE):
+    """Queue notifications for due-soon and overdue loans; returns the pass's counts"""
+    now = int(now if now is not None else time.time())
+    started = time.perf_counter()
+    overdue = due_soon = created = 0
+    after = (-1, 0)
+    while True:
+        # One short write transaction per batch, so borrows and returns are never held up for long
+        with db.transaction(immediate=True) as c:
+            c.execute("""SELECT id, user_id, due_ts FROM borrowings
+                         WHERE status='active' AND due_ts < ? AND (due_ts, id) > (?, ?)
+                         ORDER BY due_ts, id LIMIT ?""",
+                      (now + DUE_SOON_SECONDS, after[0], after[1], batch_size))
+            rows = c.fetchall()
+            if not rows:
+                break
+            events = []
+            for borrowing_id, user_id, due_ts in rows:
+                kind = "overdue" if due_ts < now else "due_soon"
+                if kind == "overdue":
+                    overdue += 1
+                else:
+                    due_soon += 1
+                events.append((user_id, borrowing_id, kind, due_ts, now))
+            c.executemany("""INSERT INTO notifications (user_id, borrowing_id, kind, due_ts, created_at)
+                             VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING""", events)
+            created += c.rowcount
+        after = (rows[-1][2], rows[-1][0])
+
+    duration_ms = (time.perf_counter() - started) * 1000
+    with db.transaction() as c:
+        c.execute("""INSERT INTO loan_scan (id, scanned_at, overdue, due_soon, duration_ms)
+                     VALUES (1, ?, ?, ?, ?)
+                     ON CONFLICT (id) DO UPDATE SET scanned_at = excluded.scanned_at, overdue = excluded.overdue,
+                         due_soon = excluded.due_soon, duration_ms = excluded.duration_ms""",
+                  (now, overdue, due_soon, duration_ms))
+    return {"overdue": overdue, "due_soon": due_soon, "created": created, "duration_ms": duration_ms}
+
+
+def status():
+    """Latest scan results plus the number of unsent notifications, or None before the first scan"""
+    with db.transaction() as c:
+        c.execute("SELECT scanned_at, overdue, due_soon, duration_ms FROM loan_scan WHERE id=1")
+        row = c.fetchone()
+        if row is None:
+            return None
+        c.execute("SELECT COUNT(*) FROM notifications WHERE sent_at IS NULL")
+        pending = c.fetchone()[0]
+    scanned_at, overdue, due_soon, duration_ms = row
+    return {"scanned_at": scanned_at, "overdue": overdue, "due_soon": due_soon,
+            "duration_ms": duration_ms, "pending_notifications": pending}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan active loans for overdue and due-soon items")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="scan periodically")
+    run_parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds between scans")
+    run_parser.add_argument("--once", action="store_true", help="scan once and exit")
+    run_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    sub.add_parser("status", help="show the latest scan results")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    if args.command == "status":
+        result = status()
+        if result is None:
+            print("No scan has run yet")
+        else:
+            print(f"Scanned {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(result['scanned_at']))}: "
+                  f"{result['overdue']} overdue, {result['due_soon']} due soon, "
+                  f"{result['pending_notifications']} notifications unsent")
+        return
+
+    while True:
+        result = scan(batch_size=args.batch_size)
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {result['overdue']} overdue, {result['due_soon']} due soon, "
+              f"{result['created']} new notifications ({result['duration_ms']:.0f} ms)", flush=True)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Password hashing with a salted, tunable KDF and login attempt limiting.
+
+Hashes are stored as self-describing strings, so cost settings can change
+without a migration:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+Unsalted SHA-256 hex digests from earlier versions still verify; callers
+replace them (and hashes made with old cost settings) after a successful
+login, see needs_rehash(). KDF work runs on a small bounded thread pool so a
+burst of logins queues there, not on every session's script thread.
+
+Environment:
+    PASSWORD_KDF                  "scrypt" (default) or "pbkdf2_sha256"
+    PASSWORD_SCRYPT_N             scrypt CPU/memory cost (default 16384)
+    PASSWORD_PBKDF2_ITERATIONS    PBKDF2 iterations (default 600000)
+    PASSWORD_KDF_WORKERS          threads doing KDF work (default 2)
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+ALGORITHM = os.environ.get("PASSWORD_KDF", "scrypt")
+COST = {
+    "scrypt": {"n": int(os.environ.get("PASSWORD_SCRYPT_N", 2 ** 14)), "r": 8, "p": 1},
+    "pbkdf2_sha256": {"iterations": int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", 600_000))},
+}
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+KDF_WORKERS = int(os.environ.get("PASSWORD_KDF_WORKERS", 2))
+MAX_PENDING = 64                # queued KDF jobs beyond this are refused
+KDF_TIMEOUT = 30                # seconds a caller waits for its job
+
+# Failed attempts allowed per window before further attempts are refused
+WINDOW = 15 * 60
+MAX_FAILURES_PER_USER = 5
+MAX_FAILURES_PER_IP = 20
+
+
+class Busy(Exception):
+    """Too many password hashes are already queued"""
+
+
+class TooManyAttempts(Exception):
+    """Login refused because of recent failures; retry_after is in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed attempts, try again in {int(retry_after) + 1} seconds")
+        self.retry_after = retry_after
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _derive(password, algorithm, cost, salt):
+    if algorithm == "scrypt":
+        n, r, p = cost["n"], cost["r"], cost["p"]
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=KEY_BYTES)
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, cost["iterations"], KEY_BYTES)
+    raise ValueError(f"unknown password algorithm {algorithm!r}")
+
+
+def _encode(algorithm, cost, salt, key):
+    if algorithm == "scrypt":
+        params = [cost["n"], cost["r"], cost["p"]]
+    else:
+        params = [cost["iterations"]]
+    return "$".join([algorithm, *map(str, params), _b64(salt), _b64(key)])
+
+
+def _decode(encoded):
+    """(algorithm, cost, salt, key) of a stored hash; algorithm is "sha256" for legacy digests"""
+    parts = encoded.split("$")
+    if len(parts) == 1:
+        return "sha256", {}, b"", encoded
+    algorithm = parts[0]
+    if algorithm == "scrypt":
+        cost = {"n": int(parts[1]), "r": int(parts[2]), "p": int(parts[3])}
+    elif algorithm == "pbkdf2_sha256":
+        cost = {"iterations": int(parts[1])}
+    else:
+        raise ValueError(f"unknown password algorithm {algorithm!r}")
+    return algorithm, cost, _unb64(parts[-2]), _unb64(parts[-1])
+
+
+def hash_password_sync(password, algorithm=None, cost=None):
+    """Salted hash of a password in the current (or given) algorithm and cost, on this thread"""
+    algorithm = algorithm or ALGORITHM
+    cost = cost or COST[algorithm]
+    salt = secrets.token_bytes(SALT_BYTES)
+    return _encode(algorithm, cost, salt, _derive(password, algorithm, cost, salt))
+
+
+def verify_sync(password, encoded):
+    """Whether `password` matches a stored hash, on this thread"""
+    algorithm, cost, salt, key = _decode(encoded)
+    if algorithm == "sha256":
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), key)
+    return hmac.compare_digest(_derive(password, algorithm, cost, salt), key)
+
+
+def needs_rehash(encoded):
+    """Whether a stored hash is legacy or was made with other settings than the current ones"""
+    algorithm, cost, _, _ = _decode(encoded)
+    return algorithm != ALGORITHM or cost != COST[ALGORITHM]
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix="kdf")
+    return _executor
+
+
+def _run(func, *args):
+    """Run KDF work on the shared pool and wait for it; raise Busy if the queue is full or the wait times out"""
+    if not _pending.acquire(blocking=False):
+        raise Busy("too many logins in progress, please try again")
+    try:
+        future = _get_executor().submit(func, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    try:
+        return future.result(timeout=KDF_TIMEOUT)
+    except FutureTimeout:
+        # Still queued: give up its place; already running: it finishes and is discarded
+        future.cancel()
+        raise Busy("logins are taking too long, please try again") from None
+
+
+def hash_password(password):
+    """Salted hash of a password with the current settings, computed on the KDF pool"""
+    return _run(hash_password_sync, password)
+
+
+def verify(password, encoded):
+    """Check a password against a stored hash on the KDF pool"""
+    return _run(verify_sync, password, encoded)
+
+
+# A hash of a random password, checked for unknown usernames so they take as
+# long to reject as wrong passwords do
+_dummy_hash = None
+
+
+def verify_dummy(password):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(16))
+    verify(password, _dummy_hash)
+    return False
+
+
+class AttemptLimiter:
+    """Sliding-window count of failed logins per username and per client IP.
+
+    Counts are kept in process memory, so each app replica limits separately.
+    """
+
+    def __init__(self, window=WINDOW, max_per_user=MAX_FAILURES_PER_USER, max_per_ip=MAX_FAILURES_PER_IP):
+        self.window = window
+        self.limits = {"user": max_per_user, "ip": max_per_ip}
+        self._failures = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _keys(self, username, ip):
+        keys = [("user", username.lower())]
+        if ip:
+            keys.append(("ip", ip))
+        return keys
+
+    def check(self, username, ip=None):
+        """Raise TooManyAttempts if either key has used up its failures in the window"""
+        now = time.monotonic()
+        with self._lock:
+            for key in self._keys(username, ip):
+                failures = self._failures.get(key)
+                if not failures:
+                    continue
+                while failures and failures[0] <= now - self.window:
+                    failures.popleft()
+                if not failures:
+                    del self._failures[key]
+                elif len(failures) >= self.limits[key[0]]:
+                    raise TooManyAttempts(failures[0] + self.window - now)
+
+    def failed(self, username, ip=None):
+        now = time.monotonic()
+        with self._lock:
+            for key in self._keys(username, ip):
+                self._failures[key].append(now)
+            if len(self._failures) > 10000:
+                # Many distinct usernames (e.g. a spraying attack): drop keys with only stale failures
+                for key in [k for k, f in self._failures.items() if f[-1] <= now - self.window]:
+                    del self._failures[key]
+
+    def succeeded(self, username, ip=None):
+        """Forget the username's failures; the IP's count is kept"""
+        with self._lock:
+            self._failures.pop(("user", username.lower()), None)
+
+
+limiter = AttemptLimiter()
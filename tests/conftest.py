@@ -0,0 +1,82 @@
+import logging
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import cache
+import db
+import migrations
+
+# Every test that uses a database runs once per backend. PostgreSQL tests use
+# TEST_DATABASE_URL (e.g. a throwaway container) or else start a local server
+# with pgserver, and are skipped when neither psycopg nor a server is available.
+BACKENDS = ["sqlite", "postgresql"]
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    """URL of the PostgreSQL server the tests run against"""
+    pytest.importorskip("psycopg")
+    url = os.environ.get("TEST_DATABASE_URL")
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip("pgserver", reason="set TEST_DATABASE_URL or install pgserver")
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@contextmanager
+def _schema(url):
+    """A URL for a fresh schema on the server at `url`, dropped afterwards, so tests do not see each other's rows"""
+    import psycopg
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {name}")
+    try:
+        yield url + ("&" if "?" in url else "?") + f"options=-csearch_path%3D{name}"
+    finally:
+        db.get_pool().close()
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA {name} CASCADE")
+
+
+@contextmanager
+def configured(request, backend, path, **options):
+    """Point db at an empty, migrated database on `backend` for the duration of the block"""
+    # Entries cached against the previous database could match the new one's generations
+    cache.clear()
+    if backend == "postgresql":
+        with _schema(request.getfixturevalue("postgres_url")) as url:
+            db.configure(url, **options)
+            migrations.migrate()
+            yield
+    else:
+        db.configure(f"sqlite:///{path}", **options)
+        migrations.migrate()
+        yield
+        db.get_pool().close()
+    cache.clear()
+
+
+@pytest.fixture(params=BACKENDS)
+def database(request, tmp_path):
+    """A freshly migrated database, configured as the process-wide pool; the value is the backend name"""
+    with configured(request, request.param, tmp_path / "test.db"):
+        yield request.param
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The app module; outside `streamlit run` its page calls only log warnings, which are silenced"""
+    logging.disable(logging.WARNING)
+    import app
+    yield app
+    logging.disable(logging.NOTSET)
@@ -0,0 +1,76 @@
+"""Analytics rollups: incremental refresh and the report read from them, on every backend"""
+from datetime import datetime
+
+import pytest
+
+import analytics
+import db
+
+NOW = 1_760_000_000
+DAY = 86400
+
+
+def _insert_loan(c, resource_id, borrowed_ts, returned_ts=None):
+    c.execute("""INSERT INTO borrowings (user_id, resource_id, borrowed_at, due_date, returned_at, status,
+                                         borrowed_ts, due_ts, returned_ts)
+                 VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?)""",
+              (resource_id, datetime.fromtimestamp(borrowed_ts), datetime.fromtimestamp(borrowed_ts + 14 * DAY),
+               datetime.fromtimestamp(returned_ts) if returned_ts else None, "returned" if returned_ts else "active",
+               borrowed_ts, borrowed_ts + 14 * DAY, returned_ts))
+
+
+@pytest.fixture
+def loans(database, app):
+    """Six book loans and two journal loans over the last three weeks; four returned, one of them late"""
+    app.add_resource("Popular Book", "Author", "book", quantity=10)
+    app.add_resource("Quiet Journal", "Editor", "journal", quantity=10)
+    with db.transaction() as c:
+        for i in range(6):
+            borrowed_ts = NOW - (20 - i) * DAY
+            _insert_loan(c, 1, borrowed_ts, borrowed_ts + (2 if i < 2 else 15) * DAY if i < 3 else None)
+        _insert_loan(c, 2, NOW - 10 * DAY, NOW - 6 * DAY)
+        _insert_loan(c, 2, NOW - 2 * DAY)
+
+
+def test_report_before_any_refresh(database, app):
+    report = analytics.report(days=30, now=NOW)
+    assert report["refreshed_at"] is None
+    assert (report["loans"], report["returns"], report["avg_loan_days"]) == (0, 0, None)
+
+
+def test_refresh_and_report(loans):
+    assert {k: v for k, v in analytics.refresh(now=NOW).items() if k != "elapsed"} == {"loans": 8, "returns": 4}
+    report = analytics.report(days=30, now=NOW)
+    assert report["refreshed_at"] == NOW
+    assert (report["loans"], report["returns"]) == (8, 4)
+    assert report["late_return_rate"] == 0.25
+    assert report["avg_loan_days"] == (2 + 2 + 15 + 4) / 4
+    assert report["by_type"].to_dict("index") == {"book": {"loans": 6, "returns": 3},
+                                                   "journal": {"loans": 2, "returns": 1}}
+    assert list(report["top_resources"]["Loans"]) == [6, 2]
+    assert report["daily"]["loans"].sum() == 8 and len(report["daily"]) == 30
+    # Only loans borrowed within the window count
+    assert analytics.report(days=15, now=NOW)["loans"] == 2
+
+
+def test_refresh_is_incremental(loans):
+    analytics.refresh(now=NOW)
+    before = analytics.report(days=30, now=NOW)
+    assert analytics.refresh(now=NOW)["loans"] == 0
+    assert analytics.report(days=30, now=NOW)["loans"] == before["loans"]
+
+    with db.transaction() as c:
+        c.execute("SELECT id FROM borrowings WHERE status='active' ORDER BY id LIMIT 1")
+        loan_id = c.fetchone()[0]
+        c.execute("UPDATE borrowings SET status='returned', returned_ts=? WHERE id=?", (NOW - DAY, loan_id))
+        _insert_loan(c, 2, NOW - DAY)
+    assert {k: v for k, v in analytics.refresh(now=NOW).items() if k != "elapsed"} == {"loans": 1, "returns": 1}
+    after = analytics.report(days=30, now=NOW)
+    assert (after["loans"], after["returns"]) == (9, 5)
+
+
+def test_returns_settle_before_they_are_folded_in(loans):
+    with db.transaction() as c:
+        _insert_loan(c, 2, NOW - DAY, NOW - analytics.SETTLE_SECONDS // 2)
+    assert analytics.refresh(now=NOW)["returns"] == 4
+    assert analytics.refresh(now=NOW + analytics.SETTLE_SECONDS)["returns"] == 1
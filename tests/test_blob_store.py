@@ -0,0 +1,44 @@
+"""Content-addressed upload storage and its garbage collection, on every backend"""
+import io
+import os
+
+import pytest
+
+import blob_store
+import db
+
+
+@pytest.fixture
+def blobs(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOBS_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_store, "TMP_DIR", str(tmp_path / "blobs" / "tmp"))
+
+
+def _age(path, seconds):
+    with db.transaction() as c:
+        c.execute("UPDATE files SET created_at = ? WHERE path = ?", (blob_store._timestamp(seconds), path))
+    os.utime(path, (os.path.getatime(path), os.path.getmtime(path) - seconds))
+
+
+def test_identical_uploads_share_one_blob(blobs):
+    first = blob_store.store(io.BytesIO(b"same content"), "a.txt")
+    second = blob_store.store(io.BytesIO(b"same content"), "b.txt")
+    assert first == second
+    assert os.path.exists(first)
+
+
+def test_gc_removes_old_orphans_only(blobs):
+    old = blob_store.store(io.BytesIO(b"abandoned upload"), "old.txt")
+    new = blob_store.store(io.BytesIO(b"upload in progress"), "new.txt")
+    _age(old, 2 * 86400)
+    assert blob_store.gc() == [old]
+    assert not os.path.exists(old) and os.path.exists(new)
+
+
+def test_reupload_of_an_old_orphan_gets_a_fresh_grace_period(blobs):
+    path = blob_store.store(io.BytesIO(b"uploaded twice"), "first.txt")
+    _age(path, 2 * 86400)
+    # Re-uploaded for a resource that has not been saved yet
+    assert blob_store.store(io.BytesIO(b"uploaded twice"), "second.txt") == path
+    assert blob_store.gc() == []
+    assert os.path.exists(path)
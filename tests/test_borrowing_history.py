@@ -0,0 +1,84 @@
+"""Borrowing history paging, streaming and export, on every backend"""
+import csv
+from datetime import datetime
+
+import pytest
+
+import borrowing_history
+import db
+
+LOANS = 130
+START = 1_700_000_000
+
+
+@pytest.fixture
+def loans(database, app):
+    """LOANS loans over two students and three resources, three to a timestamp; returns their ids newest first"""
+    for name in ("ann", "bob"):
+        app.register_user(name, "secret")
+    for title in ("First", "Second", "Third"):
+        app.add_resource(title, "Author", "book", quantity=LOANS)
+    with db.transaction() as c:
+        c.execute("SELECT id FROM users WHERE username IN ('ann', 'bob') ORDER BY username")
+        users = [row[0] for row in c.fetchall()]
+        c.execute("SELECT id FROM resources ORDER BY id")
+        resources = [row[0] for row in c.fetchall()]
+        for i in range(LOANS):
+            borrowed_ts = START + (i // 3) * 3600
+            due_ts = borrowed_ts + 14 * 86400
+            returned_ts = borrowed_ts + 86400 if i % 4 else None
+            c.execute("""INSERT INTO borrowings (user_id, resource_id, borrowed_at, due_date, returned_at, status,
+                                                 borrowed_ts, due_ts, returned_ts)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                      (users[i % 2], resources[i % 3], datetime.fromtimestamp(borrowed_ts),
+                       datetime.fromtimestamp(due_ts), returned_ts and datetime.fromtimestamp(returned_ts),
+                       "returned" if returned_ts else "active", borrowed_ts, due_ts, returned_ts))
+        c.execute("SELECT id FROM borrowings ORDER BY borrowed_ts DESC, id DESC")
+        return [row[0] for row in c.fetchall()]
+
+
+def _pages(**filters):
+    ids, after = [], None
+    while True:
+        page = borrowing_history.history_page(before=after, limit=20, **filters)
+        ids.extend(row[0] for row in page)
+        if len(page) < 20:
+            return ids
+        after = page[-1][0]
+
+
+def test_pages_cover_every_loan_once_in_order(loans):
+    # Page boundaries fall between loans that share a timestamp
+    assert _pages() == loans
+
+
+def test_filters(loans, app):
+    with db.transaction() as c:
+        c.execute("SELECT id FROM borrowings WHERE status='active' ORDER BY borrowed_ts DESC, id DESC")
+        active = [row[0] for row in c.fetchall()]
+        c.execute("""SELECT b.id FROM borrowings b JOIN users u ON u.id = b.user_id
+                     WHERE u.username='bob' ORDER BY b.borrowed_ts DESC, b.id DESC""")
+        bobs = [row[0] for row in c.fetchall()]
+    assert _pages(status="active") == active
+    assert _pages(username="bob") == bobs
+    assert _pages(start=START + 3600, end=START + 3 * 3600) == loans[-9:-3]
+    # An empty resource filter matches nothing rather than everything
+    assert _pages(resource_ids=[]) == []
+    assert app.get_borrowing_history(resource_ids=(), limit=20) == []
+    assert [row[0] for row in app.get_borrowing_history(limit=20)] == loans[:20]
+
+
+def test_iter_history_streams_the_same_rows(loans):
+    chunks = list(borrowing_history.iter_history(chunk_size=50))
+    assert [len(chunk) for chunk in chunks] == [50, 50, 30]
+    assert [row for chunk in chunks for row in chunk] == borrowing_history.history_page(limit=None)
+    assert list(borrowing_history.iter_history(resource_ids=[])) == []
+
+
+def test_export_csv(loans, tmp_path):
+    path = tmp_path / "history.csv"
+    assert borrowing_history.export(str(path), chunk_size=40, username="ann") == LOANS // 2
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert len(rows) == LOANS // 2 + 1
+    assert {row[1] for row in rows[1:]} == {"ann"}
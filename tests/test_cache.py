@@ -0,0 +1,101 @@
+"""Read-cache invalidation shared between processes through the database"""
+import threading
+
+import pytest
+
+import cache
+import db
+
+
+@pytest.fixture
+def reads(database, monkeypatch):
+    """A cached read of the "catalogue" scope that counts its misses; polling runs before every read"""
+    monkeypatch.setattr(cache, "SYNC_INTERVAL", 0)
+    calls = []
+
+    @cache.cached_read("catalogue")
+    def read():
+        calls.append(1)
+        return len(calls)
+
+    return read
+
+
+def _versions():
+    with db.transaction() as c:
+        c.execute("SELECT scope, version FROM cache_scopes ORDER BY scope")
+        return dict(c.fetchall())
+
+
+def _write(*scopes):
+    """A write path: publish inside the transaction, bump after the commit"""
+    with db.transaction() as c:
+        cache.publish(c, *scopes)
+    cache.bump(*scopes)
+
+
+def _write_elsewhere(*scopes):
+    """What a write in another process leaves behind: published, but never bumped here"""
+    def publish():
+        with db.transaction() as c:
+            cache.publish(c, *scopes)
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    thread.join()
+
+
+def test_publish_stamps_new_versions(reads):
+    _write("catalogue", "users")
+    first = _versions()
+    _write("users")
+    second = _versions()
+    assert set(first) == {"catalogue", "users"}
+    assert second["catalogue"] == first["catalogue"]
+    assert second["users"] > max(first.values())
+
+
+def test_publish_rolls_back_with_the_write(reads):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as c:
+            cache.publish(c, "catalogue")
+            raise RuntimeError("write failed")
+    assert _versions() == {}
+
+
+def test_writes_from_other_processes_invalidate(reads):
+    assert (reads(), reads()) == (1, 1)
+    _write_elsewhere("catalogue")
+    assert (reads(), reads()) == (2, 2)
+    _write_elsewhere("holds")
+    assert reads() == 2
+
+
+def test_own_writes_invalidate_once(reads):
+    reads()
+    generation = cache.generation("catalogue")
+    _write("catalogue")
+    assert (reads(), reads()) == (2, 2)
+    # Reading its own version back from the table does not invalidate again
+    assert cache.generation("catalogue") == generation + 1
+
+
+def test_late_commits_are_still_seen(reads, monkeypatch):
+    # A version drawn before the last poll but committed after it, as can happen on PostgreSQL
+    monkeypatch.setattr(cache, "SETTLE", 3600)
+    reads()
+    _write_elsewhere("users")
+    reads()
+    with db.transaction() as c:
+        c.execute("SELECT version FROM cache_scopes WHERE scope = 'users'")
+        version = c.fetchone()[0]
+        # No newer than what the last poll saw
+        c.execute("INSERT INTO cache_scopes (scope, version) VALUES ('catalogue', ?)", (version,))
+    assert reads() == 2
+
+
+def test_polling_waits_for_the_interval(reads, monkeypatch):
+    reads()
+    monkeypatch.setattr(cache, "SYNC_INTERVAL", 3600)
+    _write_elsewhere("catalogue")
+    assert reads() == 1
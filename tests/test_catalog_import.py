@@ -0,0 +1,51 @@
+"""Bulk catalogue loading, small batches and large loads, on every backend"""
+import catalog_import
+import db
+
+
+def _resources(count, start=0, cover=False):
+    for i in range(start, start + count):
+        yield {"title": f"Imported Volume {i}", "author": "Bulk Author", "isbn": f"979{i:010d}", "quantity": 2,
+               "cover_url": "https://covers.example.org/1.jpg" if cover and i % 2 else ""}
+
+
+def _state():
+    with db.transaction() as c:
+        c.execute("SELECT total_resources, total_copies FROM library_stats WHERE id=1")
+        stats = c.fetchone()
+        c.execute("SELECT COUNT(*) FROM thumbnails")
+        return stats, c.fetchone()[0], sorted(catalog_import.table_objects(c, "resources"))
+
+
+def test_small_batches_keep_indexes_in_place(database, app, monkeypatch):
+    def refuse(c, name):
+        raise AssertionError(f"{name} was dropped for a small batch")
+
+    monkeypatch.setattr(catalog_import, "drop_object", refuse)
+    result = catalog_import.add_resources_bulk(_resources(50, cover=True))
+    assert result == {"inserted": 50, "duplicates": []}
+    assert _state()[:2] == ((50, 100), 25)
+    assert len(app.search_resources("imported volume", limit=100)) == 50
+
+
+def test_large_loads_suspend_and_catch_up(database, app, monkeypatch):
+    objects = _state()[2]
+    dropped = []
+    drop = catalog_import.drop_object
+    monkeypatch.setattr(catalog_import, "drop_object", lambda c, name: dropped.append(name) or drop(c, name))
+    monkeypatch.setattr(catalog_import, "SUSPEND_MIN_ROWS", 100)
+
+    # The first chunks go in with the indexes in place; the rest are caught up afterwards
+    result = catalog_import.add_resources_bulk(_resources(250, cover=True), chunk_size=40)
+    assert result["inserted"] == 250
+    assert dropped
+    assert _state() == ((250, 500), 125, objects)
+    assert len(app.search_resources("imported volume", limit=300)) == 250
+
+
+def test_duplicates_are_skipped(database):
+    catalog_import.add_resources_bulk(_resources(3))
+    result = catalog_import.add_resources_bulk(list(_resources(5)) + list(_resources(1, start=4)))
+    assert result == {"inserted": 2, "duplicates": ["9790000000000", "9790000000001", "9790000000002",
+                                                    "9790000000004"]}
+
@@ -0,0 +1,171 @@
+"""Borrowing, returns with the hold queue, renewals and the dashboard totals, on every backend"""
+import time
+
+import pytest
+
+import db
+
+DAY = 86400
+
+
+def _user(app, username):
+    app.register_user(username, "secret")
+    with db.transaction() as c:
+        c.execute("SELECT id FROM users WHERE username=?", (username,))
+        return c.fetchone()[0]
+
+
+def _resource(app, title, quantity=1):
+    app.add_resource(title, "Author", "book", quantity=quantity)
+    with db.transaction() as c:
+        c.execute("SELECT id FROM resources WHERE title=?", (title,))
+        return c.fetchone()[0]
+
+
+def _available(resource_id):
+    with db.transaction() as c:
+        c.execute("SELECT available FROM resources WHERE id=?", (resource_id,))
+        return c.fetchone()[0]
+
+
+def _loan(user_id, resource_id):
+    with db.transaction() as c:
+        c.execute("SELECT id, due_ts, renewals FROM borrowings WHERE user_id=? AND resource_id=? AND status='active'",
+                  (user_id, resource_id))
+        return c.fetchone()
+
+
+@pytest.fixture
+def library(database, app):
+    """Three students and a single-copy resource"""
+    return {
+        "ann": _user(app, "ann"),
+        "bob": _user(app, "bob"),
+        "cat": _user(app, "cat"),
+        "book": _resource(app, "Only Copy"),
+    }
+
+
+def test_borrow_claims_a_copy(app, library):
+    ann, bob, book = library["ann"], library["bob"], library["book"]
+    assert app.borrow_resource(ann, book) == (True, "Resource borrowed successfully!")
+    assert _available(book) == 0
+    assert [row[7] for row in app.get_user_borrowings(ann)] == [book]
+
+    assert app.borrow_resource(ann, book) == (False, "You have already borrowed this resource!")
+    assert app.borrow_resource(bob, book) == (False, "Resource is not available!")
+    assert _available(book) == 0
+
+
+def test_borrow_stops_at_the_loan_limit(app, library):
+    ann = library["ann"]
+    for i in range(app.MAX_LOANS):
+        assert app.borrow_resource(ann, _resource(app, f"Limit {i}"))[0]
+    extra = _resource(app, "One Too Many")
+    ok, message = app.borrow_resource(ann, extra)
+    assert not ok and str(app.MAX_LOANS) in message
+    assert _available(extra) == 1
+
+
+def test_return_restocks_without_holds(app, library):
+    ann, book = library["ann"], library["book"]
+    app.borrow_resource(ann, book)
+    loan_id = _loan(ann, book)[0]
+    assert app.return_resource(loan_id)
+    assert _available(book) == 1
+    assert app.get_user_borrowings(ann) == []
+    # A second return of the same loan is a no-op
+    assert not app.return_resource(loan_id)
+    assert _available(book) == 1
+
+
+def test_return_hands_the_copy_to_the_first_hold(app, library):
+    ann, bob, cat, book = library["ann"], library["bob"], library["cat"], library["book"]
+    app.borrow_resource(ann, book)
+    assert app.place_hold(bob, book)[1].startswith("You are number 1 ")
+    assert app.place_hold(cat, book)[1].startswith("You are number 2 ")
+
+    assert app.return_resource(_loan(ann, book)[0])
+    # The copy went straight to bob and never came back on the shelf
+    assert _available(book) == 0
+    loan_id = _loan(bob, book)[0]
+    assert _loan(cat, book) is None
+    assert [row[5] for row in app.get_user_holds(bob)] == ["fulfilled"]
+    assert [(row[5], row[8]) for row in app.get_user_holds(cat)] == [("waiting", 1)]
+    with db.transaction() as c:
+        c.execute("SELECT user_id, borrowing_id, kind FROM notifications")
+        assert c.fetchall() == [(bob, loan_id, "hold_fulfilled")]
+
+
+def test_return_skips_holders_at_the_loan_limit(app, library):
+    ann, bob, cat, book = library["ann"], library["bob"], library["cat"], library["book"]
+    app.borrow_resource(ann, book)
+    app.place_hold(bob, book)
+    app.place_hold(cat, book)
+    for i in range(app.MAX_LOANS):
+        app.borrow_resource(bob, _resource(app, f"Bob's {i}"))
+
+    app.return_resource(_loan(ann, book)[0])
+    assert _loan(cat, book) is not None
+    # bob keeps his place for the next copy
+    assert [(row[5], row[8]) for row in app.get_user_holds(bob)][0] == ("waiting", 1)
+
+
+def test_renew_extends_the_loan(app, library):
+    ann, book = library["ann"], library["book"]
+    app.borrow_resource(ann, book)
+    loan_id, due_ts, _ = _loan(ann, book)
+    ok, message = app.renew_resource(ann, loan_id)
+    assert ok and message.startswith("Renewed until ")
+    assert _loan(ann, book)[1:] == (due_ts + app.LOAN_DAYS * DAY, 1)
+
+
+def test_renew_is_refused_while_someone_waits(app, library):
+    ann, bob, book = library["ann"], library["bob"], library["book"]
+    app.borrow_resource(ann, book)
+    app.place_hold(bob, book)
+    loan_id, due_ts, _ = _loan(ann, book)
+    assert app.renew_resource(ann, loan_id) == (
+        False, "Another student is waiting for this resource, so it cannot be renewed.")
+    assert _loan(ann, book)[1:] == (due_ts, 0)
+
+
+def test_renew_stops_at_the_renewal_limit(app, library):
+    ann, book = library["ann"], library["book"]
+    app.borrow_resource(ann, book)
+    loan_id = _loan(ann, book)[0]
+    for _ in range(app.MAX_RENEWALS):
+        assert app.renew_resource(ann, loan_id)[0]
+    ok, message = app.renew_resource(ann, loan_id)
+    assert not ok and str(app.MAX_RENEWALS) in message
+    # Other students' loans and returned loans cannot be renewed
+    assert app.renew_resource(library["bob"], loan_id) == (False, "This loan is no longer active!")
+
+
+def test_overdue_renewal_counts_from_today(app, library):
+    ann, book = library["ann"], library["book"]
+    app.borrow_resource(ann, book)
+    loan_id = _loan(ann, book)[0]
+    with db.transaction() as c:
+        c.execute("UPDATE borrowings SET due_ts = due_ts - 30 * 86400 WHERE id=?", (loan_id,))
+    before = int(time.time())
+    app.renew_resource(ann, loan_id)
+    assert before + app.LOAN_DAYS * DAY <= _loan(ann, book)[1] <= int(time.time()) + app.LOAN_DAYS * DAY
+
+
+def test_stats_follow_the_tables(app, library):
+    ann, bob, cat, book = library["ann"], library["bob"], library["cat"], library["book"]
+    _resource(app, "Three Copies", quantity=3)
+    app.borrow_resource(ann, book)
+    app.place_hold(bob, book)
+    app.return_resource(_loan(ann, book)[0])
+    app.borrow_resource(cat, _resource(app, "Another"))
+
+    with db.transaction() as c:
+        c.execute("""SELECT (SELECT COUNT(*) FROM resources), (SELECT SUM(quantity) FROM resources),
+                            (SELECT COUNT(*) FROM borrowings WHERE status='active'),
+                            (SELECT COUNT(*) FROM users WHERE role='student')""")
+        expected = dict(zip(["total_resources", "total_copies", "active_borrowings", "total_students"],
+                            c.fetchone()))
+    assert app.get_library_stats() == expected
+    assert expected == {"total_resources": 3, "total_copies": 5, "active_borrowings": 2, "total_students": 3}
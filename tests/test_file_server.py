@@ -0,0 +1,40 @@
+"""Signed file links, and their absence when browsers have no address for the server"""
+import socket
+import urllib.request
+
+import pytest
+
+import file_server
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_server, "UPLOADS_DIR", str(tmp_path))
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"0123456789" * 10)
+    return str(path)
+
+
+def test_no_links_without_a_public_url(upload, monkeypatch):
+    monkeypatch.setattr(file_server, "PUBLIC_URL", None)
+    assert not file_server.enabled()
+    with pytest.raises(RuntimeError):
+        file_server.signed_url(upload)
+
+
+def test_signed_links_serve_ranges(upload, monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    monkeypatch.setattr(file_server, "PORT", port)
+    monkeypatch.setattr(file_server, "PUBLIC_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(file_server, "_server", None)
+    url = file_server.signed_url(upload, "notes.txt")
+    request = urllib.request.Request(url, headers={"Range": "bytes=5-14"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            assert response.status == 206
+            assert response.read() == b"5678901234"
+    finally:
+        file_server._server.shutdown()
+        file_server._server.server_close()
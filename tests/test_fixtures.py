@@ -0,0 +1,44 @@
+"""The benchmark fixture builder, on every backend"""
+from datetime import date
+
+import pytest
+
+import catalog_import
+import db
+from benchmarks import fixtures
+
+SIZES = {"resources": 300, "users": 40, "borrowings": 3000}
+
+
+def _objects():
+    with db.transaction() as c:
+        return {table: sorted(catalog_import.table_objects(c, table)) for table in ("users", "borrowings")}
+
+
+def test_build(database, tmp_path):
+    objects = _objects()
+    assert objects["borrowings"]
+    # A PostgreSQL fixture goes into the empty test schema; a SQLite one must be a new file
+    target = db.DB_PATH if database == "postgresql" else str(tmp_path / "fixture.db")
+    params = fixtures.build(target, **SIZES, end=date(2026, 1, 1), progress=lambda message: None)
+    assert {k: params[k] for k in SIZES} == SIZES
+
+    # The indexes and triggers suspended for the load are all back
+    assert _objects() == objects
+    with db.transaction() as c:
+        c.execute("SELECT COUNT(*) FROM users WHERE role='student'")
+        assert c.fetchone()[0] == SIZES["users"]
+        c.execute("SELECT COUNT(*), SUM(CASE WHEN status='active' THEN 1 ELSE 0 END) FROM borrowings")
+        loans, active = c.fetchone()
+        assert loans == SIZES["borrowings"] and active > 0
+        c.execute("SELECT total_resources, total_students, active_borrowings FROM library_stats WHERE id=1")
+        assert c.fetchone() == (SIZES["resources"], SIZES["users"], active)
+        # Every copy on loan is accounted for on its resource
+        c.execute("""SELECT COUNT(*) FROM resources r
+                     WHERE r.quantity - r.available <> (SELECT COUNT(*) FROM borrowings b
+                                                        WHERE b.resource_id = r.id AND b.status='active')""")
+        assert c.fetchone()[0] == 0
+
+    with pytest.raises(FileExistsError):
+        fixtures.build(target, **SIZES, progress=lambda message: None)
+    assert fixtures.describe(target) == ({} if database == "postgresql" else params)
@@ -0,0 +1,35 @@
+"""Slow-query logging, on every backend"""
+import pytest
+
+import db
+import metrics
+
+
+@pytest.fixture
+def log_everything(database, monkeypatch):
+    if not metrics.SQL_METRICS:
+        pytest.skip("SQL metrics are disabled")
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    metrics._slow.clear()
+
+
+def _plans(fragment):
+    return [entry["plan"] for entry in metrics._slow if fragment in entry["statement"]]
+
+
+def test_slow_statements_are_logged_with_their_plan(log_everything):
+    with db.transaction() as c:
+        c.execute("SELECT id FROM resources WHERE resource_type = ?", ("book",))
+        c.fetchall()
+    [plan] = _plans("WHERE resource_type")
+    assert plan and not plan[0].startswith("(no plan")
+
+
+def test_explaining_does_not_wait_on_the_callers_own_locks(log_everything):
+    # The plan comes from another connection, which must not block on this transaction's DROP INDEX
+    with db.transaction(immediate=True) as c:
+        c.execute("DROP INDEX idx_resources_type")
+        c.execute("SELECT COUNT(*) FROM resources WHERE resource_type = ?", ("book",))
+        c.fetchone()
+        c.execute("CREATE INDEX idx_resources_type ON resources(resource_type)")
+    assert len(_plans("COUNT(*)")) == 1
@@ -0,0 +1,150 @@
+"""Open Library client against a local stub server (OPENLIBRARY_URL)"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+import db
+import openlibrary
+
+BOOKS = {
+    "9780140328721": {"title": "Fantastic Mr Fox", "authors": [{"name": "Roald Dahl"}],
+                      "cover": {"medium": "https://covers.example/fox-M.jpg"}},
+    "9780439064873": {"title": "Harry Potter and the Chamber of Secrets", "authors": [{"name": "J. K. Rowling"}]},
+}
+# ISBN -> upstream status; 503 is retried by the session first
+FAILING = {"9780000000500": 500, "9780000000503": 503}
+SLOW = "9780000000777"
+
+
+class _Stub(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        self.requests.append((url.path, query))
+        bibkeys = query.get("bibkeys", "").split(",")
+        for isbn, status in FAILING.items():
+            if f"ISBN:{isbn}" in bibkeys:
+                return self._send(status, {})
+        if f"ISBN:{SLOW}" in bibkeys:
+            time.sleep(1)
+        if url.path == "/api/books":
+            body = {key: BOOKS[key[5:]] for key in bibkeys if key[5:] in BOOKS}
+        else:
+            body = {"docs": []}
+        self._send(200, body)
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def stub(database, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # What OPENLIBRARY_URL sets when the module is imported
+    monkeypatch.setattr(openlibrary, "BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(openlibrary, "TIMEOUT", 0.2)
+    _Stub.requests = []
+    yield _Stub.requests
+    server.shutdown()
+    server.server_close()
+
+
+def _delta(before):
+    after = openlibrary.cache_stats()
+    return {name: after[name] - before[name] for name in after}
+
+
+def _cached_row(key):
+    with db.transaction() as c:
+        c.execute("SELECT payload, fetched_at, expires_at FROM api_cache WHERE key=?", (key,))
+        return c.fetchone()
+
+
+def test_hit_then_cached_hit(stub):
+    before = openlibrary.cache_stats()
+    book = openlibrary.lookup("978-0-14-032872-1")
+    assert book["title"] == "Fantastic Mr Fox"
+    assert book["author"] == "Roald Dahl"
+    assert openlibrary.lookup("9780140328721") == book
+    assert len(stub) == 1
+    assert _delta(before) == {"hits": 1, "negative_hits": 0, "misses": 1, "upstream_errors": 0}
+    payload, fetched_at, expires_at = _cached_row("isbn:9780140328721")
+    assert expires_at - fetched_at == pytest.approx(openlibrary.POSITIVE_TTL)
+
+
+def test_miss_is_cached_for_the_negative_ttl(stub):
+    before = openlibrary.cache_stats()
+    assert openlibrary.lookup("9781111111111") is None
+    assert openlibrary.lookup("9781111111111") is None
+    assert len(stub) == 1
+    assert _delta(before) == {"hits": 0, "negative_hits": 1, "misses": 1, "upstream_errors": 0}
+
+    payload, fetched_at, expires_at = _cached_row("isbn:9781111111111")
+    assert payload is None
+    assert expires_at - fetched_at == pytest.approx(openlibrary.NEGATIVE_TTL) == 3600
+
+    # Once the hour is up the miss is looked up again
+    with db.transaction() as c:
+        c.execute("UPDATE api_cache SET expires_at=? WHERE key=?", (time.time() - 1, "isbn:9781111111111"))
+    assert openlibrary.lookup("9781111111111") is None
+    assert len(stub) == 2
+
+
+def test_title_miss_is_cached(stub):
+    assert openlibrary.lookup("  No Such   Book ") is None
+    assert openlibrary.lookup("no such book") is None
+    assert stub == [("/search.json", {"title": "  No Such   Book ", "limit": "1"})]
+
+
+@pytest.mark.parametrize("isbn", FAILING)
+def test_upstream_error_is_not_cached(stub, isbn):
+    before = openlibrary.cache_stats()
+    for _ in range(2):
+        with pytest.raises(requests.RequestException):
+            openlibrary.lookup(isbn)
+    assert _delta(before)["upstream_errors"] == 2
+    assert _delta(before)["misses"] == 2
+    assert _cached_row(f"isbn:{isbn}") is None
+
+
+def test_timeout_is_not_cached(stub):
+    with pytest.raises(requests.RequestException):
+        openlibrary.lookup(SLOW)
+    assert _cached_row(f"isbn:{SLOW}") is None
+
+
+def test_lookup_isbns_sends_one_request(stub):
+    openlibrary.lookup("9780140328721")
+    isbns = ["9780140328721", "9780439064873", "9782222222222", "9783333333333"]
+    before = openlibrary.cache_stats()
+    results = openlibrary.lookup_isbns(isbns)
+    assert results["9780140328721"]["title"] == "Fantastic Mr Fox"
+    assert results["9780439064873"]["author"] == "J. K. Rowling"
+    assert results["9782222222222"] is None and results["9783333333333"] is None
+
+    # The cached ISBN is left out of the single multi-bibkey request
+    assert len(stub) == 2
+    path, query = stub[1]
+    assert path == "/api/books"
+    assert query["bibkeys"] == "ISBN:9780439064873,ISBN:9782222222222,ISBN:9783333333333"
+    assert _delta(before) == {"hits": 1, "negative_hits": 0, "misses": 3, "upstream_errors": 0}
+
+    assert openlibrary.lookup_isbns(isbns) == results
+    assert len(stub) == 2
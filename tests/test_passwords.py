@@ -0,0 +1,23 @@
+"""Password hashing on the KDF pool"""
+import threading
+
+import pytest
+
+import passwords
+
+
+def test_hashes_verify():
+    encoded = passwords.hash_password("secret")
+    assert passwords.verify("secret", encoded)
+    assert not passwords.verify("wrong", encoded)
+
+
+def test_slow_kdf_work_is_busy_not_a_timeout(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(passwords, "KDF_TIMEOUT", 0.05)
+    monkeypatch.setattr(passwords, "_derive", lambda *args: release.wait(5) and b"")
+    try:
+        with pytest.raises(passwords.Busy):
+            passwords.hash_password("secret")
+    finally:
+        release.set()
@@ -0,0 +1,155 @@
+"""Query-plan regression test for the data functions in app.py.
+
+Seeds a large throwaway database on each backend, runs every data function
+while recording the SQL it issues, and fails if any statement's plan contains
+a full table scan: a SCAN in SQLite's EXPLAIN QUERY PLAN, or a Seq Scan in
+PostgreSQL's EXPLAIN with sequential scans disabled, so that only tables no
+index can serve are scanned:
+
+    python -m pytest tests/test_query_plans.py
+"""
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+import catalog_import
+import db
+from conftest import BACKENDS, configured
+
+# Functions whose statements are allowed to scan, with the reason
+KNOWN_SCANS = {}
+
+RESOURCES = 50_000
+USERS = 5_000
+BORROWINGS = 200_000
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def seed(resources, users, borrowings):
+    """Fill the configured database with deterministic synthetic rows"""
+    rng = random.Random(42)
+    types = ["book", "journal", "audio"]
+    start = datetime(2024, 1, 1)
+    catalog_import.add_resources_bulk(({"title": f"Title {i} volume {rng.randint(1, 999)}",
+                                        "author": f"Author {rng.randint(1, 5000)}",
+                                        "resource_type": rng.choice(types), "isbn": f"978{i:010d}", "quantity": 3}
+                                       for i in range(resources)), skip_duplicates=False)
+    with db.transaction() as c:
+        # Loaded with the users and borrowings triggers and indexes suspended, as benchmarks.fixtures does
+        catalog_import.insert_suspended(
+            c, "users", "INSERT INTO users (username, password, role) VALUES (?, ?, 'student')",
+            ((f"student{i}", "x") for i in range(users)))
+
+        def loans():
+            for i in range(borrowings):
+                borrowed = start + timedelta(minutes=i)
+                status = "active" if rng.random() < 0.05 else "returned"
+                due = borrowed + timedelta(days=14)
+                yield (rng.randint(2, users + 1), rng.randint(1, resources), borrowed, due, status,
+                       int(borrowed.timestamp()), int(due.timestamp()))
+
+        catalog_import.insert_suspended(
+            c, "borrowings",
+            """INSERT INTO borrowings (user_id, resource_id, borrowed_at, due_date, status, borrowed_ts, due_ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            loans())
+        # Resource 11 is out on a loan to student1 with no copies left, so it can be held
+        c.execute("UPDATE resources SET available=0 WHERE id=11")
+        c.execute("""INSERT INTO borrowings (user_id, resource_id, borrowed_at, due_date, status, borrowed_ts, due_ts)
+                     VALUES (2, 11, ?, ?, 'active', ?, ?)""",
+                  (start, start + timedelta(days=14), int(start.timestamp()),
+                   int((start + timedelta(days=14)).timestamp())))
+
+
+def _active_loan(user_id, resource_id):
+    with db.transaction() as c:
+        c.execute("SELECT id FROM borrowings WHERE user_id=? AND resource_id=? AND status='active'",
+                  (user_id, resource_id))
+        return c.fetchone()[0]
+
+
+def workload(app):
+    """(label, callable) pairs covering every data function"""
+    return [
+        ("authenticate", lambda: app.authenticate("student7", "wrong")),
+        ("register_user", lambda: app.register_user("plan_check_user", "secret")),
+        ("add_resource", lambda: app.add_resource("Plan Check", "Nobody", "book", "123")),
+        ("search_resources", lambda: app.search_resources("title volume")),
+        ("search_resources", lambda: app.search_resources("author 12", "journal", after=5, limit=20)),
+        ("get_all_resources", lambda: app.get_all_resources(after=100, limit=20)),
+        ("get_all_resources", lambda: app.get_all_resources("audio", after=100, limit=20)),
+        ("borrow_resource", lambda: app.borrow_resource(3, 10)),
+        ("get_user_borrowings", lambda: app.get_user_borrowings(3)),
+        ("return_resource", lambda: app.return_resource(1)),
+        ("renew_resource", lambda: app.renew_resource(2, _active_loan(2, 11))),
+        ("place_hold", lambda: app.place_hold(4, 11)),
+        ("place_hold", lambda: app.place_hold(5, 11)),
+        ("get_user_holds", lambda: app.get_user_holds(4)),
+        ("cancel_hold", lambda: app.cancel_hold(5, 2)),
+        ("renew_resource", lambda: app.renew_resource(2, _active_loan(2, 11))),
+        ("return_resource", lambda: app.return_resource(_active_loan(2, 11))),
+        ("get_borrowing_history", lambda: app.get_borrowing_history(limit=50)),
+        ("get_borrowing_history", lambda: app.get_borrowing_history(status="returned", after=150000, limit=50)),
+        ("get_borrowing_history", lambda: app.get_borrowing_history(username="student7", limit=50)),
+        ("get_borrowing_history", lambda: app.get_borrowing_history(resource_ids=(5, 9), after=100, limit=50)),
+        ("get_borrowing_history", lambda: app.get_borrowing_history(start=1700000000, end=1710000000, limit=50)),
+        ("get_library_stats", lambda: app.get_library_stats()),
+        ("overdue_scanner.scan", lambda: app.overdue_scanner.scan()),
+        ("get_loan_alerts", lambda: app.get_loan_alerts()),
+    ]
+
+
+def full_scans(c, sql):
+    """Tables the plan for `sql` scans without an index"""
+    if db.dialect() == "postgresql":
+        c.execute("EXPLAIN " + sql)
+        return [m.group() for m in (SEQ_SCAN.search(row[0]) for row in c.fetchall()) if m]
+    c.execute("EXPLAIN QUERY PLAN " + sql)
+    details = [row[3] for row in c.fetchall()]
+    subqueries = {m.group(1) for m in map(SUBQUERY.match, details) if m}
+    return [d for d in details if FULL_SCAN.match(d) and FULL_SCAN.match(d).group(1) not in subqueries]
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def seeded(request, app, tmp_path_factory):
+    with configured(request, request.param, tmp_path_factory.mktemp("plans") / "plans.db", max_size=1):
+        seed(RESOURCES, USERS, BORROWINGS)
+        with db.transaction() as c:
+            c.execute("ANALYZE")
+        yield app
+
+
+def test_no_full_scans(seeded):
+    # label[0] is read when each statement runs, tagging it with the calling function
+    label = [None]
+    statements = []
+    with db.get_pool().connection() as conn:
+        conn.set_trace_callback(lambda sql: statements.append((label[0], sql)))
+    for label[0], call in workload(seeded):
+        call()
+
+    checked = 0
+    failures = []
+    with db.get_pool().connection() as conn:
+        conn.set_trace_callback(None)
+        c = conn.cursor()
+        if db.dialect() == "postgresql":
+            # The planner still scans when no index applies, but no longer just because it is cheaper
+            c.execute("SET enable_seqscan = off")
+        for name, sql in statements:
+            # Skip transaction control and the trigger bodies SQLite traces as comments
+            if sql.startswith("--") or sql.split(None, 1)[0].upper() in ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA"):
+                continue
+            checked += 1
+            scans = full_scans(c, sql)
+            if scans and name not in KNOWN_SCANS:
+                failures.append(f"{name}: {', '.join(scans)}\n    {' '.join(sql.split())}")
+        if db.dialect() == "postgresql":
+            c.execute("RESET enable_seqscan")
+    assert checked > 0
+    assert not failures, "full table scans:\n" + "\n".join(failures)
@@ -0,0 +1,64 @@
+"""Thumbnail generation from uploaded PDFs"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import db
+import thumbnails
+
+pypdfium2 = pytest.importorskip("pypdfium2")
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    document = pypdfium2.PdfDocument.new()
+    document.new_page(600, 900)
+    path = str(tmp_path / "book.pdf")
+    document.save(path)
+    document.close()
+    return path
+
+
+def test_pdf_renders_never_overlap(pdf, monkeypatch):
+    active, overlaps = [0], []
+    real = pypdfium2.PdfDocument
+
+    def document(*args, **kwargs):
+        active[0] += 1
+        if active[0] > 1:
+            overlaps.append(active[0])
+        time.sleep(0.01)
+        opened = real(*args, **kwargs)
+        close = opened.close
+
+        def closing():
+            close()
+            active[0] -= 1
+
+        opened.close = closing
+        return opened
+
+    monkeypatch.setattr(pypdfium2, "PdfDocument", document)
+    start = threading.Barrier(thumbnails.WORKERS)
+
+    def render(_):
+        start.wait()
+        return thumbnails._render_pdf(pdf).size
+
+    with ThreadPoolExecutor(max_workers=thumbnails.WORKERS) as executor:
+        sizes = list(executor.map(render, range(thumbnails.WORKERS * 3)))
+    assert overlaps == []
+    assert set(sizes) == {(240, 360)}
+
+
+def test_queued_pdf_gets_a_thumbnail(database, pdf, tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "THUMBNAILS_DIR", str(tmp_path / "thumbnails"))
+    with db.transaction() as c:
+        c.execute("""INSERT INTO resources (title, author, resource_type, quantity, available, file_path)
+                     VALUES ('Scanned', 'Author', 'book', 1, 1, ?) RETURNING id""", (pdf,))
+        resource_id = c.fetchone()[0]
+    assert thumbnails.process_pending() == (1, 0)
+    assert thumbnails.thumbnail_path(resource_id)
+    assert thumbnails.queue_status() == {"ready": 1}
@@ -0,0 +1,272 @@
+"""Small pre-generated thumbnails for resource cards.
+
+Triggers on ``resources`` queue a row in ``thumbnails`` whenever a resource
+gains a cover URL or an uploaded PDF. A background worker, started once per
+app process, downloads the cover (or renders page 1 of the PDF), shrinks it
+and writes uploads/thumbnails/<resource id>.webp, so the browse page serves a
+few KB per card instead of the full-size cover. The queue can also be drained
+from the command line:
+
+    python thumbnails.py run [--once] [--db elibrary.db]
+    python thumbnails.py status
+    python thumbnails.py requeue [--all]
+
+PDF rendering needs the optional pypdfium2 package; without it PDFs without a
+cover are marked failed and the cards fall back to no image. PDFium is not
+thread-safe, so PDF pages are rendered one at a time per process.
+"""
+import argparse
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+import db
+import file_server
+import migrations
+import openlibrary
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+THUMBNAILS_DIR = os.path.join(file_server.UPLOADS_DIR, "thumbnails")
+SIZE = (240, 360)               # twice the card width, for high-density screens
+FORMAT, EXT = ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+QUALITY = 75
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+BATCH_SIZE = 16
+WORKERS = 4
+POLL_INTERVAL = 10              # seconds between queue checks when idle
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 60                # doubled after every failed attempt
+STALE_AFTER = 600               # a 'working' row older than this was abandoned by a crashed worker
+
+_worker = None
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+# PDFium is not thread-safe, so renders take turns; cover downloads still run in parallel
+_pdfium_lock = threading.Lock()
+
+
+def _path(resource_id):
+    return os.path.join(THUMBNAILS_DIR, f"{int(resource_id)}{EXT}").replace(os.sep, "/")
+
+
+def thumbnail_path(resource_id):
+    """Local thumbnail for a resource, or None if it has not been generated yet"""
+    path = _path(resource_id)
+    return path if os.path.exists(path) else None
+
+
+def _download(url):
+    response = openlibrary.get_session().get(url, timeout=openlibrary.TIMEOUT, stream=True)
+    with response:
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > MAX_SOURCE_BYTES:
+            raise ValueError("cover image is too large")
+        data = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            data += chunk
+            if len(data) > MAX_SOURCE_BYTES:
+                raise ValueError("cover image is too large")
+    image = Image.open(io.BytesIO(data))
+    # JPEG decoders can scale down while decoding, which is much cheaper than resizing afterwards
+    image.draft("RGB", SIZE)
+    return image
+
+
+def _render_pdf(file_path):
+    if pypdfium2 is None:
+        raise RuntimeError("pypdfium2 is not installed")
+    with _pdfium_lock:
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            scale = min(SIZE[0] / width, SIZE[1] / height)
+            # Copied out of the bitmap's buffer, which PDFium frees
+            return page.render(scale=scale).to_pil().copy()
+        finally:
+            pdf.close()
+
+
+def _save(image, resource_id):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    else:
+        image = image.convert("RGB")
+    image.thumbnail(SIZE)
+
+    os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=THUMBNAILS_DIR, suffix=EXT)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, FORMAT, quality=QUALITY)
+        os.replace(tmp_path, _path(resource_id))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def generate(resource_id, cover_url, file_path):
+    """Build one resource's thumbnail from its cover URL, else page 1 of its PDF"""
+    if cover_url and cover_url.lower().startswith(("http://", "https://")):
+        image = _download(cover_url)
+    elif file_path and file_path.lower().endswith(".pdf"):
+        image = _render_pdf(file_path)
+    else:
+        raise ValueError("no cover URL or PDF to build a thumbnail from")
+    _save(image, resource_id)
+
+
+def _claim(limit):
+    """Mark up to `limit` due queue rows as being worked on and return their resources"""
+    now = time.time()
+    with db.transaction(immediate=True) as c:
+        c.execute("""UPDATE thumbnails SET status = 'working', updated_at = ?
+                     WHERE resource_id IN (SELECT resource_id FROM thumbnails
+                                           WHERE status = 'pending' AND updated_at <= ?
+                                           UNION ALL
+                                           SELECT resource_id FROM thumbnails
+                                           WHERE status = 'working' AND updated_at < ?
+                                           LIMIT ?)
+                     RETURNING resource_id""", (now, now, now - STALE_AFTER, limit))
+        ids = [row[0] for row in c.fetchall()]
+        if not ids:
+            return []
+        c.execute(f"SELECT id, cover_url, file_path FROM resources WHERE id IN ({','.join('?' * len(ids))})", ids)
+        return c.fetchall()
+
+
+def _finish(resource_id, error=None):
+    with db.transaction() as c:
+        if error is None:
+            c.execute("""UPDATE thumbnails SET status = 'ready', error = NULL, updated_at = ?
+                         WHERE resource_id = ? AND status = 'working'""", (time.time(), resource_id))
+            return
+        c.execute("SELECT attempts FROM thumbnails WHERE resource_id = ?", (resource_id,))
+        row = c.fetchone()
+        attempts = (row[0] if row else 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            status, due = "failed", time.time()
+        else:
+            status, due = "pending", time.time() + RETRY_DELAY * 2 ** (attempts - 1)
+        # A row re-queued by an edit meanwhile is left alone
+        c.execute("""UPDATE thumbnails SET status = ?, attempts = ?, error = ?, updated_at = ?
+                     WHERE resource_id = ? AND status = 'working'""",
+                  (status, attempts, str(error)[:500], due, resource_id))
+
+
+def _process(row):
+    resource_id, cover_url, file_path = row
+    try:
+        generate(resource_id, cover_url, file_path)
+    except Exception as e:
+        _finish(resource_id, e)
+        return False
+    _finish(resource_id)
+    return True
+
+
+def process_pending(batch_size=BATCH_SIZE, workers=WORKERS):
+    """Generate thumbnails for every due queue row; returns (generated, failed)"""
+    generated = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            rows = _claim(batch_size)
+            if not rows:
+                break
+            for ok in executor.map(_process, rows):
+                if ok:
+                    generated += 1
+                else:
+                    failed += 1
+    return generated, failed
+
+
+def _run():
+    while True:
+        try:
+            process_pending()
+        except Exception:
+            # e.g. the database is briefly locked; try again on the next tick
+            pass
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+
+
+def start():
+    """Start the background thumbnail worker once per process"""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                worker = threading.Thread(target=_run, name="thumbnails", daemon=True)
+                worker.start()
+                _worker = worker
+
+
+def wake():
+    """Ask the background worker to check the queue now instead of at its next tick"""
+    _wake.set()
+
+
+def queue_status():
+    """{status: count} over the thumbnail queue"""
+    with db.transaction() as c:
+        c.execute("SELECT status, COUNT(*) FROM thumbnails GROUP BY status")
+        return dict(c.fetchall())
+
+
+def requeue(include_ready=False):
+    """Put failed (and with include_ready, all) thumbnails back in the queue; returns the row count"""
+    with db.transaction() as c:
+        c.execute(f"""UPDATE thumbnails SET status = 'pending', attempts = 0, error = NULL, updated_at = 0
+                      WHERE status {"<> 'pending'" if include_ready else "= 'failed'"}""")
+        return c.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resource thumbnail pipeline")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database path or postgresql:// URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="generate queued thumbnails")
+    run_parser.add_argument("--once", action="store_true", help="drain the queue and exit instead of polling")
+    run_parser.add_argument("--workers", type=int, default=WORKERS)
+    sub.add_parser("status", help="show queue counts")
+    requeue_parser = sub.add_parser("requeue", help="retry failed thumbnails")
+    requeue_parser.add_argument("--all", action="store_true", help="regenerate every thumbnail")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate()
+    if args.command == "status":
+        for status, count in sorted(queue_status().items()):
+            print(f"{status}: {count}")
+    elif args.command == "requeue":
+        print(f"Requeued {requeue(args.all)} thumbnails")
+    else:
+        while True:
+            started = time.perf_counter()
+            generated, failed = process_pending(workers=args.workers)
+            if generated or failed:
+                print(f"Generated {generated} thumbnails, {failed} failed "
+                      f"in {time.perf_counter() - started:.1f}s")
+            if args.once:
+                break
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()